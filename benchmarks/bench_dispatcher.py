@@ -0,0 +1,76 @@
+"""
+Micro-benchmark: compiled CommandDispatcher vs the previous chain of
+``any(message.startswith(...))`` checks in TyScrapBotHandler.handle_text.
+
+    python -m benchmarks.bench_dispatcher [machines]
+"""
+
+import sys
+import timeit
+
+from handlers.command_dispatcher import Command, CommandDispatcher
+
+
+def legacy_parse(message, machine_config):
+    """
+    The dispatch chain handle_text used before CommandDispatcher.
+    """
+    if message in ["!", "！"]:
+        return Command.MENU, None
+    elif message in ["!最新影像", "!最新影像五張", "!自訂時間影像"]:
+        return Command.CHOOSE_MACHINE, None
+    elif any(message.startswith(f"({key})自訂") for key in machine_config):
+        command = Command.DATE_MENU
+    elif any(message.startswith(f"!({key})影像:") for key in machine_config):
+        command = Command.TIME_MENU
+    elif any(message.startswith(f"!({key})搜尋:") for key in machine_config):
+        command = Command.IMAGE_MENU
+    elif any(message.startswith(f"({key})最新") for key in machine_config):
+        command = Command.LATEST_IMAGE
+    elif any(message.startswith(f"({key})時間") for key in machine_config):
+        command = Command.IMAGE
+    else:
+        return None
+    for key in machine_config:
+        if message.lstrip("!").startswith(f"({key})"):
+            return command, key
+
+
+def make_machines(count: int):
+    return {f"軋{i}": {} for i in range(1, count + 1)}
+
+
+def make_messages(machines):
+    last = list(machines)[-1]
+    return [
+        "!",
+        "!最新影像",
+        f"({last})自訂時間影像",
+        f"!({last})影像:20241023",
+        f"!({last})搜尋:20241023_10",
+        f"({last})最新影像五張",
+        f"({last})時間:2024-10-23_10_01_21_63_900_D25.png",
+        "hello",
+    ]
+
+
+def main(machines: int = 40, number: int = 20_000):
+    machine_config = make_machines(machines)
+    messages = make_messages(machine_config)
+    dispatcher = CommandDispatcher(machine_config)
+
+    legacy = timeit.timeit(
+        lambda: [legacy_parse(m, machine_config) for m in messages], number=number
+    )
+    compiled = timeit.timeit(
+        lambda: [dispatcher.parse(m) for m in messages], number=number
+    )
+    per_message = number * len(messages)
+    print(f"machines: {machines}, messages: {per_message}")
+    print(f"{'legacy chain':>16}: {legacy / per_message * 1e6:8.2f} us/message")
+    print(f"{'compiled':>16}: {compiled / per_message * 1e6:8.2f} us/message")
+    print(f"{'speedup':>16}: {legacy / compiled:8.1f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 40)
@@ -0,0 +1,73 @@
+"""
+Micro-benchmark: streaming href extractor vs BeautifulSoup html.parser on a
+synthetic nginx autoindex page.
+
+    python -m benchmarks.bench_index_parser [entries]
+"""
+
+import sys
+import timeit
+
+from bs4 import BeautifulSoup
+
+from utils.index_parser import iter_hrefs
+
+CHUNK_SIZE = 64 * 1024
+
+
+def make_index_page(entries: int = 10_000) -> bytes:
+    """
+    Builds an nginx-style autoindex page of hourly PNG files.
+    """
+    rows = ['<a href="../">../</a>']
+    for i in range(entries):
+        name = (
+            f"2024-10-23_10_{i // 600:02d}_{i // 10 % 60:02d}_{i % 100:02d}_900_D25.png"
+        )
+        rows.append(
+            f'<a href="{name}">{name}</a>{" " * 20}23-Oct-2024 10:{i % 60:02d}  1048576'
+        )
+    body = "\n".join(rows)
+    return (
+        "<html>\r\n<head><title>Index of /rl1/20241023_10/</title></head>\r\n"
+        "<body>\r\n<h1>Index of /rl1/20241023_10/</h1><hr><pre>"
+        f"{body}\r\n</pre><hr></body>\r\n</html>\r\n"
+    ).encode()
+
+
+def chunked(data: bytes, size: int = CHUNK_SIZE):
+    for i in range(0, len(data), size):
+        yield data[i : i + size]  # noqa E203
+
+
+def parse_with_bs4(data: bytes):
+    soup = BeautifulSoup(data.decode(), "html.parser")
+    return [
+        link.get("href")
+        for link in soup.find_all("a")
+        if link.get("href", "").endswith(".png")
+    ]
+
+
+def parse_streaming(data: bytes):
+    return list(iter_hrefs(chunked(data), (".png",)))
+
+
+def main(entries: int = 10_000, repeat: int = 5):
+    data = make_index_page(entries)
+    assert parse_with_bs4(data) == parse_streaming(data)
+
+    print(f"index page: {entries} entries, {len(data) / 1024:.0f} KiB")
+    results = {}
+    for name, func in (
+        ("bs4 html.parser", parse_with_bs4),
+        ("streaming", parse_streaming),
+    ):
+        best = min(timeit.repeat(lambda: func(data), number=1, repeat=repeat))
+        results[name] = best
+        print(f"{name:>16}: {best * 1000:8.2f} ms")
+    print(f"{'speedup':>16}: {results['bs4 html.parser'] / results['streaming']:8.1f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
@@ -0,0 +1,132 @@
+"""
+Micro-benchmark: CPU per /notify request with the previous handling (stdlib
+JSON both ways, body re-parsed with ``await request.json()`` and formatted
+into an f-string log line) vs orjson routes and responses with lazy logging.
+
+    python -m benchmarks.bench_json [--requests 5000] [--log-level INFO]
+
+Requests are sent straight to the ASGI apps, so only the app's own work is
+measured.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import logging
+import time
+
+from fastapi import APIRouter, FastAPI, Request
+from fastapi.responses import JSONResponse, ORJSONResponse
+from pydantic import BaseModel
+
+from utils.orjson_route import ORJSONRoute
+
+
+class Notification(BaseModel):
+    message: str
+    image_filename: str
+
+
+def make_logger(level: str) -> logging.Logger:
+    logger = logging.getLogger("bench_json")
+    logger.handlers = [logging.StreamHandler(io.StringIO())]
+    logger.setLevel(level)
+    logger.propagate = False
+    return logger
+
+
+def legacy_app(logger) -> FastAPI:
+    app = FastAPI(default_response_class=JSONResponse)
+
+    @app.post("/notify", status_code=202)
+    async def notify(request: Request, body: Notification):
+        logger.info(f"Received request: {await request.json()}")
+        return {"status": "accepted", "message": "Notification queued"}
+
+    return app
+
+
+def orjson_app(logger) -> FastAPI:
+    app = FastAPI(default_response_class=ORJSONResponse)
+    router = APIRouter(route_class=ORJSONRoute)
+
+    @router.post("/notify", status_code=202)
+    async def notify(request: Request, body: Notification):
+        logger.info(
+            "Received notification: %s", body, extra={"notification": body.model_dump()}
+        )
+        return {"status": "accepted", "message": "Notification queued"}
+
+    app.include_router(router)
+    return app
+
+
+async def call(app, body: bytes):
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/notify",
+        "raw_path": b"/notify",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"content-type", b"application/json")],
+        "client": ("127.0.0.1", 1234),
+        "server": ("bench", 80),
+    }
+    received = False
+    status = None
+
+    async def receive():
+        nonlocal received
+        if received:
+            return {"type": "http.disconnect"}
+        received = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    assert status == 202, status
+
+
+async def measure(app, body: bytes, requests: int) -> float:
+    for _ in range(200):
+        await call(app, body)
+    start = time.process_time()
+    for _ in range(requests):
+        await call(app, body)
+    return (time.process_time() - start) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--log-level", default="INFO")
+    args = parser.parse_args()
+    logger = make_logger(args.log_level)
+
+    bodies = {
+        "typical": {"message": "Spark detected", "image_filename": "a.png"},
+        "4 KB message": {"message": "火花偵測 " * 700, "image_filename": "a.png"},
+    }
+    print(f"requests: {args.requests}, log level: {args.log_level}")
+    for name, payload in bodies.items():
+        body = json.dumps(payload, ensure_ascii=False).encode()
+        legacy = asyncio.run(measure(legacy_app(logger), body, args.requests))
+        fast = asyncio.run(measure(orjson_app(logger), body, args.requests))
+        print(
+            f"{name:>14}: legacy {legacy * 1e6:7.1f} us/req"
+            f"  orjson {fast * 1e6:7.1f} us/req"
+            f"  saved {(legacy - fast) * 1e6:6.1f} us ({1 - fast / legacy:.0%})"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+"""
+Offline load test: runs main:app in-process against local fake LINE, ntfy
+and image servers, fires signed webhook events and /notify bursts, and
+reports throughput, latency percentiles and error rates per scenario.
+
+    python -m benchmarks.bench_load [--requests 1000] [--concurrency 50]
+        [--line-latency 0.05] [--line-429-rate 0.02] [--listing-size 3000]
+
+The app and the load generator share one event loop (httpx ASGITransport),
+so absolute req/s are a lower bound; compare runs on the same machine.
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import os
+import tempfile
+import time
+import uuid
+
+import httpx
+import yaml
+
+from benchmarks.fake_servers import FakeImageServer, FakeLine, FakeNtfy
+
+PUSHBOT_URL = "/webhooks/pushbot"
+TY_SCRAP_URL = "/webhooks/ty_scrap"
+PUSHBOT_SECRET = "bench-pushbot-secret"
+TY_SCRAP_SECRET = "bench-ty-scrap-secret"
+
+_NOTIFY_ROUTES = [
+    ("spark_detection", {"message": "Spark detected", "image_filename": "a.png"}),
+    ("dust_detection_150", {"message": "Dust detected", "image_filename": "b.png"}),
+    ("water_spray", {"message": "Water spray", "image_filename": "c.png"}),
+    ("pose_detection", {"message": "Pose alert"}),
+    ("ty_scrap", {"rolling_line": "1", "message": "Scrap", "image_path": "d.png"}),
+]
+
+
+# Items per /notify/batch request in the "notify batch" scenario
+BATCH_SIZE = 10
+
+
+def batch_notifications(i: int):
+    items = []
+    for j in range(BATCH_SIZE):
+        route, body = _NOTIFY_ROUTES[(i * BATCH_SIZE + j) % len(_NOTIFY_ROUTES)]
+        channel = "dust_detection" if route == "dust_detection_150" else route
+        items.append({"channel": channel, **body})
+    return items
+
+
+def prepare_environment(line, ntfy, images, workdir):
+    """
+    Points a copy of config/config.yaml at the fake servers and fills in the
+    environment variables the routers read at import time.
+    """
+    with open("config/config.yaml", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+
+    config["LINE"] = {"API_HOST": line.url}
+    config["NTFY"] = {"BASE_URL": ntfy.url}
+    config["LAST_IMAGES_ENDPOINTS"] = {}
+    for machine in config["MACHINES"].values():
+        name = machine["machine"]
+        machine["url"] = f"{images.url}/images/{name}/"
+        config["LAST_IMAGES_ENDPOINTS"][name] = f"{images.url}/last5/{name}"
+    config["SPOOL"]["PATH"] = os.path.join(workdir, "notifications.db")
+    config["RATE_LIMIT"] = {"ENABLED": False, "STORAGE_URI": "memory://"}
+    config["WEBHOOK_DEDUP"]["STORAGE_URI"] = "memory://"
+    config["DEDUP"]["WINDOW"] = 0
+
+    path = os.path.join(workdir, "config.yaml")
+    with open(path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(config, f, allow_unicode=True)
+    os.environ["CONFIG_PATH"] = path
+
+    defaults = {
+        "WEBHOOKS_URL_PUSHBOT": PUSHBOT_URL,
+        "WEBHOOKS_URL_TY_SCRAP": TY_SCRAP_URL,
+        "LINE_CHANNEL_SECRET_PUSHBOT": PUSHBOT_SECRET,
+        "LINE_CHANNEL_SECRET_TY_SCRAP": TY_SCRAP_SECRET,
+        "LINE_CHANNEL_ACCESS_TOKEN_PUSHBOT": "bench-pushbot-token",
+        "LINE_CHANNEL_ACCESS_TOKEN_TY_SCRAP": "bench-ty-scrap-token",
+    }
+    for project in (
+        "SCRAP",
+        "WATER_SPRAY",
+        "SPARK_DETECTION",
+        "DUST_DETECTION",
+        "POSE_DETECTION",
+    ):
+        defaults[f"GROUP_ID_PUSHBOT_TY_{project}"] = f"C{project.lower()}"
+        defaults[f"NTFY_TY_{project}"] = project.lower()
+    os.environ.update(defaults)
+    os.makedirs("logs", exist_ok=True)
+    return config
+
+
+def sign(secret: str, body: str) -> str:
+    digest = hmac.new(secret.encode(), body.encode(), hashlib.sha256).digest()
+    return base64.b64encode(digest).decode()
+
+
+def text_event(text: str, user_id: str, group_id: str = None) -> dict:
+    source = {"type": "user", "userId": user_id}
+    if group_id is not None:
+        source = {"type": "group", "groupId": group_id, "userId": user_id}
+    return {
+        "type": "message",
+        "mode": "active",
+        "timestamp": int(time.time() * 1000),
+        "source": source,
+        "webhookEventId": uuid.uuid4().hex,
+        "deliveryContext": {"isRedelivery": False},
+        "replyToken": uuid.uuid4().hex,
+        "message": {"id": "1", "type": "text", "quoteToken": "q", "text": text},
+    }
+
+
+def webhook_request(path: str, secret: str, events):
+    body = json.dumps({"destination": "Ubench", "events": events})
+    headers = {
+        "Content-Type": "application/json",
+        "X-Line-Signature": sign(secret, body),
+    }
+    return "POST", path, {"content": body, "headers": headers}
+
+
+def ty_scrap_messages(config, images):
+    machine = next(iter(config["MACHINES"]))
+    date, _ = images.folders[-1].split("_")
+    return [
+        "!",
+        "!最新影像",
+        f"({machine})自訂時間影像",
+        f"!({machine})影像:{date}",
+        f"!({machine})搜尋:{images.folders[-1]}",
+        f"({machine})最新影像",
+    ]
+
+
+def percentile(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+async def drive(client, make_request, total: int, concurrency: int):
+    """
+    Sends ``total`` requests with ``concurrency`` in flight; returns the
+    (latency, status) of each and the wall time.
+    """
+    results = []
+    counter = iter(range(total))
+
+    async def worker():
+        for i in counter:
+            method, path, kwargs = make_request(i)
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, **kwargs)
+                status = response.status_code
+            except httpx.HTTPError:
+                status = 0
+            results.append((time.perf_counter() - start, status))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return results, time.perf_counter() - start
+
+
+def report(name: str, results, elapsed: float):
+    latencies = sorted(latency for latency, _ in results)
+    errors = sum(1 for _, status in results if status == 0 or status >= 400)
+    print(
+        f"{name:>18}: {len(results) / elapsed:8.1f} req/s"
+        f"  p50 {percentile(latencies, 0.50) * 1e3:7.2f} ms"
+        f"  p95 {percentile(latencies, 0.95) * 1e3:7.2f} ms"
+        f"  p99 {percentile(latencies, 0.99) * 1e3:7.2f} ms"
+        f"  errors {errors / len(results):6.2%}"
+    )
+
+
+async def wait_until(predicate, timeout: float) -> float:
+    start = time.perf_counter()
+    while not await predicate() and time.perf_counter() - start < timeout:
+        await asyncio.sleep(0.05)
+    return time.perf_counter() - start
+
+
+async def run(args, config, line, ntfy, images):
+    from main import app
+    from routers import ths_bot, ty_scrap
+
+    messages = ty_scrap_messages(config, images)
+    scenarios = {
+        "notify": lambda i: (
+            "POST",
+            f"{PUSHBOT_URL}/notify/{_NOTIFY_ROUTES[i % len(_NOTIFY_ROUTES)][0]}",
+            {"json": _NOTIFY_ROUTES[i % len(_NOTIFY_ROUTES)][1]},
+        ),
+        f"notify batch x{BATCH_SIZE}": lambda i: (
+            "POST",
+            f"{PUSHBOT_URL}/notify/batch",
+            {"json": {"notifications": batch_notifications(i)}},
+        ),
+        "pushbot webhook": lambda i: webhook_request(
+            f"{PUSHBOT_URL}/line",
+            PUSHBOT_SECRET,
+            [text_event("(系統測試，請忽略)", f"U{i % 100}", f"C{i % 10}")],
+        ),
+        "ty_scrap webhook": lambda i: webhook_request(
+            f"{TY_SCRAP_URL}/line",
+            TY_SCRAP_SECRET,
+            [text_event(messages[i % len(messages)], f"U{i % 100}")],
+        ),
+        "metrics": lambda i: ("GET", "/metrics", {}),
+    }
+
+    async with app.router.lifespan_context(app):
+
+        async def indexed():
+            return all(ty_scrap.image_indexer.get(key) for key in config["MACHINES"])
+
+        index_time = await wait_until(indexed, args.drain_timeout)
+        print(f"{'image index ready':>18}: {index_time:8.2f} s")
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench"
+        ) as client:
+            for name, make_request in scenarios.items():
+                results, elapsed = await drive(
+                    client, make_request, args.requests, args.concurrency
+                )
+                report(name, results, elapsed)
+
+            async def drained():
+                spool_depth = await asyncio.to_thread(ths_bot.spool.depth)
+                return spool_depth == 0 and ty_scrap.event_executor.depth == 0
+
+            drain = await wait_until(drained, args.drain_timeout)
+
+    print(f"{'drained after':>18}: {drain:8.2f} s")
+    print(f"{'fake LINE':>18}: {dict(line.requests)}")
+    print(f"{'fake ntfy':>18}: {dict(ntfy.requests)}")
+    print(f"{'fake images':>18}: {dict(images.requests)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--line-latency", type=float, default=0.05)
+    parser.add_argument("--line-429-rate", type=float, default=0.0)
+    parser.add_argument("--line-retry-after", type=int, default=1)
+    parser.add_argument("--ntfy-latency", type=float, default=0.02)
+    parser.add_argument("--listing-folders", type=int, default=48)
+    parser.add_argument("--listing-size", type=int, default=3000)
+    parser.add_argument("--drain-timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    line = FakeLine(args.line_latency, args.line_429_rate, args.line_retry_after)
+    ntfy = FakeNtfy(args.ntfy_latency)
+    images = FakeImageServer(
+        folders=args.listing_folders, images_per_folder=args.listing_size
+    )
+    servers = [line.start(), ntfy.start(), images.start()]
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            config = prepare_environment(line, ntfy, images, workdir)
+            print(
+                f"requests: {args.requests} per scenario, "
+                f"concurrency: {args.concurrency}, "
+                f"LINE latency: {args.line_latency * 1e3:.0f} ms, "
+                f"LINE 429 rate: {args.line_429_rate:.0%}"
+            )
+            asyncio.run(run(args, config, line, ntfy, images))
+    finally:
+        for server in servers:
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Local stand-ins for the services the bot talks to, for offline load tests:
+
+- ``FakeLine``: Messaging API push/reply/loading endpoints with configurable
+  latency and a share of 429 responses carrying Retry-After
+- ``FakeNtfy``: accepts any publish
+- ``FakeImageServer``: nginx-style directory indexes of date_hour folders
+  with large PNG listings, plus ``get_last_5_images`` per machine
+
+Each server runs an aiohttp application on its own event loop thread.
+"""
+
+import asyncio
+import json
+import random
+import socket
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+
+from aiohttp import web
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class FakeServer:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.port = free_port()
+        self.requests = Counter()
+        self._loop = None
+        self._runner = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def routes(self, app: web.Application):
+        raise NotImplementedError
+
+    async def _delay(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def start(self):
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            app = web.Application()
+            self.routes(app)
+            self._runner = web.AppRunner(app, access_log=None)
+            self._loop.run_until_complete(self._runner.setup())
+            site = web.TCPSite(self._runner, "127.0.0.1", self.port)
+            self._loop.run_until_complete(site.start())
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop(self):
+        future = asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop)
+        future.result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+class FakeLine(FakeServer):
+    def __init__(
+        self, latency: float = 0.05, throttle_rate: float = 0.0, retry_after: int = 1
+    ):
+        super().__init__(latency)
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+
+    def routes(self, app):
+        app.router.add_post("/v2/bot/message/push", self._message)
+        app.router.add_post("/v2/bot/message/reply", self._message)
+        app.router.add_post("/v2/bot/chat/loading/start", self._loading)
+
+    def _throttled(self):
+        if self.throttle_rate and random.random() < self.throttle_rate:
+            return web.json_response(
+                {"message": "The API rate limit has been exceeded."},
+                status=429,
+                headers={"Retry-After": str(self.retry_after)},
+            )
+        return None
+
+    async def _message(self, request):
+        await self._delay()
+        throttled = self._throttled()
+        if throttled is not None:
+            self.requests["throttled"] += 1
+            return throttled
+        body = await request.json()
+        self.requests[request.path.rsplit("/", 1)[-1]] += 1
+        self.requests["messages"] += len(body.get("messages", []))
+        sent = [{"id": str(i), "quoteToken": "q"} for i in range(len(body["messages"]))]
+        return web.json_response({"sentMessages": sent})
+
+    async def _loading(self, request):
+        await self._delay()
+        self.requests["loading"] += 1
+        return web.json_response({}, status=202)
+
+
+class FakeNtfy(FakeServer):
+    def routes(self, app):
+        app.router.add_post("/{topic}", self._publish)
+
+    async def _publish(self, request):
+        await self._delay()
+        await request.read()
+        self.requests["publish"] += 1
+        return web.json_response({"id": "bench", "event": "message"})
+
+
+class FakeImageServer(FakeServer):
+    """
+    ``/images/{machine}/`` lists ``folders`` hourly folders ending now; each
+    folder lists ``images_per_folder`` PNGs.
+    """
+
+    def __init__(
+        self, latency: float = 0.0, folders: int = 48, images_per_folder: int = 3000
+    ):
+        super().__init__(latency)
+        now = datetime.now().replace(minute=0, second=0, microsecond=0)
+        self.folders = [
+            (now - timedelta(hours=h)).strftime("%Y%m%d_%H")
+            for h in reversed(range(folders))
+        ]
+        self._root_page = self._index(f"{f}/" for f in self.folders)
+        self._folder_pages = {}
+        self.images_per_folder = images_per_folder
+
+    @staticmethod
+    def _index(names) -> bytes:
+        rows = ['<html><body><pre><a href="../">../</a>']
+        rows.extend(
+            f'<a href="{n}">{n}</a>    01-Jan-2025 00:00    1048576' for n in names
+        )
+        rows.append("</pre></body></html>")
+        return "\n".join(rows).encode()
+
+    def _images(self, folder: str):
+        date, hour = folder.split("_")
+        day = f"{date[:4]}-{date[4:6]}-{date[6:]}"
+        for i in range(self.images_per_folder):
+            seconds = i * 3600 // self.images_per_folder
+            yield (
+                f"{day}_{hour}_{seconds // 60:02d}_{seconds % 60:02d}_{i % 100:02d}"
+                "_900_D25.png"
+            )
+
+    def routes(self, app):
+        app.router.add_get("/images/{machine}/", self._root)
+        app.router.add_get("/images/{machine}/{folder}/", self._folder)
+        app.router.add_get("/last5/{machine}", self._last5)
+
+    async def _root(self, request):
+        await self._delay()
+        self.requests["listing"] += 1
+        return web.Response(body=self._root_page, content_type="text/html")
+
+    async def _folder(self, request):
+        await self._delay()
+        folder = request.match_info["folder"]
+        page = self._folder_pages.get(folder)
+        if page is None:
+            page = self._folder_pages[folder] = self._index(self._images(folder))
+        self.requests["listing"] += 1
+        return web.Response(body=page, content_type="text/html")
+
+    async def _last5(self, request):
+        await self._delay()
+        self.requests["last5"] += 1
+        folder = self.folders[-1]
+        names = list(self._images(folder))[-5:][::-1]
+        data = [{"path": f"/static/images/{folder}/{name}"} for name in names]
+        return web.Response(text=json.dumps(data), content_type="application/json")
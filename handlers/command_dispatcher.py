@@ -0,0 +1,71 @@
+import re
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+
+class Command:
+    MENU = "menu"
+    CHOOSE_MACHINE = "choose_machine"
+    DATE_MENU = "date_menu"
+    TIME_MENU = "time_menu"
+    IMAGE_MENU = "image_menu"
+    LATEST_IMAGE = "latest_image"
+    IMAGE = "image"
+
+
+@dataclass(frozen=True)
+class ParsedCommand:
+    command: str
+    machine: Optional[str] = None
+    argument: str = ""
+
+
+# Messages that are a whole command on their own
+_STATIC_COMMANDS = {
+    "!": Command.MENU,
+    "！": Command.MENU,
+    "!最新影像": Command.CHOOSE_MACHINE,
+    "!最新影像五張": Command.CHOOSE_MACHINE,
+    "!自訂時間影像": Command.CHOOSE_MACHINE,
+}
+
+# (leading "!", keyword after "(machine)") -> command
+_MACHINE_COMMANDS = {
+    ("", "自訂"): Command.DATE_MENU,
+    ("!", "影像:"): Command.TIME_MENU,
+    ("!", "搜尋:"): Command.IMAGE_MENU,
+    ("", "最新"): Command.LATEST_IMAGE,
+    ("", "時間"): Command.IMAGE,
+}
+
+
+class CommandDispatcher:
+    """
+    Maps a TyScrap chat message to (command, machine, argument) in one pass.
+
+    Machine commands look like ``!(軋一)影像:20241023``; the pattern is
+    compiled once from the MACHINES keys, so matching cost does not grow with
+    the number of machines.
+    """
+
+    def __init__(self, machines: Iterable[str]):
+        keys = sorted(machines, key=len, reverse=True)
+        keywords = sorted({k for _, k in _MACHINE_COMMANDS}, key=len, reverse=True)
+        self._pattern = re.compile(
+            r"(?P<bang>!?)\((?P<machine>%s)\)(?P<keyword>%s)(?P<argument>.*)"
+            % ("|".join(map(re.escape, keys)), "|".join(map(re.escape, keywords))),
+            re.DOTALL,
+        )
+
+    def parse(self, message: str) -> Optional[ParsedCommand]:
+        command = _STATIC_COMMANDS.get(message)
+        if command is not None:
+            return ParsedCommand(command)
+
+        match = self._pattern.match(message)
+        if match is None:
+            return None
+        command = _MACHINE_COMMANDS.get((match["bang"], match["keyword"]))
+        if command is None:
+            return None
+        return ParsedCommand(command, match["machine"], match["argument"])
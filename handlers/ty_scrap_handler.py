@@ -1,9 +1,12 @@
+import threading
 import traceback
 import pytz
 import os
+from collections import OrderedDict
 from datetime import datetime, timedelta
 
 from linebot.v3.messaging import (
+    PushMessageRequest,
     ReplyMessageRequest,
     TextMessage,
     ImageMessage,
@@ -19,33 +22,124 @@ from linebot.v3.messaging import (
     StickerMessage,
 )
 
+from handlers.command_dispatcher import Command, CommandDispatcher
 from utils.fetch_url import fetch_folder_links, fetch_image_names, fetch_last_5_images
 from utils.factory import setup_logger, load_config
+from utils.image_index import dedupe_by_minute
+from utils.line_governor import governor_for
+from utils.media import preview_url
+
+_MENU_THUMBNAIL_URL = "https://doqvf81n9htmm.cloudfront.net/data/crop_article/118966/shutterstock_1122707477.jpg_1140x855.jpg"  # noqa E501
+_MENU_ACTIONS = [
+    ("最新影像", "!最新影像"),
+    ("最新影像五張", "!最新影像五張"),
+    ("自訂時間區間", "!自訂時間影像"),
+]
+_CAROUSEL_CACHE_SIZE = 256
 
 
 class TyScrapBotHandler:
-    def __init__(self, messaging_api):
+    def __init__(self, messaging_api, image_indexer=None, governor=None):
         self.messaging_api = messaging_api
+        self.governor = governor or governor_for(messaging_api, "ty_scrap")
+        self.image_indexer = image_indexer
         self.config = load_config()
         self.machine_config = self.config["MACHINES"]
+        self.dispatcher = CommandDispatcher(self.machine_config)
         self.logger = setup_logger(__name__)
 
-    def _get_machine_info(self, message):
-        for key, value in self.machine_config.items():
-            if message.startswith(f"({key})"):
-                return key, value
-        return None, None
+        # Static menus never change, so they are serialized once
+        self._menu_payload = [self._menu_message().to_dict()]
+        self._choice_machine_payloads = {
+            text: [self._choice_machine(text).to_dict()] for _, text in _MENU_ACTIONS
+        }
+        self._carousel_lock = threading.Lock()
+        self._carousel_cache = OrderedDict()
+        self.carousel_hits = 0
+        self.carousel_misses = 0
+
+    def _get_index(self, key):
+        if self.image_indexer is None:
+            return None
+        return self.image_indexer.get(key)
+
+    def _list_dates(self, key, url):
+        index = self._get_index(key)
+        if index is not None:
+            return index.dates()
+        folder_links = [link.split("_")[0] for link in fetch_folder_links(url)[1:]]
+        return sorted(set(folder_links))
+
+    def _list_hours(self, key, url, date):
+        index = self._get_index(key)
+        if index is not None:
+            return index.hours(date)
+        return [
+            link.split("/")[0]
+            for link in fetch_folder_links(url)[1:]
+            if link.startswith(date)
+        ]
+
+    def _list_images(self, key, url, hour):
+        index = self._get_index(key)
+        images = index.images(hour) if index is not None else None
+        if images is not None:
+            return images
+        directory_url = os.path.join(url, hour + "/")
+        return dedupe_by_minute(fetch_image_names(directory_url)[1:])
+
+    def carousel_stats(self):
+        return {"hits": self.carousel_hits, "misses": self.carousel_misses}
 
     def _send_reply(self, reply_token, messages, event_message=None):
         try:
-            self.messaging_api.reply_message(
-                ReplyMessageRequest(reply_token=reply_token, messages=messages)
+            self.governor.call(
+                self.messaging_api.reply_message,
+                ReplyMessageRequest(reply_token=reply_token, messages=messages),
+                target="line_reply",
+            )
+            return event_message or "OK"
+        except Exception as e:
+            return f"Error sending message: {str(e)}"
+
+    def _send_payload(self, reply_token, messages, event_message=None):
+        """
+        Replies with already serialized messages, skipping model validation.
+        """
+        try:
+            self.governor.call(
+                self.messaging_api.api_client.call_api,
+                "/v2/bot/message/reply",
+                "POST",
+                header_params={
+                    "Accept": "application/json",
+                    "Content-Type": "application/json",
+                },
+                body={"replyToken": reply_token, "messages": messages},
+                response_types_map={},
+                auth_settings=["Bearer"],
+                target="line_reply",
             )
             return event_message or "OK"
         except Exception as e:
             return f"Error sending message: {str(e)}"
 
-    def _choice_machine(self, message, reply_token):
+    @staticmethod
+    def _menu_message():
+        return TemplateMessage(
+            alt_text="功能選單",
+            template=ButtonsTemplate(
+                thumbnail_image_url=_MENU_THUMBNAIL_URL,
+                title="鋼筋影像",
+                text="功能選單",
+                actions=[
+                    MessageAction(label=label, text=text)
+                    for label, text in _MENU_ACTIONS
+                ],
+            ),
+        )
+
+    def _choice_machine(self, message):
         buttons = [
             FlexButton(
                 style="primary" if idx == 0 else "secondary",
@@ -56,29 +150,19 @@ class TyScrapBotHandler:
         bubble = FlexBubble(
             body=FlexBox(layout="vertical", spacing="md", contents=buttons)
         )
-        return ReplyMessageRequest(
-            reply_token=reply_token,
-            messages=[FlexMessage(alt_text="機器選擇", contents=bubble)],
-        )
-
-    def _create_date_menu(self, message, reply_token):
-        key, info = self._get_machine_info(message)
-        if not info:
-            return
-
-        url, name = info["url"], info["name_image"]
-        folder_links = [link.split("_")[0] for link in fetch_folder_links(url)[1:]]
-        folder_links_date = sorted(set(folder_links))
+        return FlexMessage(alt_text="機器選擇", contents=bubble)
 
+    @staticmethod
+    def _build_carousel(alt_text, actions):
         bubbles = []
-        for i in range(0, len(folder_links_date), 10):
+        for i in range(0, len(actions), 10):
             buttons = [
                 FlexButton(
                     style="link",
                     height="sm",
-                    action=MessageAction(label=link, text=name + link),
+                    action=MessageAction(label=label, text=text),
                 )
-                for link in folder_links_date[i : i + 10]   # noqa E203
+                for label, text in actions[i : i + 10]  # noqa E203
             ]
             bubbles.append(
                 FlexBubble(
@@ -87,101 +171,69 @@ class TyScrapBotHandler:
                     )
                 )
             )
-
-        return ReplyMessageRequest(
-            reply_token=reply_token,
-            messages=[
-                FlexMessage(
-                    alt_text="日期選擇", contents=FlexCarousel(contents=bubbles)
-                )
-            ],
+        return FlexMessage(alt_text=alt_text, contents=FlexCarousel(contents=bubbles))
+
+    def _carousel_payload(self, key, level, argument, alt_text, list_actions):
+        """
+        Serialized carousel memoized by (machine, menu level, argument, listed
+        entries). Listing from the image index is cheap; keying on what it
+        returns, rather than on the index version, keeps a menu cached while
+        other folders of the machine change.
+        """
+        actions = list_actions()
+        cache_key = (key, level, argument, tuple(actions))
+        with self._carousel_lock:
+            payload = self._carousel_cache.get(cache_key)
+            if payload is not None:
+                self._carousel_cache.move_to_end(cache_key)
+                self.carousel_hits += 1
+                return payload
+
+        payload = [self._build_carousel(alt_text, actions).to_dict()]
+        with self._carousel_lock:
+            self.carousel_misses += 1
+            self._carousel_cache[cache_key] = payload
+            while len(self._carousel_cache) > _CAROUSEL_CACHE_SIZE:
+                self._carousel_cache.popitem(last=False)
+        return payload
+
+    def _create_date_menu(self, key):
+        info = self.machine_config[key]
+        url, name = info["url"], info["name_image"]
+        return self._carousel_payload(
+            key,
+            Command.DATE_MENU,
+            "",
+            "日期選擇",
+            lambda: [(link, name + link) for link in self._list_dates(key, url)],
         )
 
-    def _create_time_menu(self, message, reply_token):
-        for key, info in self.machine_config.items():
-            if message.startswith(f"!({key})"):
-                url, name = info["url"], info["name_search"]
-                break
-        else:
-            return
-
-        date = message.split(":")[1]
-        folder_links = [
-            link.split("/")[0]
-            for link in fetch_folder_links(url)[1:]
-            if link.startswith(date)
-        ]
-
-        bubbles = []
-        for i in range(0, len(folder_links), 10):
-            buttons = [
-                FlexButton(
-                    style="link",
-                    height="sm",
-                    action=MessageAction(label=link, text=name + link),
-                )
-                for link in folder_links[i : i + 10]  # noqa E203
-            ]
-            bubbles.append(
-                FlexBubble(
-                    footer=FlexBox(
-                        layout="vertical", spacing="sm", contents=buttons, flex=0
-                    )
-                )
-            )
-
-        return ReplyMessageRequest(
-            reply_token=reply_token,
-            messages=[
-                FlexMessage(
-                    alt_text="時間選擇", contents=FlexCarousel(contents=bubbles)
-                )
-            ],
+    def _create_time_menu(self, key, date):
+        info = self.machine_config[key]
+        url, name = info["url"], info["name_search"]
+        return self._carousel_payload(
+            key,
+            Command.TIME_MENU,
+            date,
+            "時間選擇",
+            lambda: [(link, name + link) for link in self._list_hours(key, url, date)],
         )
 
-    def _create_imgs_menu(self, message, reply_token, client_id):
-        search_date = message.split(":")[-1]
-        for key, info in self.machine_config.items():
-            if message.startswith(f"!({key})"):
-                url, name = info["url"], info["name_time"]
-                break
-        else:
-            return
-
-        directory_url = os.path.join(url, search_date + "/")
-        img_names = fetch_image_names(directory_url)[1:]
-        images_list = list({f.split("_")[2]: f for f in img_names}.values())
-
-        bubbles = []
-        for i in range(0, len(images_list), 10):
-            buttons = [
-                FlexButton(
-                    style="link",
-                    height="sm",
-                    action=MessageAction(
-                        label="_".join(link.split("_")[1:4]), text=name + link
-                    ),
-                )
-                for link in images_list[i : i + 10]  # noqa E203
-            ]
-            bubbles.append(
-                FlexBubble(
-                    footer=FlexBox(
-                        layout="vertical", spacing="sm", contents=buttons, flex=0
-                    )
-                )
-            )
-
-        return ReplyMessageRequest(
-            reply_token=reply_token,
-            messages=[
-                FlexMessage(
-                    alt_text="影像清單", contents=FlexCarousel(contents=bubbles)
-                )
+    def _create_imgs_menu(self, key, search_date):
+        info = self.machine_config[key]
+        url, name = info["url"], info["name_time"]
+        return self._carousel_payload(
+            key,
+            Command.IMAGE_MENU,
+            search_date,
+            "影像清單",
+            lambda: [
+                ("_".join(link.split("_")[1:4]), name + link)
+                for link in self._list_images(key, url, search_date)
             ],
         )
 
-    def _reply_new_image(self, event):
+    def _reply_new_image(self, event, key):
         message = event.message.text
         reply_token = event.reply_token
         tz = pytz.timezone("Asia/Taipei")
@@ -191,11 +243,7 @@ class TyScrapBotHandler:
             now.strftime("%Y%m%d_%H"),
         ]
 
-        key = message[0:4].strip("()")
-        info = self.machine_config.get(key)
-        if not info:
-            return
-
+        info = self.machine_config[key]
         url, machine = info["url"], info["machine"]
         latest_5_images = fetch_last_5_images(machine)
         now_hour = latest_5_images[0].split("/")[0]
@@ -206,7 +254,7 @@ class TyScrapBotHandler:
             reply_message = [
                 ImageMessage(
                     original_content_url=os.path.join(url, img),
-                    preview_image_url=os.path.join(url, img),
+                    preview_image_url=preview_url(os.path.join(url, img)),
                 )
                 for img in latest_5_images
             ]
@@ -214,26 +262,24 @@ class TyScrapBotHandler:
             latest_image = latest_5_images[0]
             img_url = os.path.join(url, latest_image)
             reply_message = [
-                ImageMessage(original_content_url=img_url, preview_image_url=img_url)
+                ImageMessage(
+                    original_content_url=img_url, preview_image_url=preview_url(img_url)
+                )
             ]
 
         return self._send_reply(reply_token, reply_message)
 
-    def _reply_image(self, message, reply_token, client_id):
-        date_time_name = message.split(":")[-1]
+    def _reply_image(self, key, argument, reply_token):
+        date_time_name = argument.split(":")[-1]
         date_time_part = date_time_name.split("_")
         date_time = f"{date_time_part[0].replace('-', '')}_{date_time_part[1]}"
 
-        for key, info in self.machine_config.items():
-            if message.startswith(f"({key})"):
-                url = info["url"]
-                break
-        else:
-            return
-
+        url = self.machine_config[key]["url"]
         img_url = os.path.join(url, date_time, date_time_name)
         reply_message = [
-            ImageMessage(original_content_url=img_url, preview_image_url=img_url)
+            ImageMessage(
+                original_content_url=img_url, preview_image_url=preview_url(img_url)
+            )
         ]
         return self._send_reply(reply_token, reply_message)
 
@@ -252,66 +298,38 @@ class TyScrapBotHandler:
                 f"User({client_id}): {message}", extra={"project": "ty_scrap"}
             )
 
-        self.messaging_api.show_loading_animation(
-            ShowLoadingAnimationRequest(chat_id=client_id, loadingSeconds=5)
+        self.governor.call(
+            self.messaging_api.show_loading_animation,
+            ShowLoadingAnimationRequest(chat_id=client_id, loadingSeconds=5),
+            target="line_loading",
         )
 
+        parsed = self.dispatcher.parse(message)
+        if parsed is None:
+            return
+        command, key = parsed.command, parsed.machine
+
         try:
-            if message in ["!", "！"]:
-                return self._send_reply(
-                    reply_token,
-                    [
-                        TemplateMessage(
-                            alt_text="功能選單",
-                            template=ButtonsTemplate(
-                                thumbnail_image_url="https://doqvf81n9htmm.cloudfront.net/data/crop_article/118966/shutterstock_1122707477.jpg_1140x855.jpg",  # noqa E501
-                                title="鋼筋影像",
-                                text="功能選單",
-                                actions=[
-                                    MessageAction(label="最新影像", text="!最新影像"),
-                                    MessageAction(
-                                        label="最新影像五張", text="!最新影像五張"
-                                    ),
-                                    MessageAction(
-                                        label="自訂時間區間", text="!自訂時間影像"
-                                    ),
-                                ],
-                            ),
-                        )
-                    ],
-                )
-            elif message in ["!最新影像", "!最新影像五張", "!自訂時間影像"]:
-                return self._send_reply(
-                    reply_token,
-                    [self._choice_machine(message, reply_token).messages[0]],
+            if command == Command.MENU:
+                return self._send_payload(reply_token, self._menu_payload)
+            elif command == Command.CHOOSE_MACHINE:
+                return self._send_payload(
+                    reply_token, self._choice_machine_payloads[message]
                 )
-            elif any(message.startswith(f"({key})自訂") for key in self.machine_config):
-                return self._send_reply(
-                    reply_token,
-                    [self._create_date_menu(message, reply_token).messages[0]],
+            elif command == Command.DATE_MENU:
+                return self._send_payload(reply_token, self._create_date_menu(key))
+            elif command == Command.TIME_MENU:
+                return self._send_payload(
+                    reply_token, self._create_time_menu(key, parsed.argument)
                 )
-            elif any(
-                message.startswith(f"!({key})影像:") for key in self.machine_config
-            ):
-                return self._send_reply(
-                    reply_token,
-                    [self._create_time_menu(message, reply_token).messages[0]],
+            elif command == Command.IMAGE_MENU:
+                return self._send_payload(
+                    reply_token, self._create_imgs_menu(key, parsed.argument)
                 )
-            elif any(
-                message.startswith(f"!({key})搜尋:") for key in self.machine_config
-            ):
-                return self._send_reply(
-                    reply_token,
-                    [
-                        self._create_imgs_menu(
-                            message, reply_token, client_id
-                        ).messages[0]
-                    ],
-                )
-            elif any(message.startswith(f"({key})最新") for key in self.machine_config):
-                return self._reply_new_image(event)
-            elif any(message.startswith(f"({key})時間") for key in self.machine_config):
-                return self._reply_image(message, reply_token, client_id)
+            elif command == Command.LATEST_IMAGE:
+                return self._reply_new_image(event, key)
+            elif command == Command.IMAGE:
+                return self._reply_image(key, parsed.argument, reply_token)
         except Exception:
             traceback.print_exc()
             return self._send_reply(
@@ -320,11 +338,14 @@ class TyScrapBotHandler:
 
     def handle_follow(self, event):
         user_id = event.source.user_id
-        self.messaging_api.push_message(
-            user_id,
-            messages=[
-                TextMessage(text="功能選單觀看即時影像"),
-                StickerMessage(package_id="6370", sticker_id="11088021"),
-            ],
+        self.governor.push(
+            self.messaging_api,
+            PushMessageRequest(
+                to=user_id,
+                messages=[
+                    TextMessage(text="功能選單觀看即時影像"),
+                    StickerMessage(package_id="6370", sticker_id="11088021"),
+                ],
+            ),
         )
         self.logger.info(f"New follower: {user_id}", extra={"project": "ty_scrap"})
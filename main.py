@@ -1,15 +1,46 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Request
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
-from slowapi.errors import RateLimitExceeded
-from routers import ths_bot, ty_scrap
-from utils.factory import setup_logger
+from fastapi.responses import ORJSONResponse, PlainTextResponse
+from routers import media, ths_bot, ty_scrap
+from utils import http_pool, metrics_server
+from utils.factory import configure_logging, setup_logger
+from utils.metrics import REGISTRY, MetricsMiddleware
+from utils.rate_limit import RateLimitExceeded
 
 logger = setup_logger(__name__)
-app = FastAPI()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    configure_logging()
+    await http_pool.startup()
+    await ths_bot.startup()
+    await ty_scrap.startup()
+    await media.startup()
+    await metrics_server.startup()
+    yield
+    await metrics_server.shutdown()
+    await media.shutdown()
+    await ty_scrap.shutdown()
+    await ths_bot.shutdown()
+    await http_pool.shutdown()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(ty_scrap.router)
 app.include_router(ths_bot.router)
+app.include_router(media.router)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(
+        REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
 
 
 # 422 Request Validation Error
@@ -22,7 +53,7 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
     )
     print(exc.errors())
 
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=422,
         content={"detail": exc.errors()},
     )
@@ -34,7 +65,8 @@ async def ratelimit_exception_handler(request: Request, exc: RateLimitExceeded):
     logger.error(
         "429 Too Many Requests", exc_info=False, extra={"project": request.client.host}
     )
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=429,
-        content={"detail": "Too many requests. Please try again later."},
+        content={"detail": exc.detail},
+        headers=exc.headers,
     )
@@ -0,0 +1,60 @@
+import os
+
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import FileResponse, RedirectResponse
+
+from utils.factory import setup_logger
+from utils.media import get_preview_cache, get_snapshot_store, verify
+from utils.metrics import register_cache
+
+logger = setup_logger(__name__)
+
+# Preview paths are derived from the signed source URL and snapshot names
+# from their content, so a response never changes and clients may keep it
+_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+router = APIRouter(prefix="/media", tags=["media"])
+
+
+async def startup():
+    register_cache("preview", get_preview_cache().stats)
+    register_cache("snapshot", get_snapshot_store().stats)
+
+
+async def shutdown():
+    await get_snapshot_store().stop()
+
+
+@router.get("/preview")
+async def preview(src: str = Query(...), sig: str = Query("")):
+    """
+    Serves the downscaled preview of a signed image URL, creating it on the
+    first request. If the original cannot be fetched or decoded, clients are
+    redirected to it instead.
+    """
+    if not verify(src, sig):
+        raise HTTPException(status_code=403, detail="Invalid signature")
+
+    try:
+        path = await get_preview_cache().get(src)
+    except Exception as e:
+        logger.warning(
+            f"Preview for {src} failed, redirecting to the original: {e}",
+            extra={"project": "media"},
+        )
+        return RedirectResponse(src, status_code=307)
+
+    return FileResponse(
+        path, media_type="image/jpeg", headers={"Cache-Control": _CACHE_CONTROL}
+    )
+
+
+@router.get("/snapshots/{name}")
+async def snapshot(name: str):
+    """
+    Serves a stored copy of an alert image by its content hash.
+    """
+    path = get_snapshot_store().path_for(name)
+    if path is None or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Not found")
+    return FileResponse(path, headers={"Cache-Control": _CACHE_CONTROL})
@@ -1,71 +1,91 @@
+import asyncio
 import os
-import time
-from pydantic import BaseModel
+from typing import List
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
 from fastapi import APIRouter, Request, Header, HTTPException
-from fastapi.responses import JSONResponse
-from linebot.v3 import WebhookHandler
-from linebot.v3.webhooks import MessageEvent, TextMessageContent
-from linebot.v3.exceptions import InvalidSignatureError
-from linebot.v3.messaging import Configuration, ApiClient, MessagingApi
-from slowapi import Limiter
-from slowapi.util import get_remote_address
-
-from utils.notification import Notifier
-from utils.factory import setup_logger
+from fastapi.responses import ORJSONResponse
+
+from utils.alert_dedup import AlertDeduplicator
+from utils.channels import NotificationChannel, load_channels
+from utils.notification import Alert, Notifier, LINE_MAX_MESSAGES
+from utils.spool import DeliveryPolicy, NotificationSpool, SpoolWorkerPool
+from utils.event_dispatcher import (
+    AsyncWebhookHandler,
+    ChatOrderedExecutor,
+    InvalidSignature,
+    chat_key,
+)
+from utils.event_dedup import webhook_event_filter
+from utils.factory import setup_logger, load_config
+from utils.idempotency import idempotency_cache
+from utils.line_governor import get_governor
+from utils.media import get_snapshot_store
+from utils.metrics import LINE_EVENT_OLDEST_AGE, QUEUE_DEPTH, register_cache
+from utils.orjson_route import ORJSONRoute
+from utils.rate_limit import Limiter, get_remote_address
 
 logger = setup_logger(__name__)
 
-# Initialize LINE API Client
-configuration = Configuration(
-    access_token=os.getenv("LINE_CHANNEL_ACCESS_TOKEN_PUSHBOT")
-)
-api_client = ApiClient(configuration=configuration)
-messaging_api = MessagingApi(api_client)
-handler = WebhookHandler(os.getenv("LINE_CHANNEL_SECRET_PUSHBOT"))
+# The AsyncApiClient owns an aiohttp session and the webhook handler is per
+# worker; both are built in startup()
+async_api_client = None
+messaging_api = None
+handler = None
+line_governor = get_governor(os.getenv("LINE_CHANNEL_ACCESS_TOKEN_PUSHBOT"), "ths_bot")
 
 # Environment Configurations
 WEBHOOKS_URL = os.getenv("WEBHOOKS_URL_PUSHBOT")
-group_ids = {
-    "ty_scrap": os.getenv("GROUP_ID_PUSHBOT_TY_SCRAP"),
-    "water_spray": os.getenv("GROUP_ID_PUSHBOT_TY_WATER_SPRAY"),
-    "spark_detection": os.getenv("GROUP_ID_PUSHBOT_TY_SPARK_DETECTION"),
-    "dust_detection": os.getenv("GROUP_ID_PUSHBOT_TY_DUST_DETECTION"),
-    "pose_detection": os.getenv("GROUP_ID_PUSHBOT_TY_POSE_DETECTION"),
-}
-ntfy_topics = {
-    "ty_scrap": os.getenv("NTFY_TY_SCRAP"),
-    "water_spray": os.getenv("NTFY_TY_WATER_SPRAY"),
-    "spark_detection": os.getenv("NTFY_TY_SPARK_DETECTION"),
-    "dust_detection": os.getenv("NTFY_TY_DUST_DETECTION"),
-    "pose_detection": os.getenv("NTFY_TY_POSE_DETECTION"),
+
+# Alert sources, their /notify routes and delivery policies (CHANNELS in
+# config.yaml)
+notification_channels = load_channels(load_config().get("CHANNELS"))
+group_ids = {name: c.group_id for name, c in notification_channels.items()}
+ntfy_topics = {name: c.ntfy_topic for name, c in notification_channels.items()}
+
+# Outbound spool, opened in startup()
+spool = None
+spool_workers = None
+
+# Per-channel coalescing windows (seconds) for bursts of alerts
+coalesce_config = load_config().get("COALESCE", {})
+coalesce_windows = {
+    name: c.coalesce_window for name, c in notification_channels.items()
 }
 
+# Repeats of the same alert are suppressed before they reach the spool
+_dedup_config = load_config().get("DEDUP", {})
+deduplicator = AlertDeduplicator(
+    window=_dedup_config.get("WINDOW", 60),
+    max_entries=_dedup_config.get("MAX_ENTRIES", 1024),
+    fold_numbers=[
+        name for name, c in notification_channels.items() if c.dedup_fold_numbers
+    ],
+)
+_dedup_sweeper = None
+
+# Webhook events are acknowledged first and handled here
+_executor_config = load_config().get("WEBHOOK_EXECUTOR", {})
+event_executor = ChatOrderedExecutor(
+    "ths_bot",
+    workers=_executor_config.get("WORKERS", 8),
+    max_pending=_executor_config.get("MAX_PENDING", 1000),
+    drain_timeout=_executor_config.get("DRAIN_TIMEOUT", 5),
+)
+
 # Rate Limiter
 limiter = Limiter(key_func=get_remote_address)
+webhook_events = webhook_event_filter("ths_bot")
+# Replays responses to /notify retries sent with an Idempotency-Key
+idempotency = idempotency_cache()
 
 router = APIRouter(
     prefix=WEBHOOKS_URL,
     tags=["ths_bot"],
     responses={404: {"description": "Not found"}},
+    route_class=ORJSONRoute,
 )
 
 
-# Models
-class ScrapNotificationRequest(BaseModel):
-    rolling_line: str
-    message: str
-    image_path: str
-
-
-class ImageNotificationRequest(BaseModel):
-    message: str
-    image_filename: str
-
-
-class TextNotificationRequest(BaseModel):
-    message: str
-
-
 # Internal Functions
 def _limit_error():
     logger.warning(
@@ -74,19 +94,171 @@ def _limit_error():
     return 1
 
 
-def _send_notification(
-    project: str, group_key: str, message: str, image_url: str = None
+async def _deliver(jobs):
+    job = jobs[0]
+    snapshots = get_snapshot_store()
+    image_urls = await asyncio.gather(
+        *(snapshots.resolve(j.payload["image_url"]) for j in jobs)
+    )
+    notifier = Notifier(
+        project_name=job.project,
+        messaging_api=messaging_api,
+        governor=line_governor,
+    )
+    return await notifier.send_batch(
+        group_id=group_ids[job.payload["group_key"]],
+        ntfy_topic=ntfy_topics.get(job.project),
+        alerts=[
+            Alert(j.payload["message"], image_url)
+            for j, image_url in zip(jobs, image_urls)
+        ],
+        channels=job.channels,
+        # Set by the spool on the batch's first claim and kept for its retries
+        retry_key=job.retry_key,
+    )
+
+
+async def _sweep_suppressed_alerts(interval):
+    while True:
+        await asyncio.sleep(interval)
+        for summary in deduplicator.sweep():
+            try:
+                await _enqueue(
+                    summary.project,
+                    summary.context["group_key"],
+                    f"{summary.count} similar alerts suppressed: {summary.message}",
+                    channels=summary.context["channels"],
+                )
+            except Exception as e:
+                logger.error(
+                    f"Failed to queue suppression summary: {str(e)}",
+                    extra={"project": summary.project},
+                )
+
+
+async def startup():
+    from linebot.v3.messaging import Configuration, AsyncApiClient, AsyncMessagingApi
+    from linebot.v3.webhooks import MessageEvent, TextMessageContent
+
+    global async_api_client, messaging_api, handler
+    global spool, spool_workers, _dedup_sweeper
+    configuration = Configuration(
+        host=load_config().get("LINE", {}).get("API_HOST"),
+        access_token=os.getenv("LINE_CHANNEL_ACCESS_TOKEN_PUSHBOT"),
+    )
+    async_api_client = AsyncApiClient(configuration=configuration)
+    messaging_api = AsyncMessagingApi(async_api_client)
+    handler = AsyncWebhookHandler(os.getenv("LINE_CHANNEL_SECRET_PUSHBOT"))
+    handler.add(MessageEvent, message=TextMessageContent)(_handle_message)
+
+    spool_config = load_config().get("SPOOL", {})
+    spool = NotificationSpool(
+        spool_config.get("PATH", "spool/notifications.db"),
+        lease_seconds=spool_config.get("LEASE_SECONDS", 60),
+        max_batch=min(coalesce_config.get("MAX_BATCH", 4), LINE_MAX_MESSAGES - 1),
+        dead_retention=spool_config.get("DEAD_RETENTION", 7 * 86400),
+        max_dead=spool_config.get("MAX_DEAD", 10_000),
+    )
+    # Dead rows are otherwise only purged when another job is buried
+    await asyncio.to_thread(spool.purge_dead)
+    spool_workers = SpoolWorkerPool(
+        spool,
+        _deliver,
+        workers=spool_config.get("WORKERS", 4),
+        max_attempts=spool_config.get("MAX_ATTEMPTS", 8),
+        backoff_base=spool_config.get("BACKOFF_BASE", 2),
+        backoff_max=spool_config.get("BACKOFF_MAX", 300),
+        policies={
+            name: DeliveryPolicy(c.max_concurrency, c.timeout)
+            for name, c in notification_channels.items()
+        },
+    )
+    await spool_workers.start()
+    await event_executor.start()
+    QUEUE_DEPTH.set_function(spool.depth, queue="spool")
+    QUEUE_DEPTH.set_function(spool.dead_depth, queue="spool_dead")
+    QUEUE_DEPTH.set_function(lambda: event_executor.depth, queue="ths_bot_events")
+    LINE_EVENT_OLDEST_AGE.set_function(event_executor.oldest_age, bot="ths_bot")
+    register_cache("ths_bot_webhook_events", webhook_events.stats)
+    register_cache("ths_bot_idempotency", idempotency.stats)
+    _dedup_sweeper = asyncio.create_task(
+        _sweep_suppressed_alerts(_dedup_config.get("SWEEP_INTERVAL", 5))
+    )
+
+
+async def shutdown():
+    global async_api_client, messaging_api, _dedup_sweeper
+    if _dedup_sweeper is not None:
+        _dedup_sweeper.cancel()
+        await asyncio.gather(_dedup_sweeper, return_exceptions=True)
+        _dedup_sweeper = None
+    await event_executor.stop()
+    if spool_workers is not None:
+        await spool_workers.stop()
+    if spool is not None:
+        spool.close()
+    if async_api_client is not None:
+        await async_api_client.close()
+        async_api_client = None
+        messaging_api = None
+
+
+def _spool_entry(
+    project: str,
+    group_key: str,
+    message: str,
+    image_url: str = None,
+    channels: tuple = ("line", "ntfy"),
+) -> dict:
+    window = coalesce_windows.get(project, 0)
+    channel = notification_channels.get(project)
+    return {
+        "project": project,
+        "payload": {"group_key": group_key, "message": message, "image_url": image_url},
+        "channels": list(channels),
+        "delay": window,
+        "batch_key": project if window else None,
+        "priority": channel.priority if channel else 0,
+    }
+
+
+async def _enqueue(
+    project: str,
+    group_key: str,
+    message: str,
+    image_url: str = None,
+    channels: tuple = ("line", "ntfy"),
 ):
+    entry = _spool_entry(project, group_key, message, image_url, channels)
+    await asyncio.to_thread(spool.enqueue, **entry)
+    spool_workers.wake()
+    get_snapshot_store().prefetch(image_url)
+
+
+async def send_notification(
+    project: str,
+    group_key: str,
+    message: str,
+    image_url: str = None,
+    channels: tuple = ("line", "ntfy"),
+) -> bool:
+    """
+    Queues the notification in the durable spool; delivery happens in the
+    background workers. Projects with a coalescing window wait for it so
+    that a burst goes out as one push.
+
+    Returns False, without touching the spool, when the alert repeats one
+    sent within the dedup window.
+    """
+    context = {"group_key": group_key, "channels": tuple(channels)}
+    if not deduplicator.check(project, message, image_url, context):
+        logger.debug("Duplicate alert suppressed", extra={"project": project})
+        return False
     try:
-        notifier = Notifier(project_name=project, messaging_api=messaging_api)
-        notifier.send_line(
-            group_id=group_ids[group_key], text_message=message, image_url=image_url
-        )
-        notifier.send_ntfy(
-            ntfy_topic=ntfy_topics[project], text_message=message, image_url=image_url
-        )
-        return {"status": "success", "message": "Notification sent successfully"}
+        await _enqueue(project, group_key, message, image_url, channels)
+        return True
     except Exception as e:
+        deduplicator.release(project, message, image_url)
         logger.error(
             f"Error in {project} notification: {str(e)}",
             exc_info=True,
@@ -95,7 +267,12 @@ def _send_notification(
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
 
-@handler.add(MessageEvent, message=TextMessageContent)
+def _queued_response(queued: bool) -> dict:
+    if queued:
+        return {"status": "accepted", "message": "Notification queued"}
+    return {"status": "suppressed", "message": "Duplicate notification suppressed"}
+
+
 def _handle_message(event):
     message = event.message.text
     group_id = event.source.group_id
@@ -109,18 +286,28 @@ def _handle_message(event):
 
 # Webhook Endpoint
 @router.post("/line")
-@limiter.limit("5/minute", error_message=_limit_error)
+@limiter.limit("5/minute", on_reject=_limit_error)
 async def callback(request: Request, x_line_signature: str = Header(None)):
     client_ip = get_remote_address(request)
     body = await request.body()
 
     try:
-        handler.handle(body.decode("utf-8"), x_line_signature)
-    except InvalidSignatureError:
+        payload = handler.parse(body.decode("utf-8"), x_line_signature)
+    except InvalidSignature:
         logger.warning(
             f"Invalid signature from IP: {client_ip}", extra={"project": "line"}
         )
-        return JSONResponse(status_code=400, content={"error": "Invalid signature"})
+        return ORJSONResponse(status_code=400, content={"error": "Invalid signature"})
+
+    if not event_executor.has_capacity(len(payload.events)):
+        logger.warning(
+            f"Webhook queue full, depth {event_executor.depth}",
+            extra={"project": "line"},
+        )
+        return ORJSONResponse(status_code=503, content={"error": "Server busy"})
+    # Redeliveries of events already accepted are acknowledged without work
+    for event in await webhook_events.filter(payload.events):
+        event_executor.submit(chat_key(event), handler.dispatch, event)
 
     logger.debug(
         f"Incoming request from IP: {client_ip} - Path: {request.url.path}",
@@ -130,90 +317,137 @@ async def callback(request: Request, x_line_signature: str = Header(None)):
 
 
 # Notification Routes
-@router.post("/notify/ty_scrap")
-@limiter.limit("10/3minute")
-async def push_ty_scrap(request: Request, body: ScrapNotificationRequest):
-    logger.info(
-        f"Received request: {await request.json()}", extra={"project": "ty_scrap"}
-    )
-    image_url = (
-        f"https://linebot.tunghosteel.com:5003/rl{body.rolling_line}/{body.image_path}"
-    )
-    return _send_notification("ty_scrap", "ty_scrap", body.message, image_url)
+def _notify_endpoint(channel: NotificationChannel):
+    Body = channel.body_model
 
-
-@router.post("/notify/ty_system_scrap")
-@limiter.limit("10/1minute")
-async def push_ty_system_scrap(request: Request, body: TextNotificationRequest):
-    logger.info(
-        f"Received request: {await request.json()}",
-        extra={"project": "ty_system_scrap"},
-    )
-    try:
-        notifier = Notifier(project_name="ty_system_scrap", messaging_api=messaging_api)
-        notifier.send_line(
-            group_id=group_ids["ty_scrap"], text_message=body.message, image_url=None
+    async def notify(request: Request, body: Body):
+        # Formatted only if a handler accepts the record
+        logger.info(
+            "Received notification: %s",
+            body,
+            extra={"project": channel.name, "notification": body.model_dump()},
         )
-        return {"status": "success", "message": "Notification sent successfully"}
-    except Exception as e:
-        logger.error(
-            f"Error in sent: {str(e)}",
-            exc_info=True,
-            extra={"project": "ty_system_scrap"},
+        queued = await send_notification(
+            channel.name,
+            channel.name,
+            body.message,
+            channel.image_url(body),
+            channels=channel.send_via,
         )
-        raise HTTPException(status_code=500, detail="Internal Server Error")
+        return _queued_response(queued)
+
+    # The rate limiter keys its buckets by the endpoint's qualified name;
+    # replayed retries are answered before they take a token
+    notify.__name__ = notify.__qualname__ = f"push_{channel.name}"
+    return idempotency.idempotent(202)(limiter.limit(channel.rate_limit)(notify))
+
+
+for _channel in notification_channels.values():
+    if _channel.route == "batch":
+        raise ValueError("CHANNELS: the route 'batch' is reserved for /notify/batch")
+    router.add_api_route(
+        f"/notify/{_channel.route}",
+        _notify_endpoint(_channel),
+        methods=["POST"],
+        status_code=202,
+        name=f"push_{_channel.name}",
+    )
 
 
-@router.post("/notify/water_spray")
-@limiter.limit("10/3minute")
-async def push_water_spray(request: Request, body: ImageNotificationRequest):
-    logger.info(
-        f"Received request: {await request.json()}", extra={"project": "water_spray"}
-    )
-    image_url = (
-        f"https://linebot.tunghosteel.com:5003/water_spray_files/{body.image_filename}"
-    )
-    return _send_notification("water_spray", "water_spray", body.message, image_url)
+# Bulk submission: each item is validated, rate limited and deduplicated like
+# a call to its channel's route, and the accepted ones share one transaction
+_batch_config = load_config().get("NOTIFY_BATCH", {})
 
 
-@router.post("/notify/spark_detection")
-@limiter.limit("10/3minute")
-async def push_spark_detection(request: Request, body: ImageNotificationRequest):
-    logger.info(
-        f"Received request: {await request.json()}",
-        extra={"project": "spark_detection"},
-    )
-    image_url = (
-        f"https://linebot.tunghosteel.com:5003/spark_detection/{body.image_filename}"
-    )
-    return _send_notification(
-        "spark_detection", "spark_detection", body.message, image_url
-    )
+class BatchNotification(BaseModel):
+    """
+    ``channel`` plus the body its /notify route takes.
+    """
 
+    model_config = ConfigDict(extra="allow")
 
-@router.post("/notify/dust_detection_150")
-@limiter.limit("10/3minute")
-async def push_dust_detection(request: Request, body: ImageNotificationRequest):
-    logger.info(
-        f"Received request: {await request.json()}", extra={"project": "dust_detection"}
-    )
-    image_url = (
-        f"https://linebot.tunghosteel.com:5003/dust_detection_150/{body.image_filename}"
+    channel: str
+
+
+class BatchNotificationRequest(BaseModel):
+    notifications: List[BatchNotification] = Field(
+        min_length=1, max_length=_batch_config.get("MAX_ITEMS", 100)
     )
-    return _send_notification(
-        "dust_detection", "dust_detection", body.message, image_url
+
+
+def _batch_item(index: int, item: BatchNotification):
+    """
+    Returns (channel, body) for a valid item, otherwise its error result.
+    """
+    channel = notification_channels.get(item.channel)
+    if channel is None:
+        return {"index": index, "status": "invalid", "detail": "Unknown channel"}
+    try:
+        return channel, channel.body_model.model_validate(item.model_extra or {})
+    except ValidationError as e:
+        detail = "; ".join(
+            f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()
+        )
+        return {"index": index, "status": "invalid", "detail": detail}
+
+
+@router.post("/notify/batch", status_code=202)
+@idempotency.idempotent(202)
+@limiter.limit(_batch_config.get("RATE_LIMIT", "60/minute"))
+async def push_batch(request: Request, body: BatchNotificationRequest):
+    results = [_batch_item(i, item) for i, item in enumerate(body.notifications)]
+    valid = [i for i, r in enumerate(results) if isinstance(r, tuple)]
+    channels = [results[i][0] for i in valid]
+    allowed = await limiter.consume(
+        request,
+        [
+            (
+                f"{__name__}.push_{channel.name}",
+                channel.rate_limit,
+                f"{router.prefix}/notify/{channel.route}",
+            )
+            for channel in channels
+        ],
     )
 
+    entries, image_urls, alerts = [], [], []
+    for i, ok in zip(valid, allowed):
+        channel, item = results[i]
+        if not ok:
+            results[i] = {"index": i, "status": "rate_limited"}
+            continue
+        image_url = channel.image_url(item)
+        context = {"group_key": channel.name, "channels": channel.send_via}
+        if not deduplicator.check(channel.name, item.message, image_url, context):
+            results[i] = {"index": i, "status": "suppressed"}
+            continue
+        entries.append(
+            _spool_entry(
+                channel.name, channel.name, item.message, image_url, channel.send_via
+            )
+        )
+        image_urls.append(image_url)
+        alerts.append((channel.name, item.message, image_url))
+        results[i] = {"index": i, "status": "accepted"}
+
+    if entries:
+        try:
+            await asyncio.to_thread(spool.enqueue_many, entries)
+        except Exception as e:
+            for alert in alerts:
+                deduplicator.release(*alert)
+            logger.error(
+                f"Error in batch notification: {str(e)}",
+                exc_info=True,
+                extra={"project": "batch"},
+            )
+            raise HTTPException(status_code=500, detail="Internal Server Error")
+        spool_workers.wake()
+        for image_url in image_urls:
+            get_snapshot_store().prefetch(image_url)
 
-@router.post("/notify/pose_detection")
-@limiter.limit("10/3minute")
-async def push_pose_detection(request: Request, body: TextNotificationRequest):
     logger.info(
-        f"Received request: {await request.json()}", extra={"project": "pose_detection"}
-    )
-    image_url = (
-        f"https://linebot.tunghosteel.com:5003/pose_detection?{int(time.time())}"
-    )
-    return _send_notification(
-        "pose_detection", "pose_detection", body.message, image_url
+        f"Received batch of {len(results)} notifications, {len(entries)} queued",
+        extra={"project": "batch"},
     )
+    return {"accepted": len(entries), "results": results}
@@ -1,31 +1,42 @@
 import os
 from fastapi import APIRouter, Request, Header
-from fastapi.responses import JSONResponse
-from linebot.v3 import WebhookHandler
-from linebot.v3.exceptions import InvalidSignatureError
-from linebot.v3.messaging import Configuration, ApiClient, MessagingApi
-from linebot.v3.webhooks import MessageEvent, TextMessageContent
-from slowapi import Limiter
-from slowapi.util import get_remote_address
+from fastapi.responses import ORJSONResponse
 
-from handlers.ty_scrap_handler import TyScrapBotHandler
-from utils.factory import setup_logger
+from utils.event_dispatcher import (
+    AsyncWebhookHandler,
+    ChatOrderedExecutor,
+    InvalidSignature,
+    chat_key,
+)
+from utils.event_dedup import webhook_event_filter
+from utils.factory import setup_logger, load_config
+from utils.rate_limit import Limiter, get_remote_address
+from utils.image_index import ImageIndexer
+from utils.metrics import LINE_EVENT_OLDEST_AGE, QUEUE_DEPTH, register_cache
 
 logger = setup_logger(__name__)
 
-configuration = Configuration(
-    access_token=os.getenv("LINE_CHANNEL_ACCESS_TOKEN_TY_SCRAP")
-)
-api_client = ApiClient(configuration=configuration)
-messaging_api = MessagingApi(api_client)
+# Clients, the webhook handler and the image index are built per worker in
+# startup(), not at import time
+api_client = None
+messaging_api = None
+handler = None
+image_indexer = None
+bot_handler = None
 
-handler = WebhookHandler(os.getenv("LINE_CHANNEL_SECRET_TY_SCRAP"))
 WEBHOOKS_URL = os.getenv("WEBHOOKS_URL_TY_SCRAP")
 group_id = os.getenv("GROUP_ID_TY_SCRAP")
 project_name = "ty_scrap"
 
-bot_handler = TyScrapBotHandler(messaging_api)
+config = load_config()
+event_executor = ChatOrderedExecutor(
+    project_name,
+    workers=config.get("WEBHOOK_EXECUTOR", {}).get("WORKERS", 8),
+    max_pending=config.get("WEBHOOK_EXECUTOR", {}).get("MAX_PENDING", 1000),
+    drain_timeout=config.get("WEBHOOK_EXECUTOR", {}).get("DRAIN_TIMEOUT", 5),
+)
 limiter = Limiter(key_func=get_remote_address)
+webhook_events = webhook_event_filter(project_name)
 
 router = APIRouter(
     prefix=WEBHOOKS_URL,
@@ -34,6 +45,51 @@ router = APIRouter(
 )
 
 
+async def startup():
+    # The LINE SDK and the handler's message models are the slowest imports
+    # of the app, so they are loaded here rather than at import time
+    from linebot.v3.messaging import Configuration, ApiClient, MessagingApi
+    from linebot.v3.webhooks import MessageEvent, TextMessageContent
+
+    from handlers.ty_scrap_handler import TyScrapBotHandler
+
+    global api_client, messaging_api, handler, image_indexer, bot_handler
+    configuration = Configuration(
+        host=config.get("LINE", {}).get("API_HOST"),
+        access_token=os.getenv("LINE_CHANNEL_ACCESS_TOKEN_TY_SCRAP"),
+    )
+    api_client = ApiClient(configuration=configuration)
+    messaging_api = MessagingApi(api_client)
+    handler = AsyncWebhookHandler(os.getenv("LINE_CHANNEL_SECRET_TY_SCRAP"))
+    handler.add(MessageEvent, message=TextMessageContent)(handle_message)
+    image_indexer = ImageIndexer(
+        config["MACHINES"],
+        refresh_interval=config.get("IMAGE_INDEX", {}).get("REFRESH_INTERVAL", 30),
+        full_scan_interval=config.get("IMAGE_INDEX", {}).get(
+            "FULL_SCAN_INTERVAL", 1800
+        ),
+    )
+    bot_handler = TyScrapBotHandler(messaging_api, image_indexer=image_indexer)
+
+    QUEUE_DEPTH.set_function(lambda: event_executor.depth, queue="ty_scrap_events")
+    LINE_EVENT_OLDEST_AGE.set_function(event_executor.oldest_age, bot=project_name)
+    register_cache("ty_scrap_carousel", bot_handler.carousel_stats)
+    register_cache("ty_scrap_webhook_events", webhook_events.stats)
+    await image_indexer.start()
+    await event_executor.start()
+
+
+async def shutdown():
+    global api_client, messaging_api
+    await event_executor.stop()
+    if image_indexer is not None:
+        await image_indexer.stop()
+    if api_client is not None:
+        api_client.close()
+        api_client = None
+        messaging_api = None
+
+
 def limit_error():
     logger.warning(
         "Rate limit triggered during LINE webhook", extra={"project": project_name}
@@ -42,7 +98,7 @@ def limit_error():
 
 
 @router.post("/line")
-@limiter.limit("10/minute", error_message=limit_error)
+@limiter.limit("10/minute", on_reject=limit_error)
 async def callback(request: Request, x_line_signature: str = Header(None)):
     client_ip = get_remote_address(request)
     logger.info(
@@ -51,19 +107,30 @@ async def callback(request: Request, x_line_signature: str = Header(None)):
     )
     body = await request.body()
     try:
-        handler.handle(body.decode("utf-8"), x_line_signature)
-        return {"message": "OK"}
-    except InvalidSignatureError:
+        payload = handler.parse(body.decode("utf-8"), x_line_signature)
+    except InvalidSignature:
         logger.error(
             f"Invalid signature from IP: {client_ip} - Body: {body.decode('utf-8')}",
             extra={"project": project_name},
         )
-        return JSONResponse(status_code=400, content={"error": "Invalid signature"})
+        return ORJSONResponse(status_code=400, content={"error": "Invalid signature"})
+
+    if not event_executor.has_capacity(len(payload.events)):
+        logger.warning(
+            f"Webhook queue full, depth {event_executor.depth}",
+            extra={"project": project_name},
+        )
+        return ORJSONResponse(status_code=503, content={"error": "Server busy"})
+    # Redeliveries of events already accepted are acknowledged without work
+    for event in await webhook_events.filter(payload.events):
+        event_executor.submit(chat_key(event), handler.dispatch, event)
+    return {"message": "OK"}
 
 
-@handler.add(MessageEvent, message=TextMessageContent)
 def handle_message(event):
-    handle_message, handle_result = bot_handler.handle_text_message(event)
-    logger.info(f"Handle message: {handle_message}", extra={"project": project_name})
+    handle_result = bot_handler.handle_text(event)
+    logger.info(
+        f"Handle message: {event.message.text}", extra={"project": project_name}
+    )
     if handle_result:
         logger.info(handle_result, extra={"project": project_name})
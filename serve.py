@@ -0,0 +1,63 @@
+"""
+Production entry point: runs main:app in uvicorn worker processes under
+uvicorn's supervisor, which restarts workers that die.
+
+    python serve.py [--workers N] [--host 0.0.0.0] [--port 6000]
+    python serve.py --reload        # development only: one process + file watcher
+
+Every worker runs the FastAPI lifespan, so LINE clients, webhook handlers,
+HTTP pools and spool workers are built per process. The spool, rate limit
+buckets, webhook event IDs and idempotency keys live in SQLite and are
+shared by all workers on the host. Alert dedup windows, the LINE send
+governor and the TyScrap image index are still per process: with N workers
+an alert can pass dedup once per worker, LINE send caps are multiplied by N
+and each worker indexes the image server. One worker is the default; raise
+it only if that is acceptable.
+
+Metrics are per process too: /metrics on the app port is answered by
+whichever worker took the connection. With several workers set
+METRICS.WORKER_PORT so every worker also serves its own, labelled by
+worker, and scrape each of those ports.
+"""
+
+import argparse
+import os
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the LINE bot server.")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 6000)))
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.getenv("WEB_CONCURRENCY", 1)),
+        help="worker processes (default: $WEB_CONCURRENCY or 1)",
+    )
+    parser.add_argument(
+        "--reload", action="store_true", help="development mode, implies 1 worker"
+    )
+    parser.add_argument("--graceful-timeout", type=int, default=30)
+    args = parser.parse_args(argv)
+    if args.reload:
+        args.workers = 1
+    return args
+
+
+def main(argv=None):
+    import uvicorn
+
+    args = parse_args(argv)
+    uvicorn.run(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        reload=args.reload,
+        lifespan="on",
+        timeout_graceful_shutdown=args.graceful_timeout,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,40 @@
-from fastapi.testclient import TestClient
-from main import app
+import shutil
+import tempfile
 
-import pytest
-from dotenv import load_dotenv
+from utils.factory import load_config
+
+# Keep the session's stores and spool off the working tree's spool/: shared
+# stores run in memory and files go to a temporary directory. Applied to the
+# cached config before main imports the routers that read it.
+_TMP_DIR = tempfile.mkdtemp(prefix="line_bot_tests_")
+_config = load_config()
+for _section in ("RATE_LIMIT", "WEBHOOK_DEDUP", "IDEMPOTENCY"):
+    _config.setdefault(_section, {})["STORAGE_URI"] = "memory://"
+_config.setdefault("SPOOL", {})["PATH"] = f"{_TMP_DIR}/notifications.db"
+_config.setdefault("MEDIA", {}).update(
+    SNAPSHOT_DIR=f"{_TMP_DIR}/snapshots", PREVIEW_DIR=f"{_TMP_DIR}/previews"
+)
+
+from fastapi.testclient import TestClient  # noqa: E402
+from main import app  # noqa: E402
+from utils.event_dedup import get_seen_store  # noqa: E402
+from utils.idempotency import get_idempotency_store  # noqa: E402
+from utils.rate_limit import get_storage  # noqa: E402
+
+import pytest  # noqa: E402
+from dotenv import load_dotenv  # noqa: E402
 
 load_dotenv()
 
 
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_TMP_DIR, ignore_errors=True)
+
+
 @pytest.fixture(scope="module")
 def client():
+    get_storage().reset()
+    get_seen_store().reset()
+    get_idempotency_store().reset()
     with TestClient(app) as c:
         yield c
@@ -0,0 +1,83 @@
+from unittest.mock import patch
+
+from utils.alert_dedup import AlertDeduplicator, normalize_message
+
+
+def test_normalize_message_ignores_case_and_spacing():
+    """
+    大小寫與空白不同的相同訊息視為同一警報，數字僅在啟用時忽略
+    """
+    assert normalize_message("Spark  at 10:32 ") == normalize_message("spark at 10:32")
+    assert normalize_message("rl1 down") != normalize_message("rl2 down")
+    assert normalize_message("Spark at 10:32, score 0.91", True) == normalize_message(
+        "spark at 10:33, score 0.87", True
+    )
+
+
+def test_repeats_are_suppressed_within_window():
+    """
+    視窗內重複的警報被抑制，不同訊息或影像不受影響
+    """
+    dedup = AlertDeduplicator(window=60)
+    assert dedup.check("spark_detection", "fire 1", "https://x/a.png")
+    assert not dedup.check("spark_detection", "Fire  1", "https://x/a.png")
+    assert dedup.check("spark_detection", "smoke", "https://x/a.png")
+    assert dedup.check("spark_detection", "fire 1", "https://x/b.png")
+    assert dedup.check("spark_detection", "fire 1", "https://x/a.png?v=2")
+    assert dedup.check("dust_detection", "fire 1", "https://x/a.png")
+    assert dedup.stats() == {"entries": 5, "allowed": 5, "suppressed": 1}
+
+
+def test_alerts_for_different_machines_are_both_sent():
+    """
+    只差在機台編號的警報皆送出，數字折疊僅對啟用的頻道生效
+    """
+    dedup = AlertDeduplicator(window=60, fold_numbers=["spark_detection"])
+    assert dedup.check("ty_scrap", "rl1 down")
+    assert dedup.check("ty_scrap", "rl2 down")
+    assert dedup.check("spark_detection", "fire at 10:32")
+    assert not dedup.check("spark_detection", "fire at 10:33")
+
+
+def test_released_alert_is_sent_again():
+    """
+    排入失敗而釋放的警報，重試時不被抑制
+    """
+    dedup = AlertDeduplicator(window=60)
+    assert dedup.check("spark_detection", "fire 1", "https://x/a.png")
+    dedup.release("spark_detection", "fire 1", "https://x/a.png")
+    assert dedup.check("spark_detection", "fire 1", "https://x/a.png")
+    assert dedup.stats() == {"entries": 1, "allowed": 1, "suppressed": 0}
+
+
+def test_sweep_reports_suppressed_count_after_window():
+    """
+    視窗結束後回報被抑制的數量，之後的警報重新送出
+    """
+    dedup = AlertDeduplicator(window=60)
+    with patch("utils.alert_dedup.time.monotonic", return_value=0):
+        dedup.check("pose_detection", "fall", context={"group_key": "pose"})
+        dedup.check("pose_detection", "fall")
+        dedup.check("pose_detection", "fall")
+        assert dedup.sweep() == []
+
+    with patch("utils.alert_dedup.time.monotonic", return_value=61):
+        (summary,) = dedup.sweep()
+        assert dedup.check("pose_detection", "fall")
+
+    assert (summary.project, summary.count) == ("pose_detection", 2)
+    assert summary.context == {"group_key": "pose"}
+
+
+def test_store_is_bounded():
+    """
+    超過容量時淘汰最舊的項目，並保留其抑制紀錄
+    """
+    dedup = AlertDeduplicator(window=60, max_entries=2)
+    dedup.check("water_spray", "a")
+    dedup.check("water_spray", "a")
+    dedup.check("water_spray", "b")
+    dedup.check("water_spray", "c")
+
+    assert dedup.stats()["entries"] == 2
+    assert [(s.message, s.count) for s in dedup.sweep()] == [("a", 1)]
@@ -0,0 +1,50 @@
+import pytest
+
+from utils.channels import compile_url_template, load_channel
+
+
+def test_url_template_is_compiled_once():
+    """
+    圖片網址樣板預先解析，只需填入請求欄位
+    """
+    build, fields = compile_url_template("https://img/rl{rolling_line}/{image_path}")
+
+    assert fields == ("rolling_line", "image_path")
+    url = build({"rolling_line": "2", "image_path": "a/b.png"})
+    assert url == "https://img/rl2/a/b.png"
+
+    build, fields = compile_url_template("https://img/pose?{timestamp}")
+    assert fields == ()
+    assert build({}).split("?")[1].isdigit()
+
+
+def test_channel_body_model_follows_image_url(monkeypatch):
+    """
+    請求格式由設定產生：message 加上圖片網址樣板用到的欄位
+    """
+    monkeypatch.setenv("GROUP_TEST", "C123")
+    channel = load_channel(
+        "dust_detection",
+        {
+            "ROUTE": "dust_detection_150",
+            "GROUP_ENV": "GROUP_TEST",
+            "SEND_VIA": ["line"],
+            "IMAGE_URL": "https://img/dust/{image_filename}",
+            "PRIORITY": 1,
+        },
+    )
+    body = channel.body_model(message="dust", image_filename="d.png")
+
+    assert channel.route == "dust_detection_150"
+    assert channel.group_id == "C123"
+    assert channel.image_url(body) == "https://img/dust/d.png"
+    assert set(channel.body_model.model_fields) == {"message", "image_filename"}
+
+
+def test_invalid_channel_config_fails_at_startup():
+    with pytest.raises(ValueError):
+        load_channel("x", {"GROUP_ENV": "G", "SEND_VIA": ["email"]})
+    with pytest.raises(ValueError):
+        load_channel("x", {"GROUP_ENV": "G", "SEND_VIA": ["ntfy"]})
+    with pytest.raises(ValueError):
+        load_channel("x", {"GROUP_ENV": "G", "SEND_VIA": ["line"], "RATE_LIMIT": "x"})
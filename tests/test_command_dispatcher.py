@@ -0,0 +1,28 @@
+from benchmarks.bench_dispatcher import legacy_parse, make_machines, make_messages
+from handlers.command_dispatcher import Command, CommandDispatcher
+
+
+def test_matches_legacy_dispatch_chain():
+    """
+    與原本 any(startswith) 判斷鏈結果相同
+    """
+    machine_config = make_machines(40)
+    dispatcher = CommandDispatcher(machine_config)
+    messages = make_messages(machine_config) + [
+        "(軋1)自訂時間影像",
+        "!(軋12)影像:20241023",
+        "(軋12)影像:20241023",
+        "!(軋1)最新影像",
+        "(軋99)最新影像",
+    ]
+
+    for message in messages:
+        parsed = dispatcher.parse(message)
+        expected = legacy_parse(message, machine_config)
+        assert ((parsed.command, parsed.machine) if parsed else None) == expected
+
+
+def test_argument_is_the_rest_of_the_message():
+    dispatcher = CommandDispatcher(["軋一", "軋二"])
+    assert dispatcher.parse("!(軋二)搜尋:20241023_10").argument == "20241023_10"
+    assert dispatcher.parse("(軋一)最新影像五張").command == Command.LATEST_IMAGE
@@ -0,0 +1,62 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from utils.event_dedup import MemorySeenStore, SQLiteSeenStore, WebhookEventFilter
+
+
+def _events(*ids):
+    return [SimpleNamespace(webhook_event_id=event_id) for event_id in ids]
+
+
+@pytest.mark.parametrize("storage_type", ["memory", "sqlite"])
+def test_seen_keys_expire_after_ttl(tmp_path, storage_type):
+    """
+    同一個 key 在 TTL 內只會被接受一次，過期後可再次接受
+    """
+    if storage_type == "memory":
+        store = MemorySeenStore()
+    else:
+        store = SQLiteSeenStore(str(tmp_path / "seen.db"))
+
+    assert store.add_many(["a", "b", "a"], ttl=0.2) == [True, True, False]
+    assert store.add_many(["a"], ttl=0.2) == [False]
+    time.sleep(0.25)
+    assert store.add_many(["a"], ttl=0.2) == [True]
+
+
+@pytest.mark.parametrize("storage_type", ["memory", "sqlite"])
+def test_store_evicts_oldest_keys(tmp_path, storage_type):
+    """
+    超過 MAX_ENTRIES 時移除最舊的 key
+    """
+    if storage_type == "memory":
+        store = MemorySeenStore(max_entries=2)
+    else:
+        store = SQLiteSeenStore(str(tmp_path / "seen.db"), max_entries=2)
+
+    for key in ("a", "b", "c"):
+        store.add_many([key], ttl=60)
+    assert store.add_many(["a", "c"], ttl=60) == [True, False]
+
+
+def test_redelivered_events_are_dropped_across_workers(tmp_path):
+    """
+    不同 worker 共用 SQLite，重送的事件只處理一次並計入命中次數
+    """
+    path = str(tmp_path / "seen.db")
+    first = WebhookEventFilter("ty_scrap", store=SQLiteSeenStore(path))
+    second = WebhookEventFilter("ty_scrap", store=SQLiteSeenStore(path))
+
+    async def run():
+        kept = await first.filter(_events("01H1", "01H2", None))
+        redelivered = await second.filter(_events("01H2", "01H3"))
+        return kept, redelivered
+
+    kept, redelivered = asyncio.run(run())
+
+    assert [e.webhook_event_id for e in kept] == ["01H1", "01H2", None]
+    assert [e.webhook_event_id for e in redelivered] == ["01H3"]
+    assert second.stats() == {"hits": 1, "misses": 1}
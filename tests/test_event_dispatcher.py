@@ -0,0 +1,110 @@
+import asyncio
+import threading
+import time
+
+from utils.event_dispatcher import ChatOrderedExecutor
+
+
+def _run(executor, submissions, timeout=2):
+    async def run():
+        await executor.start()
+        for key, func, args in submissions:
+            executor.submit(key, func, *args)
+        deadline = time.monotonic() + timeout
+        while executor.depth and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        await executor.stop()
+
+    asyncio.run(run())
+
+
+def test_events_keep_order_within_a_chat():
+    """
+    同一聊天室的事件依到達順序處理
+    """
+    seen = []
+    lock = threading.Lock()
+
+    def handle(chat, n):
+        time.sleep(0.001 * (n % 3))
+        with lock:
+            seen.append((chat, n))
+
+    submissions = [
+        (chat, handle, (chat, n)) for n in range(20) for chat in ("A", "B", "C")
+    ]
+    executor = ChatOrderedExecutor("test", workers=4)
+    _run(executor, submissions)
+
+    for chat in ("A", "B", "C"):
+        assert [n for c, n in seen if c == chat] == list(range(20))
+    assert executor.processed == 60
+    assert executor.stats()["depth"] == 0
+
+
+def test_chats_are_processed_concurrently():
+    """
+    不同聊天室的事件同時處理
+    """
+    executor = ChatOrderedExecutor("test", workers=4)
+    submissions = [(chat, time.sleep, (0.2,)) for chat in "ABCD"]
+
+    start = time.perf_counter()
+    _run(executor, submissions)
+    assert time.perf_counter() - start < 0.6
+    assert executor.max_age < 0.1
+
+
+def test_handlers_do_not_use_the_default_executor():
+    """
+    事件處理使用專屬的執行緒，不佔用 asyncio.to_thread 的預設執行緒池
+    """
+    threads = []
+    executor = ChatOrderedExecutor("test", workers=2)
+    submissions = [
+        (chat, lambda: threads.append(threading.current_thread().name), ())
+        for chat in "AB"
+    ]
+    _run(executor, submissions)
+
+    assert len(threads) == 2
+    assert all(name.startswith("test-event") for name in threads)
+    assert executor._threads is None
+
+
+def test_capacity_is_bounded():
+    executor = ChatOrderedExecutor("test", max_pending=2)
+    assert executor.has_capacity(2)
+    assert not executor.has_capacity(3)
+
+
+def test_stop_drains_queued_events():
+    """
+    關閉時先處理完已排入的事件 (已回覆 LINE 200)，逾時才放棄
+    """
+    seen = []
+    executor = ChatOrderedExecutor("test", workers=1, drain_timeout=2)
+
+    async def run():
+        await executor.start()
+        for n in range(5):
+            executor.submit("A", lambda n=n: (time.sleep(0.01), seen.append(n)))
+        await executor.stop()
+
+    asyncio.run(run())
+    assert seen == list(range(5))
+    assert executor.depth == 0
+
+
+def test_stop_gives_up_after_drain_timeout():
+    executor = ChatOrderedExecutor("test", workers=1, drain_timeout=0.05)
+
+    async def run():
+        await executor.start()
+        for _ in range(3):
+            executor.submit("A", time.sleep, 0.1)
+        await executor.stop()
+
+    asyncio.run(run())
+    assert executor.processed < 3
+    assert executor.depth == 0
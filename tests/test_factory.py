@@ -0,0 +1,27 @@
+import logging
+import time
+
+from utils.factory import setup_logger
+from utils.notification import Notifier
+
+
+def test_setup_logger_returns_cached_adapter():
+    assert setup_logger("tests.factory") is setup_logger("tests.factory")
+
+
+def test_constructing_notifiers_adds_no_handlers():
+    """
+    大量建立 Notifier 不會重複設定 logging 或新增 handler
+    """
+    logger = logging.getLogger("utils.notification")
+    handlers = list(logger.handlers)
+    root_handlers = list(logging.getLogger().handlers)
+
+    start = time.perf_counter()
+    for _ in range(10_000):
+        Notifier(project_name="test")
+    elapsed = time.perf_counter() - start
+
+    assert logger.handlers == handlers
+    assert logging.getLogger().handlers == root_handlers
+    assert elapsed < 0.5
@@ -0,0 +1,52 @@
+import asyncio
+
+from utils import http_pool
+from utils.http_pool import HttpPool
+
+
+def test_clients_are_shared_per_origin():
+    """
+    同一主機共用連線池，不同主機各自一個
+    """
+    pool = HttpPool({"HOSTS": {"ntfy.example.com": {"VERIFY": False}}})
+    a = pool.client("https://images.example.com/rl1/")
+    b = pool.client("https://images.example.com/rl2/20241023_10/")
+    c = pool.client("https://other.example.com/")
+    assert a is b
+    assert a is not c
+    asyncio.run(pool.aclose())
+
+
+def test_host_overrides_and_timeouts():
+    """
+    HOSTS 設定覆蓋預設值，connect 與 read timeout 分開設定
+    """
+    pool = HttpPool(
+        {"CONNECT_TIMEOUT": 1, "READ_TIMEOUT": 5, "HOSTS": {"ntfy.example.com": {}}}
+    )
+    kwargs = pool._client_kwargs("ntfy.example.com")
+    assert kwargs["timeout"].connect == 1
+    assert kwargs["timeout"].read == 5
+    assert kwargs["http2"] is True
+
+    pool = HttpPool({"HOSTS": {"ntfy.example.com": {"VERIFY": False}}})
+    assert pool._client_kwargs("ntfy.example.com")["verify"] is False
+    assert pool._client_kwargs("images.example.com")["verify"] is True
+
+
+def test_startup_closes_pool_created_before_lifespan():
+    """
+    lifespan 啟動前已建立的連線池在 startup 時關閉，不會遺留連線
+    """
+
+    async def run():
+        early = http_pool.get_pool()
+        client = early.async_client("https://images.example.com/")
+        await http_pool.startup()
+        replaced = http_pool.get_pool()
+        await http_pool.shutdown()
+        return early, client, replaced
+
+    early, client, replaced = asyncio.run(run())
+    assert replaced is not early
+    assert client.is_closed
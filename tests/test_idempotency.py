@@ -0,0 +1,180 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from utils.idempotency import (
+    IdempotencyCache,
+    MemoryIdempotencyStore,
+    SQLiteIdempotencyStore,
+)
+
+
+def _store(storage_type, tmp_path):
+    if storage_type == "memory":
+        return MemoryIdempotencyStore()
+    return SQLiteIdempotencyStore(str(tmp_path / "idempotency.db"))
+
+
+@pytest.mark.parametrize("storage_type", ["memory", "sqlite"])
+def test_completed_key_is_replayed_until_ttl(tmp_path, storage_type):
+    """
+    完成的請求在 TTL 內回傳相同回應，過期後可重新執行
+    """
+    store = _store(storage_type, tmp_path)
+
+    assert store.begin("k", "fp", lease=30) is None
+    in_flight = store.begin("k", "fp", lease=30)
+    assert in_flight.status is None
+
+    store.complete("k", 202, {"status": "accepted"}, ttl=0.2)
+    done = store.begin("k", "fp", lease=30)
+    assert (done.status, done.body) == (202, {"status": "accepted"})
+
+    time.sleep(0.25)
+    assert store.begin("k", "fp", lease=30) is None
+
+
+@pytest.mark.parametrize("storage_type", ["memory", "sqlite"])
+def test_abandoned_key_can_be_claimed_again(tmp_path, storage_type):
+    store = _store(storage_type, tmp_path)
+
+    assert store.begin("k", "fp", lease=30) is None
+    store.abandon("k")
+    assert store.begin("k", "fp", lease=30) is None
+
+
+def test_retry_waits_for_running_request():
+    """
+    第一次請求仍在處理時，重試等待其結果而不重新執行
+    """
+    cache = IdempotencyCache(MemoryIdempotencyStore())
+    calls = []
+
+    async def send():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return 202, {"status": "accepted"}
+
+    async def run():
+        return await asyncio.gather(
+            cache.run("k", "fp", send), cache.run("k", "fp", send)
+        )
+
+    first, retry = asyncio.run(run())
+
+    assert len(calls) == 1
+    assert first == (202, {"status": "accepted"}, False)
+    assert retry == (202, {"status": "accepted"}, True)
+    assert cache.stats() == {"hits": 1, "misses": 1, "waited": 1}
+
+
+def test_retry_waits_across_workers(tmp_path):
+    """
+    不同 worker 共用 SQLite，重試輪詢直到第一次請求完成
+    """
+    path = str(tmp_path / "idempotency.db")
+    first = IdempotencyCache(SQLiteIdempotencyStore(path), poll_interval=0.01)
+    second = IdempotencyCache(SQLiteIdempotencyStore(path), poll_interval=0.01)
+    calls = []
+
+    async def send():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return 202, {"status": "accepted"}
+
+    async def run():
+        original = asyncio.create_task(first.run("k", "fp", send))
+        await asyncio.sleep(0.02)
+        return await asyncio.gather(original, second.run("k", "fp", send))
+
+    _, retry = asyncio.run(run())
+
+    assert len(calls) == 1
+    assert retry == (202, {"status": "accepted"}, True)
+
+
+def test_failed_request_lets_retry_run():
+    """
+    第一次請求失敗時釋放 key，等待中的重試改為自行執行
+    """
+    cache = IdempotencyCache(MemoryIdempotencyStore())
+    attempts = []
+
+    async def send():
+        attempts.append(1)
+        await asyncio.sleep(0.05)
+        if len(attempts) == 1:
+            raise HTTPException(status_code=500)
+        return 202, {"status": "accepted"}
+
+    async def run():
+        return await asyncio.gather(
+            cache.run("k", "fp", send),
+            cache.run("k", "fp", send),
+            return_exceptions=True,
+        )
+
+    failed, retried = asyncio.run(run())
+
+    assert isinstance(failed, HTTPException)
+    assert retried == (202, {"status": "accepted"}, False)
+    assert len(attempts) == 2
+
+
+def test_key_reused_with_different_body_is_rejected():
+    cache = IdempotencyCache(MemoryIdempotencyStore())
+
+    async def send():
+        return 202, {"status": "accepted"}
+
+    async def run():
+        await cache.run("k", "fp", send)
+        await cache.run("k", "other", send)
+
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(run())
+    assert e.value.status_code == 422
+
+
+@pytest.mark.parametrize("storage_type", ["memory", "sqlite"])
+def test_store_never_evicts_running_requests(tmp_path, storage_type):
+    """
+    超過上限時只移除已完成的紀錄，處理中的請求不會被擠掉而重複執行
+    """
+    if storage_type == "memory":
+        store = MemoryIdempotencyStore(max_entries=2)
+    else:
+        store = SQLiteIdempotencyStore(str(tmp_path / "i.db"), max_entries=2)
+    assert store.begin("running", "fp", lease=30) is None
+    for key in ("a", "b", "c"):
+        assert store.begin(key, "fp", lease=30) is None
+        store.complete(key, 202, {}, ttl=60)
+
+    assert store.begin("running", "fp", lease=30).status is None
+    assert store.begin("c", "fp", lease=30).status == 202
+    assert store.begin("a", "fp", lease=30) is None
+
+
+def test_waiter_gets_409_when_first_request_is_cancelled():
+    """
+    第一次請求被取消時，等待中的重試收到可重試的 409 而非 CancelledError
+    """
+    cache = IdempotencyCache(MemoryIdempotencyStore())
+
+    async def send():
+        await asyncio.sleep(10)
+        return 202, {}
+
+    async def run():
+        original = asyncio.create_task(cache.run("k", "fp", send))
+        await asyncio.sleep(0.01)
+        retry = asyncio.create_task(cache.run("k", "fp", send))
+        await asyncio.sleep(0.01)
+        original.cancel()
+        with pytest.raises(HTTPException) as e:
+            await retry
+        return e.value.status_code
+
+    assert asyncio.run(run()) == 409
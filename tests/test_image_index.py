@@ -0,0 +1,78 @@
+from unittest.mock import patch
+
+import httpx
+
+from utils import fetch_url
+from utils.image_index import MachineImageIndex
+
+ROOT = ["../", "20241022_23/", "20241023_09/", "20241023_10/"]
+IMAGES = [
+    "../",
+    "2024-10-23_10_01_21_63_900_D25.png",
+    "2024-10-23_10_01_40_12_900_D25.png",
+    "2024-10-23_10_02_05_77_900_D25.png",
+]
+
+
+def test_full_scan_builds_date_hour_image_index():
+    """
+    完整掃描後可由記憶體取得日期、時段與每分鐘影像
+    """
+    with patch("utils.image_index.fetch_folder_links", return_value=ROOT), patch(
+        "utils.image_index.fetch_image_names", return_value=IMAGES
+    ):
+        index = MachineImageIndex("https://images/rl1/")
+        index.refresh()
+
+    assert index.ready
+    assert index.dates() == ["20241022", "20241023"]
+    assert index.hours("20241023") == ["20241023_09", "20241023_10"]
+    assert index.images("20241023_10") == [
+        "2024-10-23_10_01_40_12_900_D25.png",
+        "2024-10-23_10_02_05_77_900_D25.png",
+    ]
+
+
+def test_incremental_refresh_only_scans_recent_hours():
+    """
+    完整掃描之間只重新掃描目前與前一小時的資料夾
+    """
+    with patch("utils.image_index.fetch_folder_links", return_value=ROOT), patch(
+        "utils.image_index.fetch_image_names", return_value=IMAGES
+    ):
+        index = MachineImageIndex("https://images/rl1/", full_scan_interval=3600)
+        index.refresh()
+
+    version = index.version
+    with patch("utils.image_index.fetch_folder_links") as folder_links, patch(
+        "utils.image_index.fetch_image_names", return_value=IMAGES[:2]
+    ) as image_names:
+        index.refresh()
+
+    folder_links.assert_not_called()
+    assert image_names.call_count == 2
+    assert index.version > version
+
+
+def test_scans_leave_the_listing_cache_alone():
+    """
+    索引掃描不經過共用的 listing_cache，不會擠掉使用者請求的快取
+    """
+
+    def handler(request):
+        if request.url.path == "/rl1/":
+            hrefs = ROOT
+        else:
+            hrefs = IMAGES
+        body = "".join(f'<a href="{h}">{h}</a>' for h in hrefs)
+        return httpx.Response(200, text=body)
+
+    client = httpx.Client(transport=httpx.MockTransport(handler))
+    fetch_url.listing_cache.clear()
+    with patch("utils.fetch_url.get_pool") as get_pool:
+        get_pool.return_value.client.return_value = client
+        index = MachineImageIndex("https://images/rl1/")
+        index.refresh()
+
+    assert index.hours("20241023") == ["20241023_09", "20241023_10"]
+    assert len(fetch_url.listing_cache) == 0
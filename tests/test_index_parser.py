@@ -0,0 +1,32 @@
+from bs4 import BeautifulSoup
+
+from benchmarks.bench_index_parser import chunked, make_index_page
+from utils.index_parser import iter_hrefs
+
+
+def test_matches_beautifulsoup_across_chunk_boundaries():
+    """
+    任意切塊大小下結果皆與 BeautifulSoup 相同
+    """
+    data = make_index_page(200)
+    soup = BeautifulSoup(data.decode(), "html.parser")
+    expected = [link.get("href") for link in soup.find_all("a") if link.get("href")]
+
+    for size in (1, 7, 64, 4096):
+        assert list(iter_hrefs(chunked(data, size))) == expected
+
+
+def test_suffix_filter():
+    """
+    只回傳符合副檔名的連結
+    """
+    data = (
+        b'<a href="../">../</a><a href="20241023_10/">x</a>'
+        b"<a href='a.png'>a</a><A HREF=b.png>b</A><a href=\"c.txt\">c</a>"
+    )
+    assert list(iter_hrefs([data], ("/",))) == ["../", "20241023_10/"]
+    assert list(iter_hrefs([data], (".png",))) == ["a.png", "b.png"]
+
+
+def test_entities_are_unescaped():
+    assert list(iter_hrefs([b'<a href="a&amp;b.png">x</a>'])) == ["a&b.png"]
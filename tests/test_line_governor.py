@@ -0,0 +1,125 @@
+import asyncio
+import time
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from linebot.v3.messaging import ApiException
+
+from utils.line_governor import LineGovernor
+
+
+def _throttled(retry_after="0.1"):
+    error = ApiException(status=429, reason="Too Many Requests")
+    error.headers = {"Retry-After": retry_after}
+    return error
+
+
+def test_push_is_retried_after_retry_after_with_same_key():
+    """
+    推播遇到 429 時依 Retry-After 等待後以相同 retry key 重送，並降低速率
+    """
+    governor = LineGovernor("test", initial_rate=1000, max_rate=1000)
+    messaging_api = MagicMock()
+    messaging_api.push_message = AsyncMock(side_effect=[_throttled(), "ok"])
+
+    start = time.perf_counter()
+    assert asyncio.run(governor.apush(messaging_api, "request")) == "ok"
+
+    assert time.perf_counter() - start >= 0.1
+    first, second = messaging_api.push_message.await_args_list
+    assert first.kwargs["x_line_retry_key"] == second.kwargs["x_line_retry_key"]
+    stats = governor.stats()
+    assert (stats["throttled"], stats["retried"], stats["dropped"]) == (1, 1, 0)
+    assert stats["in_flight"] == 0
+    assert stats["rate"] == 501
+
+
+def test_reply_is_never_retried():
+    """
+    回覆的 reply token 只能用一次，遇到 429 直接放棄
+    """
+    governor = LineGovernor("test", initial_rate=1000)
+    reply = MagicMock(side_effect=_throttled())
+
+    with pytest.raises(ApiException):
+        governor.call(reply, "request")
+
+    reply.assert_called_once()
+    assert governor.stats()["dropped"] == 1
+    assert governor.stats()["retried"] == 0
+
+
+def test_retried_push_already_accepted_counts_as_sent():
+    """
+    重送時收到 409 表示先前已送達，不視為失敗
+    """
+    governor = LineGovernor("test", initial_rate=1000, default_retry_after=0.01)
+    messaging_api = MagicMock()
+    messaging_api.push_message = MagicMock(
+        side_effect=[ApiException(status=500), ApiException(status=409)]
+    )
+
+    governor.push(messaging_api, "request")
+
+    assert messaging_api.push_message.call_count == 2
+    assert governor.stats()["dropped"] == 0
+
+
+def test_redelivered_push_reuses_caller_retry_key():
+    """
+    呼叫端重送時沿用相同 retry key，LINE 回 409 即視為已送達
+    """
+    governor = LineGovernor("test", initial_rate=1000)
+    messaging_api = MagicMock()
+    messaging_api.push_message = AsyncMock(side_effect=["ok", ApiException(status=409)])
+
+    async def run():
+        await governor.apush(messaging_api, "request", retry_key="job-1")
+        await governor.apush(messaging_api, "request", retry_key="job-1")
+
+    asyncio.run(run())
+
+    keys = [
+        c.kwargs["x_line_retry_key"] for c in messaging_api.push_message.await_args_list
+    ]
+    assert keys == ["job-1", "job-1"]
+    assert governor.stats()["dropped"] == 0
+
+
+def test_cancelled_call_settles_in_flight():
+    """
+    呼叫被取消 (例如送出逾時) 時，in_flight 仍會歸零
+    """
+    governor = LineGovernor("test", initial_rate=1000)
+
+    async def hang():
+        await asyncio.sleep(10)
+
+    async def run():
+        for _ in range(3):
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(governor.acall(hang), 0.01)
+
+    asyncio.run(run())
+    assert governor.stats()["in_flight"] == 0
+
+
+def test_concurrency_is_capped():
+    """
+    同時進行的呼叫數不超過上限
+    """
+    governor = LineGovernor("test", max_concurrency=2, initial_rate=1000)
+    running = peak = 0
+
+    async def send():
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.02)
+        running -= 1
+
+    async def run():
+        await asyncio.gather(*(governor.acall(send) for _ in range(8)))
+
+    asyncio.run(run())
+    assert peak == 2
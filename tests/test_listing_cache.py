@@ -0,0 +1,92 @@
+import threading
+import time
+
+from utils.listing_cache import ListingCache, ListingResponse
+
+
+def test_fresh_entries_are_served_from_memory():
+    """
+    TTL 內重複查詢只抓取一次
+    """
+    cache = ListingCache(ttl=60)
+    calls = []
+
+    def loader(headers):
+        calls.append(headers)
+        return ListingResponse(hrefs=["../", "20241023_10/"])
+
+    assert cache.get("url", loader) == ["../", "20241023_10/"]
+    assert cache.get("url", loader) == ["../", "20241023_10/"]
+    assert len(calls) == 1
+    assert cache.hits == 1 and cache.misses == 1
+
+
+def test_stale_entries_are_revalidated():
+    """
+    過期後帶 ETag / Last-Modified 重新驗證，304 時沿用快取
+    """
+    cache = ListingCache(ttl=0)
+    calls = []
+
+    def loader(headers):
+        calls.append(headers)
+        if headers:
+            return ListingResponse(hrefs=None)
+        return ListingResponse(
+            hrefs=["a.png"], etag='"abc"', last_modified="Wed, 23 Oct 2024"
+        )
+
+    assert cache.get("url", loader) == ["a.png"]
+    assert cache.get("url", loader) == ["a.png"]
+    assert calls[1] == {
+        "If-None-Match": '"abc"',
+        "If-Modified-Since": "Wed, 23 Oct 2024",
+    }
+    assert cache.revalidated == 1
+
+
+def test_concurrent_misses_share_one_fetch():
+    """
+    同一 URL 同時 miss 時只送出一次請求
+    """
+    cache = ListingCache(ttl=60)
+    calls = []
+
+    def loader(headers):
+        calls.append(headers)
+        time.sleep(0.1)
+        return ListingResponse(hrefs=["a.png"])
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get("url", loader)))
+        for _ in range(10)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [["a.png"]] * 10
+    assert cache.coalesced == 9
+
+
+def test_least_recently_used_entry_is_evicted():
+    """
+    超過上限時淘汰最久未使用的項目
+    """
+    cache = ListingCache(ttl=60, max_entries=2)
+
+    def loader(headers):
+        return ListingResponse(hrefs=[])
+
+    cache.get("a", loader)
+    cache.get("b", loader)
+    cache.get("a", loader)
+    cache.get("c", loader)
+    assert len(cache) == 2
+    cache.get("a", loader)
+    assert cache.hits == 2
+    cache.get("b", loader)
+    assert cache.misses == 4
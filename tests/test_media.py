@@ -0,0 +1,187 @@
+import asyncio
+import io
+import os
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from utils.media import (
+    PreviewCache,
+    SnapshotStore,
+    preview_url,
+    render_preview,
+    sign,
+    verify,
+)
+
+SOURCE = "https://camera.example/rl1/20250101_08/a.png"
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 100
+
+
+def _fake_render(data, max_size, quality):
+    return data[:max_size]
+
+
+def test_preview_url_is_signed_and_falls_back_to_original(monkeypatch):
+    """
+    有設定 PUBLIC_BASE_URL 與簽章金鑰才改用預覽網址，否則沿用原圖
+    """
+    config = {"MEDIA": {"PUBLIC_BASE_URL": "https://bot.example/"}}
+    with patch("utils.media.load_config", return_value=config):
+        monkeypatch.delenv("MEDIA_SIGNING_KEY", raising=False)
+        assert preview_url(SOURCE) == SOURCE
+
+        monkeypatch.setenv("MEDIA_SIGNING_KEY", "secret")
+        url = urlparse(preview_url(SOURCE))
+        query = parse_qs(url.query)
+
+    assert url.netloc == "bot.example" and url.path == "/media/preview"
+    assert query["src"] == [SOURCE]
+    assert verify(SOURCE, query["sig"][0])
+    assert not verify(SOURCE + "x", query["sig"][0])
+
+
+def test_concurrent_misses_fetch_the_original_once(tmp_path):
+    """
+    同一張圖同時被要求多次，只抓取原圖一次，之後直接由磁碟提供
+    """
+    fetches = []
+
+    async def fetch(url):
+        fetches.append(url)
+        await asyncio.sleep(0.05)
+        return b"x" * 1000
+
+    cache = PreviewCache(str(tmp_path), fetch=fetch, render=_fake_render)
+
+    async def run():
+        paths = await asyncio.gather(*(cache.get(SOURCE) for _ in range(5)))
+        return paths + [await cache.get(SOURCE)]
+
+    paths = asyncio.run(run())
+
+    assert fetches == [SOURCE]
+    assert len(set(paths)) == 1
+    assert os.path.getsize(paths[0]) == 240
+    assert cache.stats()["hits"] == 1
+
+
+def test_cache_evicts_least_recently_served_previews(tmp_path):
+    """
+    超過容量上限時移除最久未使用的預覽
+    """
+
+    async def fetch(url):
+        return b"x" * 400
+
+    cache = PreviewCache(
+        str(tmp_path), max_bytes=1000, max_size=400, fetch=fetch, render=_fake_render
+    )
+
+    async def run():
+        first = await cache.get("https://a/1.png")
+        os.utime(first, (0, 0))
+        second = await cache.get("https://a/2.png")
+        third = await cache.get("https://a/3.png")
+        return first, second, third
+
+    first, second, third = asyncio.run(run())
+
+    assert not os.path.exists(first)
+    assert os.path.exists(second) and os.path.exists(third)
+    assert cache.stats()["evicted"] == 1
+    assert cache.stats()["bytes"] == 800
+
+
+def test_render_preview_fits_line_limits():
+    """
+    預覽圖縮小為 240px 以內的 JPEG
+    """
+    Image = pytest.importorskip("PIL.Image")
+    buffer = io.BytesIO()
+    Image.new("RGBA", (1920, 1080), (200, 50, 50, 255)).save(buffer, "PNG")
+
+    preview = Image.open(io.BytesIO(render_preview(buffer.getvalue())))
+
+    assert preview.format == "JPEG"
+    assert max(preview.size) == 240
+
+
+def test_preview_endpoint_rejects_unsigned_sources(client):
+    response = client.get("/media/preview", params={"src": SOURCE, "sig": "bad"})
+    assert response.status_code == 403
+
+
+def test_preview_endpoint_redirects_to_original_on_failure(
+    client, monkeypatch, tmp_path
+):
+    """
+    無法產生預覽時導向原圖
+    """
+    monkeypatch.setenv("MEDIA_SIGNING_KEY", "secret")
+
+    async def fetch(url):
+        raise OSError("camera host unreachable")
+
+    cache = PreviewCache(str(tmp_path), fetch=fetch)
+    with patch("routers.media.get_preview_cache", return_value=cache):
+        response = client.get(
+            "/media/preview",
+            params={"src": SOURCE, "sig": sign(SOURCE)},
+            follow_redirects=False,
+        )
+
+    assert response.status_code == 307
+    assert response.headers["location"] == SOURCE
+
+
+def test_snapshots_are_stored_once_by_content(tmp_path):
+    """
+    每個網址只抓取一次，內容相同的圖片只存一份，並回傳固定的本服務網址
+    """
+    fetches = []
+
+    async def fetch(url):
+        fetches.append(url)
+        return PNG
+
+    store = SnapshotStore(str(tmp_path), "https://bot.example/", fetch=fetch)
+    pose = "https://camera.example/pose_detection?1700000000"
+
+    async def run():
+        first = await asyncio.gather(*(store.resolve(pose) for _ in range(3)))
+        return first + [await store.resolve(pose), await store.resolve(SOURCE)]
+
+    urls = asyncio.run(run())
+
+    assert fetches == [pose, SOURCE]
+    assert len(set(urls)) == 1
+    assert urls[0].startswith("https://bot.example/media/snapshots/")
+    assert urls[0].endswith(".png")
+    assert len([p for p in os.listdir(tmp_path) if p.endswith(".png")]) == 1
+    assert store.local_path(urls[0]) is not None
+    # A URL that already points at a snapshot is kept as is
+    assert asyncio.run(store.resolve(urls[0])) == urls[0]
+
+
+def test_snapshot_falls_back_to_original_url(tmp_path):
+    """
+    未設定 PUBLIC_BASE_URL 或抓到的不是圖片時，沿用原本的網址
+    """
+
+    async def fetch(url):
+        return b"<html>502 Bad Gateway</html>"
+
+    disabled = SnapshotStore(str(tmp_path / "off"), fetch=fetch)
+    store = SnapshotStore(str(tmp_path / "on"), "https://bot.example", fetch=fetch)
+
+    assert asyncio.run(disabled.resolve(SOURCE)) == SOURCE
+    assert asyncio.run(store.resolve(SOURCE)) == SOURCE
+    assert store.stats()["failed"] == 1
+    assert os.listdir(tmp_path / "on") == []
+
+
+def test_snapshot_endpoint_rejects_unknown_names(client):
+    assert client.get("/media/snapshots/..%2Fconfig.yaml").status_code == 404
+    assert client.get(f"/media/snapshots/{'0' * 64}.png").status_code == 404
@@ -0,0 +1,117 @@
+import asyncio
+import os
+import socket
+import time
+from unittest.mock import patch
+
+from utils import metrics_server
+from utils.metrics import REGISTRY, Counter, Gauge, Histogram, Registry
+
+WEBHOOKS_URL = os.getenv("WEBHOOKS_URL_PUSHBOT")
+
+
+def test_histogram_renders_cumulative_buckets():
+    """
+    直方圖輸出累積的 bucket、sum 與 count
+    """
+    registry = Registry()
+    histogram = registry.register(
+        Histogram("latency_seconds", "Latency.", ("route",), buckets=(0.1, 1))
+    )
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(value, route="/a")
+
+    lines = registry.render().splitlines()
+    assert 'latency_seconds_bucket{route="/a",le="0.1"} 2' in lines
+    assert 'latency_seconds_bucket{route="/a",le="1.0"} 3' in lines
+    assert 'latency_seconds_bucket{route="/a",le="+Inf"} 4' in lines
+    assert 'latency_seconds_sum{route="/a"} 3.65' in lines
+    assert 'latency_seconds_count{route="/a"} 4' in lines
+
+
+def test_counters_and_function_gauges():
+    """
+    計數器累加，函式型 gauge 於輸出時才讀取
+    """
+    registry = Registry()
+    counter = registry.register(Counter("hits_total", "Hits.", ("cache",)))
+    gauge = registry.register(Gauge("depth", "Depth.", ("queue",)))
+    depth = [3]
+    counter.inc(cache="listing")
+    counter.inc(2, cache="listing")
+    gauge.set_function(lambda: depth[0], queue="spool")
+    depth[0] = 7
+
+    lines = registry.render().splitlines()
+    assert 'hits_total{cache="listing"} 3' in lines
+    assert 'depth{queue="spool"} 7' in lines
+    assert "# TYPE hits_total counter" in lines
+
+
+def test_registry_labels_are_added_to_every_sample():
+    registry = Registry()
+    registry.labels["worker"] = "1"
+    registry.register(Counter("hits_total", "Hits.", ("cache",))).inc(cache="a")
+    registry.register(Histogram("x_seconds", "X.", buckets=(1,))).observe(0.5)
+
+    lines = registry.render().splitlines()
+    assert 'hits_total{cache="a",worker="1"} 1' in lines
+    assert 'x_seconds_bucket{worker="1",le="1.0"} 1' in lines
+    assert 'x_seconds_count{worker="1"} 1' in lines
+
+
+def test_each_worker_serves_its_metrics_on_its_own_port():
+    """
+    設定 WORKER_PORT 時，各 worker 以第一個可用的埠提供自己的指標並帶 worker 標籤
+    """
+    taken = socket.socket()
+    taken.bind(("127.0.0.1", 0))
+    taken.listen()
+    base = taken.getsockname()[1]
+    config = {"METRICS": {"WORKER_PORT": base, "WORKER_HOST": "127.0.0.1"}}
+
+    async def run():
+        with patch("utils.metrics_server.load_config", return_value=config):
+            await metrics_server.startup()
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", base + 1)
+            writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+            await writer.drain()
+            response = await reader.read()
+            writer.close()
+        finally:
+            await metrics_server.shutdown()
+        return response.decode()
+
+    try:
+        response = asyncio.run(run())
+    finally:
+        taken.close()
+
+    assert response.startswith("HTTP/1.1 200 OK")
+    assert 'worker="1"' in response
+    assert "worker" not in REGISTRY.labels
+
+
+def test_observe_costs_microseconds():
+    """
+    每次記錄的成本維持在微秒等級
+    """
+    histogram = Histogram("x_seconds", "X.", ("route", "status"))
+    runs = 20000
+    start = time.perf_counter()
+    for i in range(runs):
+        histogram.observe(0.01, route="/notify", status=202)
+    assert (time.perf_counter() - start) / runs < 20e-6
+
+
+def test_metrics_endpoint_reports_route_latency(client):
+    client.get(f"{WEBHOOKS_URL}/notify/unknown")
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'route="unmatched",status="404"' in response.text
+    assert 'queue_depth{queue="spool"}' in response.text
+    assert 'line_event_oldest_age_seconds{bot="ths_bot"} 0' in response.text
+    assert 'cache_hit_ratio{cache="listing"}' in response.text
@@ -0,0 +1,60 @@
+import asyncio
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+
+# Imported lazily by Notifier; loaded here so it stays out of the timings
+import linebot.v3.messaging  # noqa: F401
+
+from utils.notification import Alert, Notifier
+
+
+def test_send_runs_line_and_ntfy_concurrently():
+    """
+    LINE 與 ntfy 同時送出，總耗時應接近較慢的一方而非兩者相加
+    """
+
+    async def slow_call(*args, **kwargs):
+        await asyncio.sleep(0.2)
+        return MagicMock(raise_for_status=MagicMock())
+
+    messaging_api = MagicMock()
+    messaging_api.push_message = AsyncMock(side_effect=slow_call)
+    ntfy_client = MagicMock()
+    ntfy_client.post = AsyncMock(side_effect=slow_call)
+
+    notifier = Notifier(project_name="test", messaging_api=messaging_api)
+    pool = MagicMock()
+    pool.async_client.return_value = ntfy_client
+    with patch("utils.notification.get_pool", return_value=pool):
+        start = time.perf_counter()
+        asyncio.run(notifier.send("group", "topic", "Test Message", "https://x/a.png"))
+        elapsed = time.perf_counter() - start
+
+    messaging_api.push_message.assert_awaited_once()
+    ntfy_client.post.assert_awaited_once()
+    assert elapsed < 0.35
+
+
+def test_send_batch_combines_alerts_into_one_push():
+    """
+    多筆警報合併為一次 LINE 推播與一則 ntfy 摘要
+    """
+    messaging_api = MagicMock()
+    messaging_api.push_message = AsyncMock()
+    ntfy_client = MagicMock()
+    ntfy_client.post = AsyncMock(return_value=MagicMock())
+    pool = MagicMock()
+    pool.async_client.return_value = ntfy_client
+
+    alerts = [Alert(f"fire {i}", f"https://x/{i}.png") for i in range(6)]
+    notifier = Notifier(project_name="test", messaging_api=messaging_api)
+    with patch("utils.notification.get_pool", return_value=pool):
+        failed = asyncio.run(notifier.send_batch("group", "topic", alerts))
+
+    assert failed == []
+    (request,), _ = messaging_api.push_message.await_args
+    assert len(request.messages) == 5
+    assert request.messages[0].text.splitlines()[5] == "6. fire 5"
+    _, kwargs = ntfy_client.post.await_args
+    assert kwargs["headers"]["Attach"] == "https://x/0.png"
+    assert b"6. fire 5" in kwargs["content"]
@@ -0,0 +1,149 @@
+import asyncio
+import multiprocessing
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi import Request
+
+from utils.metrics import REGISTRY
+
+from utils.rate_limit import (
+    Limiter,
+    MemoryBucketStorage,
+    RateLimitExceeded,
+    SQLiteBucketStorage,
+    parse_rate,
+)
+
+
+def test_parse_rate():
+    assert parse_rate("5/minute") == (5, 60)
+    assert parse_rate("10/3minute") == (10, 180)
+    with pytest.raises(ValueError):
+        parse_rate("ten per minute")
+
+
+@pytest.mark.parametrize("storage_type", ["memory", "sqlite"])
+def test_bucket_allows_burst_then_rejects(tmp_path, storage_type):
+    """
+    額度用完後拒絕並回傳需等待的秒數
+    """
+    if storage_type == "memory":
+        storage = MemoryBucketStorage()
+    else:
+        storage = SQLiteBucketStorage(str(tmp_path / "ratelimit.db"))
+    rate = 3 / 60
+
+    results = [storage.acquire("key", 3, rate) for _ in range(4)]
+    assert [allowed for allowed, _ in results] == [True, True, True, False]
+    assert 0 < results[-1][1] <= 20
+    assert storage.acquire("other", 3, rate)[0]
+
+
+def _hammer(path, attempts, results):
+    storage = SQLiteBucketStorage(path)
+    allowed = sum(
+        storage.acquire("route:ip", 10, 10 / 3600)[0] for _ in range(attempts)
+    )
+    results.put(allowed)
+
+
+def test_limit_holds_across_worker_processes(tmp_path):
+    """
+    4 個 worker 共用同一份額度，總共只放行 10 次
+    """
+    path = str(tmp_path / "ratelimit.db")
+    SQLiteBucketStorage(path).close()
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    workers = [ctx.Process(target=_hammer, args=(path, 25, results)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=60)
+
+    assert sum(results.get(timeout=5) for _ in workers) == 10
+
+
+def test_limiter_decorator_raises_429():
+    """
+    超過限制時 decorator 拋出 429 並帶 Retry-After
+    """
+    limiter = Limiter(key_func=lambda request: "1.2.3.4", storage=MemoryBucketStorage())
+    rejected = MagicMock()
+
+    @limiter.limit("2/minute", on_reject=rejected)
+    async def endpoint(request: Request):
+        return "ok"
+
+    request = MagicMock(spec=Request)
+    request.scope = {}
+
+    async def run():
+        assert await endpoint(request=request) == "ok"
+        assert await endpoint(request=request) == "ok"
+        with pytest.raises(RateLimitExceeded) as exc:
+            await endpoint(request=request)
+        return exc.value
+
+    exc = asyncio.run(run())
+    assert exc.status_code == 429
+    assert exc.headers["Retry-After"] == "30"
+    rejected.assert_called_once()
+    assert limiter.rejected == 1
+
+
+def test_bulk_consume_shares_buckets_with_routes():
+    """
+    批次請求逐筆扣除與單筆路由相同的額度
+    """
+    limiter = Limiter(key_func=lambda request: "1.2.3.4", storage=MemoryBucketStorage())
+
+    @limiter.limit("2/minute")
+    async def endpoint(request: Request):
+        return "ok"
+
+    request = MagicMock(spec=Request)
+    request.scope = {}
+    scope = Limiter.scope_of(endpoint)
+
+    async def run():
+        await endpoint(request=request)
+        return await limiter.consume(
+            request,
+            [
+                (scope, "2/minute", "/endpoint"),
+                (scope, "2/minute", "/endpoint"),
+                ("other", "1/minute", "/other"),
+            ],
+        )
+
+    assert asyncio.run(run()) == [True, False, True]
+    assert limiter.rejected == 1
+
+
+def test_rejections_are_labelled_by_route_path():
+    """
+    單筆路由與批次扣額被拒時，以相同的路由路徑計數
+    """
+    limiter = Limiter(key_func=lambda request: "1.2.3.4", storage=MemoryBucketStorage())
+
+    @limiter.limit("1/minute")
+    async def endpoint(request: Request):
+        return "ok"
+
+    request = MagicMock(spec=Request)
+    request.scope = {"route": SimpleNamespace(path="/notify/labelled")}
+    scope = Limiter.scope_of(endpoint)
+
+    async def run():
+        await endpoint(request=request)
+        with pytest.raises(RateLimitExceeded):
+            await endpoint(request=request)
+        await limiter.consume(request, [(scope, "1/minute", "/notify/labelled")])
+
+    asyncio.run(run())
+    lines = REGISTRY.render().splitlines()
+    assert 'rate_limit_rejections_total{route="/notify/labelled"} 2' in lines
+    assert not any(scope in line for line in lines)
@@ -0,0 +1,22 @@
+from serve import parse_args
+
+
+def test_reload_runs_a_single_worker():
+    """
+    開發模式 (--reload) 只啟動一個 worker
+    """
+    assert parse_args(["--reload", "--workers", "4"]).workers == 1
+
+
+def test_workers_default_to_web_concurrency(monkeypatch):
+    monkeypatch.setenv("WEB_CONCURRENCY", "3")
+    args = parse_args([])
+    assert (args.workers, args.reload, args.port) == (3, False, 6000)
+
+
+def test_workers_default_to_one(monkeypatch):
+    """
+    未設定 WEB_CONCURRENCY 時只啟動一個 worker (部分狀態為各 worker 獨立)
+    """
+    monkeypatch.delenv("WEB_CONCURRENCY", raising=False)
+    assert parse_args([]).workers == 1
@@ -0,0 +1,275 @@
+import asyncio
+import sqlite3
+import time
+
+from utils.spool import DeliveryPolicy, NotificationSpool, SpoolWorkerPool
+
+
+def test_queued_notifications_survive_restart(tmp_path):
+    """
+    重新開啟 spool 後，尚未送出的通知仍可被取出
+    """
+    path = str(tmp_path / "spool.db")
+    spool = NotificationSpool(path)
+    spool.enqueue("spark_detection", {"message": "fire"}, ["line", "ntfy"])
+    spool.close()
+
+    spool = NotificationSpool(path)
+    (job,) = spool.claim()
+    assert job.project == "spark_detection"
+    assert job.payload == {"message": "fire"}
+    assert job.channels == ["line", "ntfy"]
+    assert spool.claim() == []
+
+
+def test_expired_lease_is_reclaimed(tmp_path):
+    """
+    worker 中斷後租約到期，通知會再次被取出
+    """
+    spool = NotificationSpool(str(tmp_path / "spool.db"), lease_seconds=0)
+    job_id = spool.enqueue("dust_detection", {"message": "dust"}, ["line"])
+    assert [job.id for job in spool.claim()] == [job_id]
+    assert [job.id for job in spool.claim()] == [job_id]
+
+
+def test_workers_retry_only_failed_channels(tmp_path):
+    """
+    失敗的管道以退避重試，成功的管道不重送
+    """
+    spool = NotificationSpool(str(tmp_path / "spool.db"))
+    spool.enqueue("water_spray", {"message": "spray"}, ["line", "ntfy"])
+    calls = []
+
+    async def deliver(jobs):
+        calls.append(list(jobs[0].channels))
+        return ["ntfy"] if len(calls) == 1 else []
+
+    async def run():
+        pool = SpoolWorkerPool(
+            spool, deliver, workers=2, backoff_base=0.01, poll_interval=0.01
+        )
+        await pool.start()
+        for _ in range(100):
+            if spool.depth() == 0:
+                break
+            await asyncio.sleep(0.02)
+        await pool.stop()
+
+    asyncio.run(run())
+    assert calls == [["line", "ntfy"], ["ntfy"]]
+    assert spool.depth() == 0
+
+
+def test_worker_survives_transient_claim_error(tmp_path):
+    """
+    取出通知時 SQLite 暫時錯誤 (例如 database is locked)，worker 仍繼續送出
+    """
+    spool = NotificationSpool(str(tmp_path / "spool.db"))
+    spool.enqueue("water_spray", {"message": "spray"}, ["line"])
+    claim, failures, delivered = spool.claim, [], []
+
+    def flaky_claim(exclude=()):
+        if not failures:
+            failures.append(1)
+            raise sqlite3.OperationalError("database is locked")
+        return claim(exclude)
+
+    spool.claim = flaky_claim
+
+    async def deliver(jobs):
+        delivered.extend(job.payload["message"] for job in jobs)
+        return []
+
+    async def run():
+        pool = SpoolWorkerPool(spool, deliver, workers=1, poll_interval=0.01)
+        await pool.start()
+        for _ in range(100):
+            if spool.depth() == 0:
+                break
+            await asyncio.sleep(0.02)
+        await pool.stop()
+
+    asyncio.run(run())
+    assert failures == [1]
+    assert delivered == ["spray"]
+    assert spool.depth() == 0
+
+
+def test_job_is_buried_after_max_attempts(tmp_path):
+    """
+    超過最大重試次數後不再重送
+    """
+    spool = NotificationSpool(str(tmp_path / "spool.db"))
+    spool.enqueue("pose_detection", {"message": "pose"}, ["line"])
+
+    async def deliver(jobs):
+        return jobs[0].channels
+
+    async def run():
+        pool = SpoolWorkerPool(
+            spool, deliver, max_attempts=1, backoff_base=0.01, poll_interval=0.01
+        )
+        await pool.start()
+        for _ in range(100):
+            if spool.depth() == 0:
+                break
+            await asyncio.sleep(0.02)
+        await pool.stop()
+
+    asyncio.run(run())
+    assert spool.depth() == 0
+    assert spool.claim() == []
+
+
+def test_dead_jobs_are_purged_by_age_and_count(tmp_path):
+    """
+    失敗的通知只保留設定的時間與筆數，最舊的先移除
+    """
+    spool = NotificationSpool(str(tmp_path / "spool.db"), max_dead=2)
+    ids = [spool.enqueue("pose_detection", {"message": i}, ["line"]) for i in range(3)]
+    for job_id in ids:
+        spool.bury(job_id, ["line"], "502")
+
+    assert spool.dead_depth() == 2 and spool.depth() == 0
+    remaining = spool._conn.execute(
+        "SELECT id FROM notifications WHERE dead = 1 ORDER BY id"
+    ).fetchall()
+    assert [row[0] for row in remaining] == ids[1:]
+
+    spool.dead_retention = 0
+    spool.purge_dead()
+    assert spool.dead_depth() == 0
+
+
+def test_burst_is_claimed_as_one_batch(tmp_path):
+    """
+    同一專案在合併視窗內的通知一次取出
+    """
+    spool = NotificationSpool(str(tmp_path / "spool.db"), max_batch=4)
+    for i in range(3):
+        spool.enqueue(
+            "spark_detection", {"message": f"fire {i}"}, ["line"], 0.05, "spark"
+        )
+    spool.enqueue("dust_detection", {"message": "dust"}, ["line"])
+
+    assert [job.project for job in spool.claim()] == ["dust_detection"]
+    assert spool.claim() == []
+    time.sleep(0.06)
+    jobs = spool.claim()
+    assert [job.payload["message"] for job in jobs] == ["fire 0", "fire 1", "fire 2"]
+    assert spool.claim() == []
+
+
+def test_failed_batch_is_retried_as_the_same_set(tmp_path):
+    """
+    失敗的批次以相同的工作與 retry key 重送，之後排入的通知另成一批
+    """
+    spool = NotificationSpool(str(tmp_path / "spool.db"), max_batch=4)
+    for message in ("a", "b"):
+        spool.enqueue("spark_detection", {"message": message}, ["line"], 0, "spark")
+    first = spool.claim()
+    for job in first:
+        spool.retry(job.id, ["line"], 0, "502")
+    spool.enqueue("spark_detection", {"message": "c"}, ["line"], 0, "spark")
+
+    retried = spool.claim()
+    assert [job.payload["message"] for job in retried] == ["a", "b"]
+    assert {job.retry_key for job in first} == {retried[0].retry_key}
+    assert retried[0].retry_key == retried[1].retry_key
+    (later,) = spool.claim()
+    assert later.payload["message"] == "c"
+    assert later.retry_key != retried[0].retry_key
+
+
+def test_full_batch_is_released_before_window(tmp_path):
+    """
+    批次已滿時不必等待合併視窗結束
+    """
+    spool = NotificationSpool(str(tmp_path / "spool.db"), max_batch=2)
+    spool.enqueue("spark_detection", {"message": "a"}, ["line"], 60, "spark")
+    assert spool.claim() == []
+    spool.enqueue("spark_detection", {"message": "b"}, ["line"], 60, "spark")
+    assert [job.payload["message"] for job in spool.claim()] == ["a", "b"]
+
+
+def test_higher_priority_is_claimed_first(tmp_path):
+    """
+    高優先權的通知先取出，並可略過指定專案
+    """
+    spool = NotificationSpool(str(tmp_path / "spool.db"))
+    spool.enqueue("water_spray", {"message": "spray"}, ["line"])
+    spool.enqueue("pose_detection", {"message": "pose"}, ["line"], priority=2)
+    spool.enqueue("spark_detection", {"message": "fire"}, ["line"], priority=1)
+
+    assert spool.claim(exclude=["pose_detection"])[0].project == "spark_detection"
+    assert spool.claim()[0].project == "pose_detection"
+    assert spool.claim()[0].project == "water_spray"
+
+
+def test_policies_cap_concurrency_and_time_out_deliveries(tmp_path):
+    """
+    各專案依設定限制同時送出數量，逾時的送出視為失敗並重試
+    """
+    spool = NotificationSpool(str(tmp_path / "spool.db"))
+    for i in range(4):
+        spool.enqueue("dust_detection", {"message": f"dust {i}"}, ["line"])
+    spool.enqueue("pose_detection", {"message": "pose"}, ["line"])
+    active, peak, attempts = [0], [0], []
+
+    async def deliver(jobs):
+        attempts.append(jobs[0].project)
+        first_pose = attempts.count("pose_detection") == 1
+        if jobs[0].project == "pose_detection" and first_pose:
+            await asyncio.sleep(1)
+        active[0] += 1
+        peak[0] = max(peak[0], active[0])
+        await asyncio.sleep(0.02)
+        active[0] -= 1
+        return []
+
+    async def run():
+        pool = SpoolWorkerPool(
+            spool,
+            deliver,
+            workers=4,
+            backoff_base=0.01,
+            poll_interval=0.01,
+            policies={
+                "dust_detection": DeliveryPolicy(max_concurrency=1),
+                "pose_detection": DeliveryPolicy(timeout=0.05),
+            },
+        )
+        await pool.start()
+        for _ in range(200):
+            if spool.depth() == 0:
+                break
+            await asyncio.sleep(0.02)
+        await pool.stop()
+
+    asyncio.run(run())
+    assert spool.depth() == 0
+    assert peak[0] <= 2
+    assert attempts.count("dust_detection") == 4
+    assert attempts.count("pose_detection") == 2
+
+
+def test_enqueue_many_inserts_in_one_transaction(tmp_path):
+    spool = NotificationSpool(str(tmp_path / "spool.db"))
+    ids = spool.enqueue_many(
+        [
+            {
+                "project": "water_spray",
+                "payload": {"message": "a"},
+                "channels": ["line"],
+            },
+            {
+                "project": "pose_detection",
+                "payload": {"message": "b"},
+                "channels": ["line"],
+                "priority": 1,
+            },
+        ]
+    )
+
+    assert len(ids) == 2 and spool.depth() == 2
+    assert spool.claim()[0].project == "pose_detection"
@@ -0,0 +1,56 @@
+import os
+import subprocess
+import sys
+
+# Cumulative import time of main, in seconds. Measured at about 0.5 s; the
+# LINE SDK alone used to add 1.1 s, so going over this means something heavy
+# moved back to import time.
+IMPORT_BUDGET = 1.5
+
+# Imported in startup() or on first use, never by ``import main``
+DEFERRED_MODULES = (
+    "linebot.v3.messaging",
+    "linebot.v3.webhooks",
+    "handlers.ty_scrap_handler",
+    "logstash",
+    "bs4",
+)
+
+
+def _import_times(code: str):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        env=os.environ.copy(),
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, module = line.split("|")
+        if cumulative.strip().isdigit():
+            times[module.strip()] = int(cumulative) / 1e6
+    return times, result.stdout
+
+
+def test_import_main_stays_within_budget():
+    """
+    import main 不載入 LINE SDK 等重型模組，且總時間在預算內
+    """
+    times, _ = _import_times("import main")
+
+    assert [m for m in DEFERRED_MODULES if m in times] == []
+    assert times["main"] < IMPORT_BUDGET
+
+
+def test_import_main_does_not_configure_logging():
+    """
+    import 階段不設定 logging，留到 lifespan 或第一筆 log
+    """
+    _, stdout = _import_times(
+        "import main, utils.factory as f; print(f._logging_configured)"
+    )
+    assert stdout.strip() == "False"
@@ -0,0 +1,32 @@
+import pytest
+
+from utils.stores import create_store, open_sqlite
+
+
+def _create(uri):
+    return create_store(
+        uri,
+        "test",
+        memory=lambda: ("memory",),
+        sqlite=lambda path: ("sqlite", path),
+        redis=lambda url: ("redis", url),
+    )
+
+
+def test_uri_selects_backend():
+    """
+    依 URI 選擇儲存後端，sqlite 取得檔案路徑 (四個斜線為絕對路徑)
+    """
+    assert _create("memory://") == ("memory",)
+    assert _create("sqlite:///spool/a.db") == ("sqlite", "spool/a.db")
+    assert _create("sqlite:////var/a.db") == ("sqlite", "/var/a.db")
+    assert _create("redis://cache:6379/0") == ("redis", "redis://cache:6379/0")
+    with pytest.raises(ValueError, match="Unsupported test storage"):
+        _create("postgres://db")
+
+
+def test_open_sqlite_creates_directory_in_wal_mode(tmp_path):
+    conn = open_sqlite(str(tmp_path / "nested" / "a.db"), "CREATE TABLE t (x);")
+
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert conn.execute("SELECT count(*) FROM t").fetchone()[0] == 0
@@ -1,6 +1,9 @@
+import asyncio
 from unittest.mock import patch
 
 import os
+from routers import ths_bot
+from utils.spool import SpoolJob
 from .utils import generate_signature
 
 WEBHOOKS_URL = os.getenv("WEBHOOKS_URL_PUSHBOT")
@@ -24,12 +27,179 @@ def test_callback(client):
 def test_push_message_success(client):
     payload = {"rolling_line": "1", "message": "Test Message", "image_path": "test.png"}
 
-    with patch("routers.ths_bot.send_notification") as mock_send:
-        mock_send.return_value = None
+    with patch("routers.ths_bot.spool.enqueue") as mock_enqueue:
+        mock_enqueue.return_value = 1
         response = client.post(f"{WEBHOOKS_URL}/notify/ty_scrap", json=payload)
 
-        assert response.status_code == 200
+        assert response.status_code == 202
         assert response.json() == {
-            "status": "success",
-            "message": "Notification sent successfully",
+            "status": "accepted",
+            "message": "Notification queued",
         }
+        mock_enqueue.assert_called_once()
+
+
+def test_duplicate_notification_is_suppressed(client):
+    payload = {"message": "Spark detected", "image_filename": "spark.png"}
+
+    with patch("routers.ths_bot.spool.enqueue") as mock_enqueue:
+        ths_bot.deduplicator.clear()
+        first = client.post(f"{WEBHOOKS_URL}/notify/spark_detection", json=payload)
+        second = client.post(f"{WEBHOOKS_URL}/notify/spark_detection", json=payload)
+
+        assert first.json()["status"] == "accepted"
+        assert second.status_code == 202
+        assert second.json()["status"] == "suppressed"
+        mock_enqueue.assert_called_once()
+
+
+def test_alerts_differing_in_machine_number_are_both_queued(client):
+    """
+    只差在機台編號的警報不視為重複，兩筆都排入 spool
+    """
+    with patch("routers.ths_bot.spool.enqueue") as mock_enqueue:
+        ths_bot.deduplicator.clear()
+        responses = [
+            client.post(
+                f"{WEBHOOKS_URL}/notify/spark_detection",
+                json={"message": f"Spark on rl{n}", "image_filename": "spark.png"},
+            )
+            for n in (1, 2)
+        ]
+
+    assert [r.json()["status"] for r in responses] == ["accepted", "accepted"]
+    assert mock_enqueue.call_count == 2
+
+
+def test_retry_after_failed_enqueue_is_not_suppressed(client):
+    """
+    寫入 spool 失敗時不記錄重複抑制，客戶端重試仍會排入
+    """
+    payload = {"message": "Spark detected", "image_filename": "spark.png"}
+
+    with patch("routers.ths_bot.spool.enqueue") as mock_enqueue:
+        ths_bot.deduplicator.clear()
+        mock_enqueue.side_effect = [OSError("disk full"), 1]
+        failed = client.post(f"{WEBHOOKS_URL}/notify/spark_detection", json=payload)
+        retry = client.post(f"{WEBHOOKS_URL}/notify/spark_detection", json=payload)
+
+    assert failed.status_code == 500
+    assert retry.status_code == 202
+    assert retry.json()["status"] == "accepted"
+    assert mock_enqueue.call_count == 2
+
+
+def test_batch_notifications_report_a_result_per_item(client):
+    """
+    批次通知一次寫入 spool，並逐筆回報結果
+    """
+    spark = {
+        "channel": "spark_detection",
+        "message": "Spark",
+        "image_filename": "s.png",
+    }
+    notifications = [
+        spark,
+        {"channel": "pose_detection", "message": "Pose"},
+        {"channel": "water_spray", "message": "Spray"},
+        {"channel": "unknown", "message": "?"},
+        spark,
+    ]
+
+    with patch("routers.ths_bot.spool.enqueue_many") as mock_enqueue_many:
+        ths_bot.deduplicator.clear()
+        response = client.post(
+            f"{WEBHOOKS_URL}/notify/batch", json={"notifications": notifications}
+        )
+
+    assert response.status_code == 202
+    assert [r["status"] for r in response.json()["results"]] == [
+        "accepted",
+        "accepted",
+        "invalid",
+        "invalid",
+        "suppressed",
+    ]
+    (entries,), _ = mock_enqueue_many.call_args
+    assert [e["project"] for e in entries] == ["spark_detection", "pose_detection"]
+    assert entries[0]["payload"]["image_url"].endswith("/spark_detection/s.png")
+
+
+def test_notification_retry_with_idempotency_key_is_replayed(client):
+    """
+    帶相同 Idempotency-Key 的重試回傳第一次的回應，不會再次排入 spool
+    """
+    payload = {"message": "Pose detected"}
+    headers = {"Idempotency-Key": "pose-0001"}
+
+    with patch("routers.ths_bot.spool.enqueue") as mock_enqueue:
+        ths_bot.deduplicator.clear()
+        first = client.post(
+            f"{WEBHOOKS_URL}/notify/pose_detection", json=payload, headers=headers
+        )
+        ths_bot.deduplicator.clear()
+        retry = client.post(
+            f"{WEBHOOKS_URL}/notify/pose_detection", json=payload, headers=headers
+        )
+        conflict = client.post(
+            f"{WEBHOOKS_URL}/notify/pose_detection",
+            json={"message": "Other"},
+            headers=headers,
+        )
+
+    assert first.status_code == retry.status_code == 202
+    accepted = {"status": "accepted", "message": "Notification queued"}
+    assert first.json() == accepted
+    assert retry.json() == accepted
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+    assert conflict.status_code == 422
+    mock_enqueue.assert_called_once()
+
+
+def test_spool_batch_is_pushed_with_its_retry_key(client):
+    """
+    spool 批次以其保存的 retry key 送出，重送時 LINE 可辨識為同一則推播
+    """
+    jobs = [
+        SpoolJob(
+            1,
+            "spark_detection",
+            {"message": "a", "group_key": "spark_detection", "image_url": None},
+            ["line"],
+            0,
+            1.0,
+            "key-1",
+        ),
+        SpoolJob(
+            2,
+            "spark_detection",
+            {"message": "b", "group_key": "spark_detection", "image_url": None},
+            ["line"],
+            0,
+            1.0,
+            "key-1",
+        ),
+    ]
+
+    with patch("routers.ths_bot.Notifier.send_batch") as mock_send_batch:
+        mock_send_batch.return_value = []
+        assert asyncio.run(ths_bot._deliver(jobs)) == []
+
+    assert mock_send_batch.call_args.kwargs["retry_key"] == "key-1"
+
+
+def test_notification_is_logged_with_structured_fields(client):
+    """
+    通知內容以 dict 放入 log 的 extra 欄位，logstash 可保留各欄位
+    """
+    payload = {"message": "Spray on", "image_filename": "spray.png"}
+
+    with patch("routers.ths_bot.spool.enqueue"), patch.object(
+        ths_bot.logger, "info"
+    ) as mock_info:
+        ths_bot.deduplicator.clear()
+        client.post(f"{WEBHOOKS_URL}/notify/water_spray", json=payload)
+
+    extra = mock_info.call_args_list[0].kwargs["extra"]
+    assert extra == {"project": "water_spray", "notification": payload}
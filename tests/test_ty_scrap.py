@@ -1,4 +1,6 @@
+import json
 import os
+from unittest.mock import patch
 
 from .utils import generate_signature
 
@@ -37,3 +39,39 @@ def test_callback_invalid_signature(client):
 
     assert response.status_code == 400
     assert response.json() == {"error": "Invalid signature"}
+
+
+def test_redelivered_event_is_handled_once(client):
+    """
+    LINE 重送相同 webhookEventId 的事件時直接回應 200，不再處理
+    """
+    event = {
+        "type": "message",
+        "mode": "active",
+        "timestamp": 1700000000000,
+        "source": {"type": "user", "userId": "U1"},
+        "webhookEventId": "01HREDELIVERED000000000000",
+        "deliveryContext": {"isRedelivery": False},
+        "replyToken": "r",
+        "message": {"id": "1", "type": "text", "quoteToken": "q", "text": "hello"},
+    }
+    submitted = []
+
+    for is_redelivery in (False, True):
+        event["deliveryContext"]["isRedelivery"] = is_redelivery
+        body_str = json.dumps({"destination": "U0", "events": [event]})
+        with patch(
+            "routers.ty_scrap.event_executor.submit",
+            side_effect=lambda *args: submitted.append(args),
+        ):
+            response = client.post(
+                url=f"{WEBHOOKS_URL}/line",
+                content=body_str,
+                headers={
+                    "Content-Type": "application/json",
+                    "X-Line-Signature": generate_signature(CHANNEL_SECRET, body_str),
+                },
+            )
+        assert response.status_code == 200
+
+    assert len(submitted) == 1
@@ -0,0 +1,73 @@
+from unittest.mock import MagicMock
+
+from handlers.ty_scrap_handler import TyScrapBotHandler
+
+
+class FakeIndex:
+    def __init__(self):
+        self.listed_dates = ["20241022", "20241023"]
+
+    def dates(self):
+        return list(self.listed_dates)
+
+
+class FakeIndexer:
+    def __init__(self):
+        self.index = FakeIndex()
+
+    def get(self, key):
+        return self.index
+
+
+def _event(text):
+    event = MagicMock()
+    event.message.text = text
+    event.reply_token = "reply-token"
+    event.source.user_id = "U1"
+    return event
+
+
+def _sent_messages(messaging_api):
+    return messaging_api.api_client.call_api.call_args.kwargs["body"]["messages"]
+
+
+def test_static_menu_is_sent_pre_serialized():
+    """
+    功能選單直接送出預先序列化的內容
+    """
+    messaging_api = MagicMock()
+    handler = TyScrapBotHandler(messaging_api)
+
+    assert handler.handle_text(_event("!")) == "OK"
+    messages = _sent_messages(messaging_api)
+    assert messages[0]["type"] == "template"
+    assert [a["text"] for a in messages[0]["template"]["actions"]] == [
+        "!最新影像",
+        "!最新影像五張",
+        "!自訂時間影像",
+    ]
+    messaging_api.reply_message.assert_not_called()
+
+
+def test_carousel_is_memoized_by_listing_content():
+    """
+    日期清單未變時重複使用同一份日期選單，其他資料夾更新不影響
+    """
+    messaging_api = MagicMock()
+    indexer = FakeIndexer()
+    handler = TyScrapBotHandler(messaging_api, image_indexer=indexer)
+    key = next(iter(handler.machine_config))
+
+    handler.handle_text(_event(f"({key})自訂時間影像"))
+    first = _sent_messages(messaging_api)
+    handler.handle_text(_event(f"({key})自訂時間影像"))
+    assert _sent_messages(messaging_api) is first
+    assert handler.carousel_stats() == {"hits": 1, "misses": 1}
+
+    buttons = first[0]["contents"]["contents"][0]["footer"]["contents"]
+    assert [b["action"]["label"] for b in buttons] == ["20241022", "20241023"]
+
+    indexer.index.listed_dates.append("20241024")
+    handler.handle_text(_event(f"({key})自訂時間影像"))
+    assert _sent_messages(messaging_api) is not first
+    assert handler.carousel_stats() == {"hits": 1, "misses": 2}
@@ -0,0 +1,136 @@
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Collection, Dict, Hashable, List, Optional, Tuple
+
+_WHITESPACE = re.compile(r"\s+")
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+
+
+def normalize_message(message: str, fold_numbers: bool = False) -> str:
+    """
+    Folds case and whitespace, so repeats of one alert map to the same key.
+    With ``fold_numbers`` every number (timestamps, scores, but also machine
+    and line numbers) becomes ``#`` as well.
+    """
+    message = _WHITESPACE.sub(" ", message.strip()).casefold()
+    return _NUMBER.sub("#", message) if fold_numbers else message
+
+
+@dataclass
+class SuppressedAlerts:
+    project: str
+    message: str
+    count: int
+    context: dict = field(default_factory=dict)
+
+
+@dataclass
+class _Entry:
+    first_seen: float
+    message: str
+    context: dict
+    suppressed: int = 0
+
+
+class AlertDeduplicator:
+    """
+    Suppresses repeats of an alert, keyed by (project, normalized message,
+    image URL), for ``window`` seconds after the first one. Numbers in the
+    message are ignored only for the projects in ``fold_numbers``.
+
+    Entries live in a bounded map that evicts the oldest window first;
+    expired or evicted entries that suppressed something are handed out by
+    ``sweep()`` so the caller can send one "N similar alerts suppressed"
+    follow-up. Not thread-safe: it is meant to
+    be used from the event loop only.
+    """
+
+    def __init__(
+        self,
+        window: float = 60,
+        max_entries: int = 1024,
+        fold_numbers: Collection[str] = (),
+    ):
+        self.window = window
+        self.max_entries = max_entries
+        self.fold_numbers = frozenset(fold_numbers)
+        self.allowed = 0
+        self.suppressed = 0
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._closed: List[Tuple[Hashable, _Entry]] = []
+
+    def key(self, project: str, message: str, image_url: Optional[str] = None) -> Tuple:
+        fold_numbers = project in self.fold_numbers
+        return (project, normalize_message(message, fold_numbers), image_url or None)
+
+    def check(
+        self,
+        project: str,
+        message: str,
+        image_url: Optional[str] = None,
+        context: Optional[dict] = None,
+    ) -> bool:
+        """
+        Returns True when the alert should be sent, False when it repeats one
+        sent less than ``window`` seconds ago.
+        """
+        now = time.monotonic()
+        key = self.key(project, message, image_url)
+        entry = self._entries.get(key)
+        if entry is not None and now - entry.first_seen < self.window:
+            entry.suppressed += 1
+            self.suppressed += 1
+            return False
+
+        if entry is not None:
+            del self._entries[key]
+            self._close(key, entry)
+        self._entries[key] = _Entry(now, message, context or {})
+        while len(self._entries) > self.max_entries:
+            self._close(*self._entries.popitem(last=False))
+        self.allowed += 1
+        return True
+
+    def release(self, project: str, message: str, image_url: Optional[str] = None):
+        """
+        Forgets the window opened by a check() whose alert could not be
+        queued, so a retry of it is not suppressed.
+        """
+        if self._entries.pop(self.key(project, message, image_url), None):
+            self.allowed -= 1
+
+    def _close(self, key: Hashable, entry: _Entry):
+        if entry.suppressed:
+            self._closed.append((key, entry))
+
+    def sweep(self) -> List[SuppressedAlerts]:
+        """
+        Closes every expired window and returns the suppression summaries.
+        """
+        now = time.monotonic()
+        # Entries are ordered by first_seen, oldest first
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if now - entry.first_seen < self.window:
+                break
+            del self._entries[key]
+            self._close(key, entry)
+
+        closed, self._closed = self._closed, []
+        return [
+            SuppressedAlerts(key[0], entry.message, entry.suppressed, entry.context)
+            for key, entry in closed
+        ]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "allowed": self.allowed,
+            "suppressed": self.suppressed,
+        }
+
+    def clear(self):
+        self._entries.clear()
+        self._closed.clear()
@@ -0,0 +1,119 @@
+import os
+import string
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple, Type
+
+from pydantic import BaseModel, create_model
+
+from utils.rate_limit import parse_rate
+
+SEND_VIA = ("line", "ntfy")
+
+# Template fields filled in by the server rather than the request body
+_BUILTIN_FIELDS: Dict[str, Callable[[], object]] = {
+    "timestamp": lambda: int(time.time()),
+}
+
+
+def compile_url_template(template: str) -> Tuple[Callable[[dict], str], Tuple[str]]:
+    """
+    Parses a ``str.format`` style template once. Returns a builder taking the
+    request fields, and the names of the request fields the template uses;
+    ``{timestamp}`` is filled in with the current Unix time.
+    """
+    parts = []
+    fields = []
+    for literal, name, spec, conversion in string.Formatter().parse(template):
+        if literal:
+            parts.append((False, literal))
+        if name is None:
+            continue
+        if spec or conversion or not name.isidentifier():
+            raise ValueError(f"Unsupported field {{{name}}} in {template!r}")
+        parts.append((True, name))
+        if name not in _BUILTIN_FIELDS and name not in fields:
+            fields.append(name)
+
+    def build(values: dict) -> str:
+        return "".join(
+            str(values[p] if p in values else _BUILTIN_FIELDS[p]()) if is_field else p
+            for is_field, p in parts
+        )
+
+    return build, tuple(fields)
+
+
+@dataclass(frozen=True)
+class NotificationChannel:
+    """
+    One alert source of the push bot and how its notifications are sent.
+    """
+
+    name: str
+    route: str
+    group_id: Optional[str]
+    ntfy_topic: Optional[str]
+    send_via: Tuple[str, ...]
+    rate_limit: str
+    body_model: Type[BaseModel]
+    build_image_url: Optional[Callable[[dict], str]] = None
+    max_concurrency: Optional[int] = None
+    timeout: Optional[float] = None
+    priority: int = 0
+    coalesce_window: float = 0
+    dedup_fold_numbers: bool = False
+
+    def image_url(self, body: BaseModel) -> Optional[str]:
+        if self.build_image_url is None:
+            return None
+        return self.build_image_url(body.model_dump())
+
+
+def _model_name(name: str) -> str:
+    return "".join(part.title() for part in name.split("_")) + "Notification"
+
+
+def load_channel(name: str, spec: dict) -> NotificationChannel:
+    """
+    Builds a channel from its entry under CHANNELS in config.yaml; the LINE
+    group and ntfy topic are read from the environment variables it names.
+    """
+    send_via = tuple(spec.get("SEND_VIA", SEND_VIA))
+    unknown = set(send_via) - set(SEND_VIA)
+    if unknown or not send_via:
+        raise ValueError(f"Channel {name}: SEND_VIA must be a subset of {SEND_VIA}")
+    if "ntfy" in send_via and not spec.get("NTFY_ENV"):
+        raise ValueError(f"Channel {name}: NTFY_ENV is required to send via ntfy")
+
+    rate_limit = spec.get("RATE_LIMIT", "10/3minute")
+    parse_rate(rate_limit)
+
+    build_image_url, fields = None, ()
+    if spec.get("IMAGE_URL"):
+        build_image_url, fields = compile_url_template(spec["IMAGE_URL"])
+    body_model = create_model(
+        _model_name(name),
+        message=(str, ...),
+        **{field: (str, ...) for field in fields},
+    )
+
+    return NotificationChannel(
+        name=name,
+        route=spec.get("ROUTE", name),
+        group_id=os.getenv(spec["GROUP_ENV"]),
+        ntfy_topic=os.getenv(spec["NTFY_ENV"]) if spec.get("NTFY_ENV") else None,
+        send_via=send_via,
+        rate_limit=rate_limit,
+        body_model=body_model,
+        build_image_url=build_image_url,
+        max_concurrency=spec.get("MAX_CONCURRENCY"),
+        timeout=spec.get("TIMEOUT"),
+        priority=spec.get("PRIORITY", 0),
+        coalesce_window=spec.get("COALESCE_WINDOW", 0),
+        dedup_fold_numbers=spec.get("DEDUP_FOLD_NUMBERS", False),
+    )
+
+
+def load_channels(config: Optional[dict]) -> Dict[str, NotificationChannel]:
+    return {name: load_channel(name, spec) for name, spec in (config or {}).items()}
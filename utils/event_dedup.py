@@ -0,0 +1,221 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Sequence
+
+from utils.factory import load_config
+from utils.metrics import WEBHOOK_DUPLICATES
+from utils.stores import create_store, open_sqlite, redis_from_uri
+
+
+class MemorySeenStore:
+    """
+    Seen keys in process memory, bounded to ``max_entries`` (oldest first).
+    Only consistent within one worker.
+    """
+
+    blocking = False
+
+    def __init__(self, max_entries: int = 10_000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._expires: "OrderedDict[str, float]" = OrderedDict()
+
+    def add_many(self, keys: Sequence[str], ttl: float) -> List[bool]:
+        """
+        Records ``keys`` for ``ttl`` seconds. Returns, per key, True when it
+        was not already recorded.
+        """
+        now = time.time()
+        added = []
+        with self._lock:
+            for key in keys:
+                expires = self._expires.get(key)
+                if expires is not None and expires > now:
+                    added.append(False)
+                    continue
+                self._expires[key] = now + ttl
+                self._expires.move_to_end(key)
+                added.append(True)
+            while len(self._expires) > self.max_entries:
+                self._expires.popitem(last=False)
+        return added
+
+    def reset(self):
+        with self._lock:
+            self._expires.clear()
+
+    def close(self):
+        pass
+
+
+_SEEN_SCHEMA = """
+CREATE TABLE IF NOT EXISTS seen (
+    key TEXT PRIMARY KEY,
+    expires REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_seen_expires ON seen (expires);
+"""
+
+# Inserts the key, or takes over an expired row; returns nothing when an
+# unexpired row already exists. One statement, so it is atomic across workers.
+_ADD_KEY = """
+INSERT INTO seen (key, expires) VALUES (:key, :expires)
+ON CONFLICT (key) DO UPDATE SET expires = :expires WHERE expires <= :now
+RETURNING key
+"""
+
+# Keys share one TTL, so the earliest expiry is the oldest key
+_EVICT_OLDEST = """
+DELETE FROM seen WHERE key IN (
+    SELECT key FROM seen ORDER BY expires DESC LIMIT -1 OFFSET :max_entries
+)
+"""
+
+
+class SQLiteSeenStore:
+    """
+    Seen keys in a SQLite file shared by every worker on the host, bounded
+    to ``max_entries`` (oldest first). Expired rows are purged every
+    ``purge_every`` additions.
+    """
+
+    blocking = True
+
+    def __init__(self, path: str, max_entries: int = 10_000, purge_every: int = 1000):
+        self.path = path
+        self.max_entries = max_entries
+        self.purge_every = purge_every
+        self._added = 0
+        self._lock = threading.Lock()
+        self._conn = open_sqlite(path, _SEEN_SCHEMA)
+
+    def add_many(self, keys: Sequence[str], ttl: float) -> List[bool]:
+        now = time.time()
+        params = {"expires": now + ttl, "now": now}
+        with self._lock:
+            added = [
+                self._conn.execute(_ADD_KEY, {**params, "key": key}).fetchone()
+                is not None
+                for key in keys
+            ]
+            if any(added):
+                self._conn.execute(_EVICT_OLDEST, {"max_entries": self.max_entries})
+            self._added += len(keys)
+            if self._added >= self.purge_every:
+                self._added = 0
+                self._conn.execute("DELETE FROM seen WHERE expires <= ?", (now,))
+        return added
+
+    def reset(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM seen")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class RedisSeenStore:
+    """
+    Seen keys in a Redis compatible server (SET NX EX). Requires the
+    optional ``redis`` package.
+    """
+
+    blocking = True
+
+    def __init__(self, url: str):
+        self._redis = redis_from_uri(url, "WEBHOOK_DEDUP.STORAGE_URI")
+
+    def add_many(self, keys: Sequence[str], ttl: float) -> List[bool]:
+        pipeline = self._redis.pipeline(transaction=False)
+        for key in keys:
+            pipeline.set(f"seen:{key}", 1, nx=True, ex=max(1, int(ttl)))
+        return [bool(result) for result in pipeline.execute()]
+
+    def reset(self):
+        for key in self._redis.scan_iter("seen:*"):
+            self._redis.delete(key)
+
+    def close(self):
+        self._redis.close()
+
+
+def create_seen_store(uri: str, max_entries: int = 10_000):
+    return create_store(
+        uri,
+        "webhook event",
+        memory=lambda: MemorySeenStore(max_entries),
+        sqlite=lambda path: SQLiteSeenStore(path, max_entries),
+        redis=RedisSeenStore,
+    )
+
+
+class WebhookEventFilter:
+    """
+    Drops webhook events whose ``webhookEventId`` was already accepted
+    within ``ttl`` seconds, so LINE's redeliveries of an event we are still
+    (or already done) handling are acknowledged without running it again.
+    Events without an ID always pass.
+    """
+
+    def __init__(self, name: str, store=None, ttl: float = 600):
+        self.name = name
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._store = store
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = get_seen_store()
+        return self._store
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+    async def filter(self, events: Sequence) -> List:
+        ids = [getattr(event, "webhook_event_id", None) for event in events]
+        keys = [f"{self.name}:{event_id}" for event_id in ids if event_id]
+        if not keys:
+            return list(events)
+        if self.store.blocking:
+            added = await asyncio.to_thread(self.store.add_many, keys, self.ttl)
+        else:
+            added = self.store.add_many(keys, self.ttl)
+
+        fresh = iter(added)
+        kept = [e for e, event_id in zip(events, ids) if not event_id or next(fresh)]
+        duplicates = len(events) - len(kept)
+        self.hits += duplicates
+        self.misses += len(keys) - duplicates
+        if duplicates:
+            WEBHOOK_DUPLICATES.inc(duplicates, bot=self.name)
+        return kept
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_seen_store():
+    """
+    Process-wide seen-set selected by WEBHOOK_DEDUP.STORAGE_URI.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            config = load_config().get("WEBHOOK_DEDUP", {})
+            _store = create_seen_store(
+                config.get("STORAGE_URI", "memory://"),
+                max_entries=config.get("MAX_ENTRIES", 10_000),
+            )
+        return _store
+
+
+def webhook_event_filter(name: str) -> WebhookEventFilter:
+    return WebhookEventFilter(
+        name, ttl=load_config().get("WEBHOOK_DEDUP", {}).get("TTL", 600)
+    )
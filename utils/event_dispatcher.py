@@ -0,0 +1,188 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from typing import Callable, Deque, Dict, Hashable, List, Optional, Tuple
+
+from utils.factory import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class InvalidSignature(ValueError):
+    pass
+
+
+class AsyncWebhookHandler:
+    """
+    Wraps the SDK WebhookHandler and splits handle() into parse() and
+    dispatch(), so the callback can verify the signature and queue events
+    without running the handlers inside the request.
+
+    The SDK webhook package is imported on construction, which happens in
+    the routers' startup(), to keep it out of ``import main``.
+    """
+
+    def __init__(self, channel_secret: str):
+        from linebot.v3 import WebhookHandler
+        from linebot.v3.exceptions import InvalidSignatureError
+        from linebot.v3.webhooks import MessageEvent
+
+        self._handler = WebhookHandler(channel_secret)
+        self._invalid_signature = InvalidSignatureError
+        self._message_event = MessageEvent
+
+    def add(self, event, message=None):
+        return self._handler.add(event, message=message)
+
+    def parse(self, body: str, signature: str):
+        try:
+            return self._handler.parser.parse(body, signature, as_payload=True)
+        except self._invalid_signature as e:
+            raise InvalidSignature(str(e)) from e
+
+    def dispatch(self, event):
+        handlers = self._handler._handlers
+        func = None
+        if isinstance(event, self._message_event):
+            func = handlers.get(
+                f"{type(event).__name__}_{type(event.message).__name__}"
+            )
+        if func is None:
+            func = handlers.get(type(event).__name__, self._handler._default)
+        if func is not None:
+            func(event)
+
+
+def chat_key(event) -> Optional[str]:
+    """
+    Group, room or user id of the chat an event belongs to.
+    """
+    source = getattr(event, "source", None)
+    for attr in ("group_id", "room_id", "user_id"):
+        value = getattr(source, attr, None)
+        if value:
+            return value
+    return None
+
+
+class ChatOrderedExecutor:
+    """
+    Runs blocking event handlers on worker threads, concurrently across chats
+    but strictly in arrival order within one chat.
+
+    Every chat has its own pending deque; a chat id sits in the ready queue at
+    most once, so only one worker processes a given chat at a time. Handlers
+    run on a thread pool of ``workers`` threads owned by the executor, so slow
+    ones never hold up the loop's default executor used by the other
+    ``asyncio.to_thread`` callers (spool, rate limiter, dedup stores).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        workers: int = 8,
+        max_pending: int = 1000,
+        drain_timeout: float = 5,
+    ):
+        self.name = name
+        self.workers = workers
+        self.max_pending = max_pending
+        self.drain_timeout = drain_timeout
+        self.processed = 0
+        self.failed = 0
+        self.max_age = 0.0
+        self._depth = 0
+        self._pending: Dict[Hashable, Deque[Tuple[float, Callable, tuple]]] = {}
+        self._ready: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._threads: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def depth(self) -> int:
+        return self._depth
+
+    def oldest_age(self) -> float:
+        now = time.monotonic()
+        heads = [items[0][0] for items in self._pending.values() if items]
+        return now - min(heads) if heads else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "depth": self._depth,
+            "chats": len(self._pending),
+            "oldest_age": self.oldest_age(),
+            "max_age": self.max_age,
+            "processed": self.processed,
+            "failed": self.failed,
+        }
+
+    def has_capacity(self, count: int = 1) -> bool:
+        return self._depth + count <= self.max_pending
+
+    def submit(self, key: Hashable, func: Callable, *args):
+        items = self._pending.get(key)
+        if items is None:
+            items = self._pending[key] = deque()
+            self._ready.put_nowait(key)
+        items.append((time.monotonic(), func, args))
+        self._depth += 1
+
+    async def start(self):
+        self._ready = asyncio.Queue()
+        self._threads = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix=f"{self.name}-event"
+        )
+        self._tasks = [
+            asyncio.create_task(self._run(), name=f"{self.name}-event-worker-{i}")
+            for i in range(self.workers)
+        ]
+
+    async def stop(self):
+        """
+        Gives queued events, already acknowledged to LINE, up to
+        ``drain_timeout`` seconds to finish before cancelling the workers.
+        """
+        deadline = time.monotonic() + self.drain_timeout
+        while self._depth and self._tasks and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._depth:
+            logger.warning(
+                f"Dropping {self._depth} queued webhook events on shutdown",
+                extra={"project": self.name},
+            )
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._threads is not None:
+            # A handler still running cannot be interrupted; don't block on it
+            self._threads.shutdown(wait=False, cancel_futures=True)
+            self._threads = None
+        self._pending.clear()
+        self._depth = 0
+
+    async def _run(self):
+        while True:
+            key = await self._ready.get()
+            items = self._pending[key]
+            enqueued_at, func, args = items[0]
+            self.max_age = max(self.max_age, time.monotonic() - enqueued_at)
+            try:
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(self._threads, func, *args)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(
+                    f"Error handling webhook event: {e}",
+                    exc_info=True,
+                    extra={"project": self.name},
+                )
+            finally:
+                items.popleft()
+                self._depth -= 1
+                if items:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._pending[key]
@@ -1,7 +1,7 @@
 import logging
 import logging.config
+import threading
 import yaml
-import logstash
 import os
 
 CONFIG_PATH = os.getenv("CONFIG_PATH", "config/config.yaml")
@@ -9,6 +9,11 @@ LOGGING_CONFIG_PATH = os.getenv("LOGGING_CONFIG_PATH", "config/logging.yaml")
 
 _loaded_config = None
 
+_logging_lock = threading.RLock()
+_logging_configured = False
+_logstash_handler = None
+_adapters = {}
+
 
 def load_config(path=None):
     global _loaded_config
@@ -27,37 +32,78 @@ def load_config(path=None):
 
 
 class ProjectLoggerAdapter(logging.LoggerAdapter):
-    def process(self, msg, kwargs):
-        project = kwargs.get("extra", {}).get("project", "unknown")
-        return msg, {**kwargs, "extra": {"project": project}}
+    def log(self, level, msg, *args, **kwargs):
+        if not _logging_configured:
+            configure_logging()
+        super().log(level, msg, *args, **kwargs)
 
+    def process(self, msg, kwargs):
+        extra = kwargs.get("extra") or {}
+        return msg, {
+            **kwargs,
+            "extra": {**extra, "project": extra.get("project", "unknown")},
+        }
 
-def setup_logger(name):
-    config = load_config()
-    logstash_config = config.get("LOGSTASH", {})
 
-    try:
-        with open(LOGGING_CONFIG_PATH, "r") as f:
-            logging_config = yaml.safe_load(f.read())
-            logging.config.dictConfig(logging_config)
-    except FileNotFoundError:
-        raise Exception(f"Logging config file '{LOGGING_CONFIG_PATH}' not found.")
-    except yaml.YAMLError:
-        raise Exception(
-            f"Error parsing the logging config file '{LOGGING_CONFIG_PATH}'."
-        )
+def configure_logging():
+    """
+    Applies config/logging.yaml and creates the shared Logstash handler.
+    Runs once per process, from the app lifespan or the first log record;
+    later calls are no-ops.
+    """
+    global _logging_configured, _logstash_handler
+    with _logging_lock:
+        if _logging_configured:
+            return
 
-    logger = logging.getLogger(name)
+        config = load_config()
+        logstash_config = config.get("LOGSTASH", {})
 
-    if logstash_config:
         try:
-            logstash_handler = logstash.TCPLogstashHandler(
-                logstash_config.get("HOST", "localhost"),
-                logstash_config.get("PORT", 5959),
-                version=1,
+            with open(LOGGING_CONFIG_PATH, "r") as f:
+                logging_config = yaml.safe_load(f.read())
+                logging.config.dictConfig(logging_config)
+        except FileNotFoundError:
+            raise Exception(f"Logging config file '{LOGGING_CONFIG_PATH}' not found.")
+        except yaml.YAMLError:
+            raise Exception(
+                f"Error parsing the logging config file '{LOGGING_CONFIG_PATH}'."
             )
-            logger.addHandler(logstash_handler)
-        except Exception as e:
-            print(f"Failed to configure Logstash handler: {e}")
 
-    return ProjectLoggerAdapter(logger, {})
+        if logstash_config:
+            try:
+                import logstash
+
+                _logstash_handler = logstash.TCPLogstashHandler(
+                    logstash_config.get("HOST", "localhost"),
+                    logstash_config.get("PORT", 5959),
+                    version=1,
+                )
+            except Exception as e:
+                print(f"Failed to configure Logstash handler: {e}")
+            else:
+                for adapter in _adapters.values():
+                    adapter.logger.addHandler(_logstash_handler)
+
+        _logging_configured = True
+
+
+def setup_logger(name):
+    """
+    Returns the cached ProjectLoggerAdapter for ``name``. Logging itself is
+    configured lazily, so module-level loggers cost nothing at import time;
+    the logger gets the shared Logstash handler once that has happened.
+    """
+    adapter = _adapters.get(name)
+    if adapter is not None:
+        return adapter
+
+    with _logging_lock:
+        adapter = _adapters.get(name)
+        if adapter is None:
+            logger = logging.getLogger(name)
+            if _logstash_handler is not None:
+                logger.addHandler(_logstash_handler)
+            adapter = ProjectLoggerAdapter(logger, {})
+            _adapters[name] = adapter
+        return adapter
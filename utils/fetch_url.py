@@ -1,21 +1,57 @@
-import requests
-from bs4 import BeautifulSoup
-from typing import List, Optional
+import httpx
+from typing import Dict, List, Optional, Tuple
 
-from utils.factory import setup_logger
+from utils.factory import setup_logger, load_config
+from utils.http_pool import get_pool
+from utils.index_parser import iter_hrefs
+from utils.listing_cache import ListingCache, ListingResponse
+from utils.metrics import observe_outbound, register_cache
 
 logger = setup_logger(__name__)
 
-_HTML_PARSER = "html.parser"
+_FOLDER_SUFFIX = "/"
 _PNG_EXTENSION = ".png"
 
+_cache_config = load_config().get("LISTING_CACHE", {})
+listing_cache = ListingCache(
+    ttl=_cache_config.get("TTL", 10),
+    max_entries=_cache_config.get("MAX_ENTRIES", 256),
+)
+register_cache("listing", listing_cache.stats)
+
+
+def _load_listing(
+    url: str, headers: Dict[str, str], suffixes: Optional[Tuple[str, ...]]
+) -> ListingResponse:
+    with observe_outbound("listing"), get_pool().client(url).stream(
+        "GET", url, headers=headers
+    ) as response:
+        if response.status_code == 304:
+            return ListingResponse(hrefs=None)
+        response.raise_for_status()
+        return ListingResponse(
+            hrefs=list(iter_hrefs(response.iter_bytes(), suffixes)),
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+        )
+
 
-def _fetch_html_soup(url: str) -> Optional[BeautifulSoup]:
+def _fetch_hrefs(
+    url: str, suffixes: Optional[Tuple[str, ...]] = None, cache: bool = True
+) -> Optional[List[str]]:
+    """
+    Returns the hrefs of a directory index page ending with one of
+    ``suffixes`` (all of them when None), served from listing_cache when the
+    page was fetched recently. With ``cache=False`` the page is fetched
+    directly and listing_cache is left untouched.
+    """
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        return BeautifulSoup(response.text, _HTML_PARSER)
-    except requests.RequestException as exc:
+        if not cache:
+            return _load_listing(url, {}, suffixes).hrefs
+        return listing_cache.get(
+            (url, suffixes), lambda headers: _load_listing(url, headers, suffixes)
+        )
+    except httpx.HTTPError as exc:
         logger.error(f"Failed to fetch {url}: {exc}", extra={"project": "fetch_folder"})
         return None
 
@@ -25,12 +61,7 @@ def fetch_last_5_images(machine: str) -> List[str]:
     Retrieves the latest 5 image_paths from the machine
     Example: "20241023_10/2024-10-23_10_01_21_63_900_D25.png"
     """
-    endpoint_map = {
-        "rl1": "https://rebar-detection-sec1-ty.tunghosteel.com/get_last_5_images",
-        "rl2": "https://rebar-detection-sec2-ty.tunghosteel.com/get_last_5_images",
-    }
-
-    url = endpoint_map.get(machine)
+    url = load_config().get("LAST_IMAGES_ENDPOINTS", {}).get(machine)
     if not url:
         logger.warning(
             f"Unknown machine identifier: {machine}", extra={"project": "fetch_folder"}
@@ -38,9 +69,10 @@ def fetch_last_5_images(machine: str) -> List[str]:
         return []
 
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        data = response.json()
+        with observe_outbound("last_5_images"):
+            response = get_pool().client(url).get(url)
+            response.raise_for_status()
+            data = response.json()
         latest_5_images = [
             item.get("path", "").lstrip("/static/images/") for item in data
         ]
@@ -49,7 +81,7 @@ def fetch_last_5_images(machine: str) -> List[str]:
             extra={"project": "fetch_folder"},
         )
         return latest_5_images
-    except requests.RequestException as exc:
+    except httpx.HTTPError as exc:
         logger.error(
             f"Failed to fetch images from {url}: {exc}",
             extra={"project": "fetch_folder"},
@@ -57,40 +89,31 @@ def fetch_last_5_images(machine: str) -> List[str]:
         return []
 
 
-def fetch_folder_links(url: str) -> List[str]:
-    soup = _fetch_html_soup(url)
-    if soup is None:
+def fetch_folder_links(url: str, cache: bool = True) -> List[str]:
+    hrefs = _fetch_hrefs(url, (_FOLDER_SUFFIX,), cache)
+    if hrefs is None:
         logger.warning(
             "Failed to retrieve HTML content.", extra={"project": "fetch_folder"}
         )
         return []
 
-    return [
-        link.get("href")
-        for link in soup.find_all("a")
-        if link.get("href", "").endswith("/")
-    ]
+    return list(hrefs)
 
 
-def fetch_image_names(url: str) -> List[str]:
-    soup = _fetch_html_soup(url)
-    if soup is None:
+def fetch_image_names(url: str, cache: bool = True) -> List[str]:
+    hrefs = _fetch_hrefs(url, cache=cache)
+    if hrefs is None:
         logger.warning(
             "Failed to retrieve HTML content.", extra={"project": "fetch_image"}
         )
         return []
 
-    return [link.get("href") for link in soup.find_all("a") if link.get("href")]
+    return list(hrefs)
 
 
 def fetch_latest_png_images(directory_url: str, max_images: int = 6) -> List[str]:
-    soup = _fetch_html_soup(directory_url)
-    if soup is None:
+    png_links = _fetch_hrefs(directory_url, (_PNG_EXTENSION,))
+    if png_links is None:
         return []
 
-    png_links = [
-        link.get("href")
-        for link in soup.find_all("a")
-        if link.get("href", "").endswith(_PNG_EXTENSION)
-    ]
     return [directory_url + img for img in png_links[-max_images:]]
@@ -0,0 +1,120 @@
+import threading
+import httpx
+from typing import Dict, Optional
+
+from utils.factory import load_config
+
+_DEFAULTS = {
+    "CONNECT_TIMEOUT": 3,
+    "READ_TIMEOUT": 10,
+    "MAX_CONNECTIONS": 20,
+    "MAX_KEEPALIVE_CONNECTIONS": 10,
+    "KEEPALIVE_EXPIRY": 30,
+    "HTTP2": True,
+    "VERIFY": True,
+}
+
+
+class HttpPool:
+    """
+    One keep-alive httpx client per downstream origin (scheme, host, port).
+
+    Settings come from the HTTP section of config.yaml; entries under
+    HTTP.HOSTS override the defaults for a single host.
+    """
+
+    def __init__(self, config: Optional[dict] = None):
+        config = config or {}
+        self._hosts = config.get("HOSTS") or {}
+        self._defaults = {
+            **_DEFAULTS,
+            **{k: v for k, v in config.items() if k != "HOSTS"},
+        }
+        self._lock = threading.Lock()
+        self._clients: Dict[str, httpx.Client] = {}
+        self._async_clients: Dict[str, httpx.AsyncClient] = {}
+
+    def _settings(self, host: str) -> dict:
+        return {**self._defaults, **self._hosts.get(host, {})}
+
+    def _client_kwargs(self, host: str) -> dict:
+        settings = self._settings(host)
+        return {
+            "timeout": httpx.Timeout(
+                settings["READ_TIMEOUT"], connect=settings["CONNECT_TIMEOUT"]
+            ),
+            "limits": httpx.Limits(
+                max_connections=settings["MAX_CONNECTIONS"],
+                max_keepalive_connections=settings["MAX_KEEPALIVE_CONNECTIONS"],
+                keepalive_expiry=settings["KEEPALIVE_EXPIRY"],
+            ),
+            "http2": settings["HTTP2"],
+            "verify": settings["VERIFY"],
+        }
+
+    @staticmethod
+    def _origin(url: str):
+        parsed = httpx.URL(url)
+        return parsed.host, f"{parsed.scheme}://{parsed.host}:{parsed.port}"
+
+    def client(self, url: str) -> httpx.Client:
+        host, origin = self._origin(url)
+        with self._lock:
+            client = self._clients.get(origin)
+            if client is None:
+                client = httpx.Client(**self._client_kwargs(host))
+                self._clients[origin] = client
+            return client
+
+    def async_client(self, url: str) -> httpx.AsyncClient:
+        host, origin = self._origin(url)
+        with self._lock:
+            client = self._async_clients.get(origin)
+            if client is None:
+                client = httpx.AsyncClient(**self._client_kwargs(host))
+                self._async_clients[origin] = client
+            return client
+
+    async def aclose(self):
+        with self._lock:
+            clients = list(self._clients.values())
+            async_clients = list(self._async_clients.values())
+            self._clients.clear()
+            self._async_clients.clear()
+        for client in clients:
+            client.close()
+        for client in async_clients:
+            await client.aclose()
+
+
+_pool: Optional[HttpPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> HttpPool:
+    global _pool
+    # Also called from worker threads (fetch_url); one pool per process
+    with _pool_lock:
+        if _pool is None:
+            _pool = HttpPool(load_config().get("HTTP"))
+        return _pool
+
+
+async def startup():
+    """
+    Gives the app a fresh pool, closing one that get_pool() created before
+    the lifespan started so its clients are not leaked.
+    """
+    global _pool
+    with _pool_lock:
+        previous, _pool = _pool, HttpPool(load_config().get("HTTP"))
+    if previous is not None:
+        await previous.aclose()
+
+
+async def shutdown():
+    global _pool
+    with _pool_lock:
+        previous, _pool = _pool, None
+    if previous is not None:
+        await previous.aclose()
@@ -0,0 +1,420 @@
+import asyncio
+import functools
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse
+
+from utils.factory import load_config
+from utils.stores import create_store, open_sqlite, redis_from_uri
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+
+
+@dataclass
+class IdempotencyRecord:
+    """
+    A stored request; ``status`` is None while the first one is running.
+    """
+
+    fingerprint: str
+    status: Optional[int] = None
+    body: Any = None
+
+
+class MemoryIdempotencyStore:
+    """
+    Records in process memory, bounded to ``max_entries`` by evicting the
+    oldest completed or expired ones; requests still running are never
+    evicted. Only consistent within one worker.
+    """
+
+    blocking = False
+
+    def __init__(self, max_entries: int = 10_000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._records: "OrderedDict[str, Tuple[float, IdempotencyRecord]]" = (
+            OrderedDict()
+        )
+
+    def begin(
+        self, key: str, fingerprint: str, lease: float
+    ) -> Optional[IdempotencyRecord]:
+        """
+        Claims ``key`` for ``lease`` seconds and returns None, unless an
+        unexpired record exists, which is returned instead.
+        """
+        now = time.time()
+        with self._lock:
+            current = self._records.get(key)
+            if current is not None and current[0] > now:
+                return current[1]
+            self._records[key] = (now + lease, IdempotencyRecord(fingerprint))
+            self._records.move_to_end(key)
+            self._evict(now)
+        return None
+
+    def _evict(self, now: float):
+        excess = len(self._records) - self.max_entries
+        victims = []
+        for key, (expires, record) in self._records.items():
+            if len(victims) >= excess:
+                break
+            if record.status is not None or expires <= now:
+                victims.append(key)
+        for key in victims:
+            del self._records[key]
+
+    def complete(self, key: str, status: int, body: Any, ttl: float):
+        with self._lock:
+            current = self._records.get(key)
+            if current is not None:
+                record = IdempotencyRecord(current[1].fingerprint, status, body)
+                self._records[key] = (time.time() + ttl, record)
+                self._records.move_to_end(key)
+
+    def abandon(self, key: str):
+        with self._lock:
+            current = self._records.get(key)
+            if current is not None and current[1].status is None:
+                del self._records[key]
+
+    def reset(self):
+        with self._lock:
+            self._records.clear()
+
+    def close(self):
+        pass
+
+
+_REQUESTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS requests (
+    key TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    status INTEGER,
+    body TEXT,
+    expires REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+# Claims a new or expired key; returns nothing when it is taken
+_BEGIN = """
+INSERT INTO requests (key, fingerprint, status, body, expires)
+VALUES (:key, :fingerprint, NULL, NULL, :expires)
+ON CONFLICT (key) DO UPDATE SET
+    fingerprint = :fingerprint, status = NULL, body = NULL, expires = :expires
+WHERE expires <= :now
+RETURNING key
+"""
+
+# Completed records share one TTL, so the earliest expiry is the oldest
+_EVICT_COMPLETED = """
+DELETE FROM requests WHERE key IN (
+    SELECT key FROM requests WHERE status IS NOT NULL
+    ORDER BY expires DESC LIMIT -1 OFFSET :max_entries
+)
+"""
+
+
+class SQLiteIdempotencyStore:
+    """
+    Records in a SQLite file shared by every worker on the host, with at
+    most ``max_entries`` completed ones (oldest evicted first; running
+    requests are never evicted). Expired rows are purged every
+    ``purge_every`` claims.
+    """
+
+    blocking = True
+
+    def __init__(self, path: str, max_entries: int = 10_000, purge_every: int = 1000):
+        self.path = path
+        self.max_entries = max_entries
+        self.purge_every = purge_every
+        self._claims = 0
+        self._lock = threading.Lock()
+        self._conn = open_sqlite(path, _REQUESTS_SCHEMA)
+
+    def begin(
+        self, key: str, fingerprint: str, lease: float
+    ) -> Optional[IdempotencyRecord]:
+        now = time.time()
+        params = {"key": key, "fingerprint": fingerprint, "expires": now + lease}
+        with self._lock:
+            self._claims += 1
+            if self._claims >= self.purge_every:
+                self._claims = 0
+                self._conn.execute("DELETE FROM requests WHERE expires <= ?", (now,))
+            while True:
+                if self._conn.execute(_BEGIN, {**params, "now": now}).fetchone():
+                    return None
+                row = self._conn.execute(
+                    "SELECT fingerprint, status, body FROM requests WHERE key = ?",
+                    (key,),
+                ).fetchone()
+                if row is not None:
+                    body = json.loads(row[2]) if row[2] is not None else None
+                    return IdempotencyRecord(row[0], row[1], body)
+
+    def complete(self, key: str, status: int, body: Any, ttl: float):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE requests SET status = ?, body = ?, expires = ? WHERE key = ?",
+                (status, json.dumps(body), time.time() + ttl, key),
+            )
+            self._conn.execute(_EVICT_COMPLETED, {"max_entries": self.max_entries})
+
+    def abandon(self, key: str):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM requests WHERE key = ? AND status IS NULL", (key,)
+            )
+
+    def reset(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM requests")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class RedisIdempotencyStore:
+    """
+    Records in a Redis compatible server. Requires the optional ``redis``
+    package.
+    """
+
+    blocking = True
+
+    def __init__(self, url: str):
+        self._redis = redis_from_uri(url, "IDEMPOTENCY.STORAGE_URI")
+
+    def begin(
+        self, key: str, fingerprint: str, lease: float
+    ) -> Optional[IdempotencyRecord]:
+        name = f"idempotency:{key}"
+        value = json.dumps({"fingerprint": fingerprint})
+        while True:
+            if self._redis.set(name, value, nx=True, px=int(lease * 1000)):
+                return None
+            current = self._redis.get(name)
+            if current is not None:
+                return IdempotencyRecord(**json.loads(current))
+
+    def complete(self, key: str, status: int, body: Any, ttl: float):
+        name = f"idempotency:{key}"
+        current = self._redis.get(name)
+        if current is not None:
+            record = {**json.loads(current), "status": status, "body": body}
+            self._redis.set(name, json.dumps(record), px=int(ttl * 1000))
+
+    def abandon(self, key: str):
+        name = f"idempotency:{key}"
+        current = self._redis.get(name)
+        if current is not None and json.loads(current).get("status") is None:
+            self._redis.delete(name)
+
+    def reset(self):
+        for key in self._redis.scan_iter("idempotency:*"):
+            self._redis.delete(key)
+
+    def close(self):
+        self._redis.close()
+
+
+def create_idempotency_store(uri: str, max_entries: int = 10_000):
+    return create_store(
+        uri,
+        "idempotency",
+        memory=lambda: MemoryIdempotencyStore(max_entries),
+        sqlite=lambda path: SQLiteIdempotencyStore(path, max_entries),
+        redis=RedisIdempotencyStore,
+    )
+
+
+class IdempotencyCache:
+    """
+    Runs each (scope, Idempotency-Key) once and replays its response to
+    retries for ``ttl`` seconds.
+
+    A retry arriving while the first request is still running waits for its
+    result: on a shared future in the same worker, by polling the store
+    across workers. A first request that fails releases the key so the
+    retry runs instead; one that never finishes releases it once its
+    ``lease`` expires. Reusing a key with a different body is a 422.
+    """
+
+    def __init__(
+        self,
+        store=None,
+        ttl: float = 3600,
+        lease: float = 30,
+        poll_interval: float = 0.05,
+    ):
+        self.ttl = ttl
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.hits = 0
+        self.misses = 0
+        self.waited = 0
+        self._store = store
+        self._running: Dict[str, asyncio.Future] = {}
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = get_idempotency_store()
+        return self._store
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "waited": self.waited}
+
+    async def _call(self, method, *args):
+        if self.store.blocking:
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+    async def run(
+        self,
+        key: str,
+        fingerprint: str,
+        func: Callable[[], Awaitable[Tuple[int, Any]]],
+    ) -> Tuple[int, Any, bool]:
+        """
+        Returns (status, body, replayed) for ``key``, calling ``func`` only
+        if no earlier request with the key has completed or is running.
+        """
+        deadline = time.monotonic() + self.lease + 1
+        waited = False
+        while True:
+            record = await self._call(self.store.begin, key, fingerprint, self.lease)
+            if record is None:
+                self.misses += 1
+                return (*await self._execute(key, func), False)
+            if record.fingerprint != fingerprint:
+                raise HTTPException(
+                    status_code=422,
+                    detail=f"{HEADER} was already used with a different request",
+                )
+            if record.status is not None:
+                self.hits += 1
+                return record.status, record.body, True
+
+            if not waited:
+                waited = True
+                self.waited += 1
+            running = self._running.get(key)
+            if running is not None:
+                try:
+                    status, body = await asyncio.shield(running)
+                except asyncio.CancelledError:
+                    if not running.cancelled():
+                        raise
+                    # Whether the first request took effect is unknown
+                    raise HTTPException(
+                        status_code=409,
+                        detail=f"The request with this {HEADER} was cancelled, retry it",
+                    )
+                except Exception:
+                    continue
+                self.hits += 1
+                return status, body, True
+            if time.monotonic() > deadline:
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"A request with this {HEADER} is still in progress",
+                )
+            await asyncio.sleep(self.poll_interval)
+
+    async def _execute(self, key: str, func) -> Tuple[int, Any]:
+        future = self._running[key] = asyncio.get_running_loop().create_future()
+        try:
+            status, body = await func()
+            await self._call(self.store.complete, key, status, body, self.ttl)
+        except BaseException as e:
+            try:
+                await self._call(self.store.abandon, key)
+            finally:
+                # Settled even if abandon fails, so waiters never hang
+                del self._running[key]
+                if isinstance(e, asyncio.CancelledError):
+                    future.cancel()
+                else:
+                    future.set_exception(e)
+                    # Waiters retry on their own; retrieving it keeps asyncio quiet
+                    future.exception()
+            raise
+        del self._running[key]
+        future.set_result((status, body))
+        return status, body
+
+    def idempotent(self, status_code: int = 200):
+        """
+        Endpoint decorator honouring an optional Idempotency-Key header. The
+        key is scoped to the endpoint and the body is fingerprinted, so the
+        endpoint needs a ``request: Request`` parameter.
+        """
+
+        def decorator(func):
+            scope = f"{func.__module__}.{func.__qualname__}"
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                request = kwargs.get("request")
+                if request is None:
+                    request = next(a for a in args if isinstance(a, Request))
+                key = request.headers.get(HEADER)
+                if not key:
+                    return await func(*args, **kwargs)
+                if len(key) > MAX_KEY_LENGTH:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"{HEADER} must be at most {MAX_KEY_LENGTH} characters",
+                    )
+                fingerprint = hashlib.sha256(await request.body()).hexdigest()
+
+                async def call():
+                    return status_code, jsonable_encoder(await func(*args, **kwargs))
+
+                status, body, replayed = await self.run(
+                    f"{scope}:{key}", fingerprint, call
+                )
+                headers = {"Idempotent-Replayed": "true"} if replayed else None
+                return ORJSONResponse(body, status_code=status, headers=headers)
+
+            return wrapper
+
+        return decorator
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_idempotency_store():
+    """
+    Process-wide store selected by IDEMPOTENCY.STORAGE_URI.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            config = load_config().get("IDEMPOTENCY", {})
+            _store = create_idempotency_store(
+                config.get("STORAGE_URI", "memory://"),
+                max_entries=config.get("MAX_ENTRIES", 10_000),
+            )
+        return _store
+
+
+def idempotency_cache() -> IdempotencyCache:
+    config = load_config().get("IDEMPOTENCY", {})
+    return IdempotencyCache(ttl=config.get("TTL", 3600), lease=config.get("LEASE", 30))
@@ -0,0 +1,146 @@
+import asyncio
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import pytz
+
+from utils.factory import setup_logger
+from utils.fetch_url import fetch_folder_links, fetch_image_names
+
+logger = setup_logger(__name__)
+
+_TZ = pytz.timezone("Asia/Taipei")
+
+
+def dedupe_by_minute(img_names: List[str]) -> List[str]:
+    """
+    Keeps the last image of every minute, e.g.
+    "2024-10-23_10_01_21_63_900_D25.png" is keyed by "01".
+    """
+    return list({f.split("_")[2]: f for f in img_names}.values())
+
+
+class MachineImageIndex:
+    """
+    In-memory date -> hour folder -> image list for one machine's image server.
+
+    Only the current and previous hour folders are rescanned on a refresh;
+    the root listing is rescanned every ``full_scan_interval`` seconds.
+    Image lists hold one image per minute, which is what the menus show.
+
+    Scans bypass the shared listing_cache: a full scan touches every folder
+    of the machine and would otherwise evict the listings cached for user
+    requests.
+    """
+
+    def __init__(self, url: str, full_scan_interval: float = 1800):
+        self.url = url
+        self.full_scan_interval = full_scan_interval
+        self.version = 0
+        self.ready = False
+        self._lock = threading.Lock()
+        self._folders: Dict[str, List[str]] = {}
+        self._last_full_scan: Optional[float] = None
+
+    def dates(self) -> List[str]:
+        with self._lock:
+            return sorted({folder.split("_")[0] for folder in self._folders})
+
+    def hours(self, date: str) -> List[str]:
+        with self._lock:
+            return sorted(f for f in self._folders if f.startswith(date))
+
+    def images(self, hour: str) -> Optional[List[str]]:
+        with self._lock:
+            return self._folders.get(hour)
+
+    def refresh(self):
+        last = self._last_full_scan
+        if last is None or time.monotonic() - last >= self.full_scan_interval:
+            self._full_scan()
+        else:
+            now = datetime.now(_TZ)
+            for hour in (now - timedelta(hours=1), now):
+                self._scan_folder(hour.strftime("%Y%m%d_%H"))
+
+    def _full_scan(self):
+        links = fetch_folder_links(self.url, cache=False)[1:]
+        if not links:
+            return
+        folders = [link.split("/")[0] for link in links]
+        with self._lock:
+            removed = set(self._folders) - set(folders)
+            for folder in removed:
+                del self._folders[folder]
+            missing = [f for f in folders if f not in self._folders]
+            if removed:
+                self.version += 1
+        for folder in missing:
+            self._scan_folder(folder)
+        # The newest folders are still being written to
+        for folder in folders[-2:]:
+            self._scan_folder(folder)
+        self._last_full_scan = time.monotonic()
+        self.ready = True
+
+    def _scan_folder(self, folder: str):
+        img_names = fetch_image_names(
+            os.path.join(self.url, folder + "/"), cache=False
+        )[1:]
+        if not img_names:
+            return
+        images = dedupe_by_minute(img_names)
+        with self._lock:
+            if self._folders.get(folder) != images:
+                self._folders[folder] = images
+                self.version += 1
+
+
+class ImageIndexer:
+    """
+    Keeps a MachineImageIndex per entry of config.yaml MACHINES up to date
+    from a background task.
+    """
+
+    def __init__(
+        self,
+        machine_config: dict,
+        refresh_interval: float = 30,
+        full_scan_interval: float = 1800,
+    ):
+        self.refresh_interval = refresh_interval
+        self.indexes = {
+            key: MachineImageIndex(info["url"], full_scan_interval)
+            for key, info in machine_config.items()
+            if info.get("url")
+        }
+        self._task: Optional[asyncio.Task] = None
+
+    def get(self, key: str) -> Optional[MachineImageIndex]:
+        index = self.indexes.get(key)
+        return index if index is not None and index.ready else None
+
+    async def start(self):
+        if self.indexes:
+            self._task = asyncio.create_task(self._run(), name="image-indexer")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            for key, index in self.indexes.items():
+                try:
+                    await asyncio.to_thread(index.refresh)
+                except Exception as e:
+                    logger.error(
+                        f"Failed to refresh image index of {key}: {e}",
+                        extra={"project": "ty_scrap"},
+                    )
+            await asyncio.sleep(self.refresh_interval)
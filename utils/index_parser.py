@@ -0,0 +1,41 @@
+import html
+import re
+from typing import Iterable, Iterator, Optional, Tuple
+
+# <a ... href="..."> with double, single or unquoted attribute values
+_HREF_RE = re.compile(
+    rb"<a\s[^>]*?href\s*=\s*(?:\"([^\"]*)\"|'([^']*)'|([^\s>]+))", re.IGNORECASE
+)
+
+
+def iter_hrefs(
+    chunks: Iterable[bytes], suffixes: Optional[Tuple[str, ...]] = None
+) -> Iterator[str]:
+    """
+    Yields the href of every <a> tag in an HTML directory index, reading the
+    page chunk by chunk without building a DOM.
+
+    Only hrefs ending with one of ``suffixes`` are yielded when it is given.
+    Empty hrefs are skipped, matching the previous BeautifulSoup behaviour.
+    """
+    byte_suffixes = tuple(s.encode() for s in suffixes) if suffixes else None
+    buffer = b""
+    for chunk in chunks:
+        buffer += chunk
+        # Everything before the last "<" holds only complete tags
+        cut = buffer.rfind(b"<")
+        if cut <= 0:
+            continue
+        yield from _extract(buffer[:cut], byte_suffixes)
+        buffer = buffer[cut:]
+    if buffer:
+        yield from _extract(buffer, byte_suffixes)
+
+
+def _extract(data: bytes, suffixes: Optional[Tuple[bytes, ...]]) -> Iterator[str]:
+    for match in _HREF_RE.finditer(data):
+        href = match.group(1) or match.group(2) or match.group(3)
+        if not href or (suffixes and not href.endswith(suffixes)):
+            continue
+        text = href.decode("utf-8", errors="replace")
+        yield html.unescape(text) if "&" in text else text
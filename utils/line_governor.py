@@ -0,0 +1,272 @@
+import asyncio
+import threading
+import time
+import uuid
+from typing import Dict, Hashable, Optional
+
+from utils.factory import setup_logger, load_config
+from utils.metrics import LINE_GOVERNOR_STATE, observe_outbound
+
+logger = setup_logger(__name__)
+
+# 409 answers a retried push whose retry key LINE has already accepted
+_ALREADY_ACCEPTED = 409
+
+
+class _Retry(Exception):
+    def __init__(self, delay: float):
+        self.delay = delay
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    headers = getattr(error, "headers", None)
+    value = headers.get("Retry-After") if headers else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class LineGovernor:
+    """
+    Paces calls to the Messaging API for one channel access token.
+
+    Calls are spaced to the current send rate, which grows additively after
+    every success and is cut multiplicatively on a 429 (AIMD); a 429 also
+    pauses every caller for its ``Retry-After``. Pushes are retried with a
+    stable ``X-Line-Retry-Key`` so LINE delivers each one at most once;
+    callers retrying on their own pass the same key again. Replies
+    are never retried: their token is single-use and expires quickly.
+
+    The concurrency cap applies to sync and async callers separately; each
+    token in this service is only used from one side.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int = 8,
+        initial_rate: float = 20,
+        min_rate: float = 1,
+        max_rate: float = 100,
+        increase: float = 1,
+        decrease: float = 0.5,
+        max_retries: int = 3,
+        default_retry_after: float = 1,
+    ):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.max_retries = max_retries
+        self.default_retry_after = default_retry_after
+        self.in_flight = 0
+        self.throttled = 0
+        self.retried = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._next_at = 0.0
+        self._blocked_until = 0.0
+        self._sync_slots = threading.BoundedSemaphore(max_concurrency)
+        self._async_slots: Optional[asyncio.Semaphore] = None
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "throttled": self.throttled,
+                "retried": self.retried,
+                "dropped": self.dropped,
+                "rate": self.rate,
+                "blocked_for": max(0.0, self._blocked_until - time.monotonic()),
+            }
+
+    def _reserve(self) -> float:
+        """
+        Books the next send slot and returns how long to wait for it.
+        """
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_at, self._blocked_until)
+            self._next_at = start + 1 / self.rate
+            self.in_flight += 1
+            return start - now
+
+    def _release(self):
+        """
+        Settles a reservation whose call was cancelled or interrupted.
+        """
+        with self._lock:
+            self.in_flight -= 1
+
+    def _on_success(self):
+        with self._lock:
+            self.in_flight -= 1
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def _on_error(self, error: Exception, attempt: int, retryable: bool):
+        """
+        Settles a failed call; raises _Retry when it should be sent again.
+        """
+        status = getattr(error, "status", None)
+        with self._lock:
+            self.in_flight -= 1
+            # The retry key was accepted by this or an earlier delivery
+            if status == _ALREADY_ACCEPTED and retryable:
+                return
+            if status == 429:
+                self.throttled += 1
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                delay = _retry_after(error)
+                if delay is None:
+                    delay = self.default_retry_after * (2**attempt)
+                self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+            else:
+                delay = self.default_retry_after * (2**attempt)
+
+            transient = status == 429 or not status or status >= 500
+            if retryable and transient and attempt < self.max_retries:
+                self.retried += 1
+                raise _Retry(0 if status == 429 else delay)
+            self.dropped += 1
+        logger.warning(
+            f"LINE call dropped after {attempt + 1} attempts: {error}",
+            extra={"project": self.name},
+        )
+
+    async def acall(
+        self, func, *args, retryable: bool = False, target: str = "line", **kwargs
+    ):
+        """
+        Awaits ``func(*args, **kwargs)`` under the governor; ``target`` labels
+        its latency in the outbound metrics.
+        """
+        if self._async_slots is None:
+            self._async_slots = asyncio.Semaphore(self.max_concurrency)
+        attempt = 0
+        while True:
+            async with self._async_slots:
+                wait = self._reserve()
+                try:
+                    await asyncio.sleep(wait)
+                    with observe_outbound(target):
+                        result = await func(*args, **kwargs)
+                except Exception as e:
+                    try:
+                        self._on_error(e, attempt, retryable)
+                    except _Retry as retry:
+                        delay = retry.delay
+                    else:
+                        raise
+                except BaseException:
+                    # Cancelled (e.g. by a delivery timeout) or interrupted
+                    self._release()
+                    raise
+                else:
+                    self._on_success()
+                    return result
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def call(
+        self, func, *args, retryable: bool = False, target: str = "line", **kwargs
+    ):
+        """
+        Blocking counterpart of ``acall`` for the sync API client.
+        """
+        attempt = 0
+        while True:
+            with self._sync_slots:
+                wait = self._reserve()
+                try:
+                    time.sleep(wait)
+                    with observe_outbound(target):
+                        result = func(*args, **kwargs)
+                except Exception as e:
+                    try:
+                        self._on_error(e, attempt, retryable)
+                    except _Retry as retry:
+                        delay = retry.delay
+                    else:
+                        raise
+                except BaseException:
+                    # Cancelled (e.g. by a delivery timeout) or interrupted
+                    self._release()
+                    raise
+                else:
+                    self._on_success()
+                    return result
+            time.sleep(delay)
+            attempt += 1
+
+    async def apush(self, messaging_api, request, retry_key: Optional[str] = None):
+        """
+        Pushes with one retry key across attempts; a 409 for that key means
+        an earlier attempt was delivered. Pass a ``retry_key`` derived from
+        the caller's own job to cover redeliveries of it as well.
+        """
+        retry_key = retry_key or str(uuid.uuid4())
+        try:
+            return await self.acall(
+                messaging_api.push_message,
+                request,
+                x_line_retry_key=retry_key,
+                retryable=True,
+                target="line_push",
+            )
+        except Exception as e:
+            if getattr(e, "status", None) != _ALREADY_ACCEPTED:
+                raise
+
+    def push(self, messaging_api, request, retry_key: Optional[str] = None):
+        retry_key = retry_key or str(uuid.uuid4())
+        try:
+            return self.call(
+                messaging_api.push_message,
+                request,
+                x_line_retry_key=retry_key,
+                retryable=True,
+                target="line_push",
+            )
+        except Exception as e:
+            if getattr(e, "status", None) != _ALREADY_ACCEPTED:
+                raise
+
+
+_governors: Dict[Hashable, LineGovernor] = {}
+_governors_lock = threading.Lock()
+
+
+def get_governor(access_token: Hashable, name: str = "line") -> LineGovernor:
+    """
+    The governor shared by every client of one channel access token.
+    """
+    with _governors_lock:
+        governor = _governors.get(access_token)
+        if governor is None:
+            config = load_config().get("LINE_GOVERNOR", {})
+            governor = _governors[access_token] = LineGovernor(
+                name,
+                max_concurrency=config.get("MAX_CONCURRENCY", 8),
+                initial_rate=config.get("INITIAL_RATE", 20),
+                min_rate=config.get("MIN_RATE", 1),
+                max_rate=config.get("MAX_RATE", 100),
+                increase=config.get("INCREASE", 1),
+                decrease=config.get("DECREASE", 0.5),
+                max_retries=config.get("MAX_RETRIES", 3),
+                default_retry_after=config.get("DEFAULT_RETRY_AFTER", 1),
+            )
+            for field in ("in_flight", "throttled", "retried", "dropped", "rate"):
+                LINE_GOVERNOR_STATE.set_function(
+                    lambda field=field, governor=governor: governor.stats()[field],
+                    governor=name,
+                    field=field,
+                )
+        return governor
+
+
+def governor_for(messaging_api, name: str = "line") -> LineGovernor:
+    return get_governor(messaging_api.api_client.configuration.access_token, name)
@@ -0,0 +1,126 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Callable, Dict, Hashable, List, Optional
+
+
+@dataclass
+class ListingResponse:
+    """
+    Result of a (conditional) listing fetch. ``hrefs`` is None on 304.
+    """
+
+    hrefs: Optional[List[str]]
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+
+@dataclass
+class _Entry:
+    hrefs: List[str]
+    expires_at: float
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+
+Loader = Callable[[Dict[str, str]], ListingResponse]
+
+
+class ListingCache:
+    """
+    Bounded LRU cache for directory listings.
+
+    Fresh entries are served from memory for ``ttl`` seconds, stale ones are
+    revalidated with If-None-Match / If-Modified-Since, and concurrent misses
+    for the same key share a single fetch.
+    """
+
+    def __init__(self, ttl: float = 10, max_entries: int = 256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._inflight: Dict[Hashable, Future] = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidated": self.revalidated,
+            "coalesced": self.coalesced,
+            "size": len(self._entries),
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get(self, key: Hashable, loader: Loader) -> List[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.hrefs
+
+            self.misses += 1
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            hrefs = self._load(key, entry, loader)
+            future.set_result(hrefs)
+            return hrefs
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _load(self, key: Hashable, entry: Optional[_Entry], loader: Loader):
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+
+        response = loader(headers)
+
+        with self._lock:
+            if response.hrefs is None and entry is not None:
+                self.revalidated += 1
+                entry.expires_at = time.monotonic() + self.ttl
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                return entry.hrefs
+
+            hrefs = response.hrefs or []
+            self._entries[key] = _Entry(
+                hrefs=hrefs,
+                expires_at=time.monotonic() + self.ttl,
+                etag=response.etag,
+                last_modified=response.last_modified,
+            )
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return hrefs
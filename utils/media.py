@@ -0,0 +1,407 @@
+import asyncio
+import hashlib
+import hmac
+import io
+import os
+import re
+import tempfile
+import threading
+from typing import Awaitable, Callable, Dict, Optional
+from urllib.parse import urlencode
+
+from utils.factory import setup_logger, load_config
+from utils.http_pool import get_pool
+from utils.metrics import observe_outbound
+
+logger = setup_logger(__name__)
+
+# LINE shows previews at most 240 px wide and rejects files over 1 MB
+PREVIEW_MAX_SIZE = 240
+PREVIEW_MAX_BYTES = 1024 * 1024
+
+
+def _media_config() -> dict:
+    return load_config().get("MEDIA", {})
+
+
+def _signing_key() -> Optional[bytes]:
+    key = os.getenv("MEDIA_SIGNING_KEY")
+    return key.encode() if key else None
+
+
+def sign(url: str, key: Optional[bytes] = None) -> str:
+    key = key or _signing_key()
+    return hmac.new(key, url.encode(), hashlib.sha256).hexdigest()
+
+
+def verify(url: str, signature: str, key: Optional[bytes] = None) -> bool:
+    key = key or _signing_key()
+    if not key or not signature:
+        return False
+    return hmac.compare_digest(sign(url, key), signature)
+
+
+def preview_url(url: str) -> str:
+    """
+    Signed URL of the preview for ``url`` on this service. Falls back to the
+    original when MEDIA.PUBLIC_BASE_URL or MEDIA_SIGNING_KEY is not set.
+    """
+    base_url = _media_config().get("PUBLIC_BASE_URL")
+    if not base_url or not url or _signing_key() is None:
+        return url
+    query = urlencode({"src": url, "sig": sign(url)})
+    return f"{base_url.rstrip('/')}/media/preview?{query}"
+
+
+def render_preview(data: bytes, max_size: int = PREVIEW_MAX_SIZE, quality: int = 80):
+    """
+    Downscales an image to fit ``max_size`` and encodes it as JPEG, lowering
+    the quality until it fits LINE's preview size limit. Requires Pillow.
+    """
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        image.thumbnail((max_size, max_size))
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        while True:
+            buffer = io.BytesIO()
+            image.save(buffer, "JPEG", quality=quality, optimize=True)
+            if buffer.tell() <= PREVIEW_MAX_BYTES or quality <= 30:
+                return buffer.getvalue()
+            quality -= 15
+
+
+async def _fetch(url: str) -> bytes:
+    local_path = get_snapshot_store().local_path(url)
+    if local_path is not None:
+        return await asyncio.to_thread(_read_file, local_path)
+    with observe_outbound("media_source"):
+        response = await get_pool().async_client(url).get(url)
+        response.raise_for_status()
+    return response.content
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _url_hash(url: str) -> str:
+    return hashlib.sha256(url.encode()).hexdigest()
+
+
+class _DiskCache:
+    """
+    A directory of files shared by every worker: writes are atomic, and when
+    the directory grows past ``max_bytes`` the least recently used files are
+    removed until it is back under 90% of it. Hits refresh a file's mtime.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._lock = threading.Lock()
+        self._bytes = sum(size for _, size, _ in self._files())
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evicted": self.evicted,
+            "bytes": self._bytes,
+        }
+
+    def _files(self):
+        with os.scandir(self.directory) as entries:
+            return [
+                (e.stat().st_mtime, e.stat().st_size, e.path)
+                for e in entries
+                if e.is_file() and not e.name.endswith(".tmp")
+            ]
+
+    @staticmethod
+    def _touch(path: str) -> bool:
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    async def _once(self, key: str, create: Callable[[], Awaitable[str]]) -> str:
+        """
+        Runs ``create`` for ``key`` unless a call for it is already in flight,
+        in which case its result is shared.
+        """
+        future = self._inflight.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        self.misses += 1
+        future = self._inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await create()
+            future.set_result(result)
+        except Exception as e:
+            future.set_exception(e)
+            # Waiters see the error; retrieving it here keeps asyncio quiet
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+        return result
+
+    def _write(self, path: str, data: bytes):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        with self._lock:
+            self._bytes += len(data)
+            over = self._bytes > self.max_bytes
+        if over:
+            self._evict()
+
+    def _evict(self):
+        files = sorted(self._files())
+        total = sum(size for _, size, _ in files)
+        target = self.max_bytes * 0.9
+        for _, size, path in files:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            else:
+                self.evicted += 1
+            total -= size
+        with self._lock:
+            self._bytes = total
+
+
+class PreviewCache(_DiskCache):
+    """
+    Downscaled JPEG previews on disk, one file per source URL and preview
+    size, named by their hash. Concurrent misses for the same source share
+    one fetch.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int = 256 * 1024 * 1024,
+        max_size: int = PREVIEW_MAX_SIZE,
+        quality: int = 80,
+        fetch: Callable[[str], Awaitable[bytes]] = _fetch,
+        render: Callable[..., bytes] = render_preview,
+    ):
+        super().__init__(directory, max_bytes)
+        self.max_size = max_size
+        self.quality = quality
+        self._fetch = fetch
+        self._render = render
+
+    def path_for(self, url: str) -> str:
+        digest = _url_hash(f"{self.max_size}:{self.quality}:{url}")
+        return os.path.join(self.directory, f"{digest}.jpg")
+
+    async def get(self, url: str) -> str:
+        """
+        Path of the preview for ``url``, creating it on a miss.
+        """
+        path = self.path_for(url)
+        if self._touch(path):
+            self.hits += 1
+            return path
+
+        async def create():
+            data = await self._fetch(url)
+            preview = await asyncio.to_thread(
+                self._render, data, self.max_size, self.quality
+            )
+            await asyncio.to_thread(self._write, path, preview)
+            return path
+
+        return await self._once(path, create)
+
+
+# Leading bytes of the formats the camera hosts serve
+_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpg"),
+    (b"GIF8", "gif"),
+)
+_SNAPSHOT_NAME = re.compile(r"^[0-9a-f]{64}\.(png|jpg|gif)$")
+
+
+def _image_extension(data: bytes) -> Optional[str]:
+    for signature, extension in _SIGNATURES:
+        if data.startswith(signature):
+            return extension
+    return None
+
+
+class SnapshotStore(_DiskCache):
+    """
+    Copies of alert images, stored once under the SHA-256 of their content
+    and served from /media/snapshots/, so LINE and every chat member fetch
+    them from here instead of the camera hosts, and the image cannot change
+    after the alert was raised.
+
+    A small ``<sha256 of url>.url`` file maps each source URL to its
+    snapshot, so a URL is fetched once across workers and restarts.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        public_base_url: str = "",
+        max_bytes: int = 1024 * 1024 * 1024,
+        fetch: Callable[[str], Awaitable[bytes]] = _fetch,
+    ):
+        super().__init__(directory, max_bytes)
+        self.public_base_url = public_base_url.rstrip("/")
+        self.failed = 0
+        self._fetch = fetch
+        self._prefetches = set()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.public_base_url)
+
+    def stats(self) -> Dict[str, int]:
+        return {**super().stats(), "failed": self.failed}
+
+    def path_for(self, name: str) -> Optional[str]:
+        if not _SNAPSHOT_NAME.match(name):
+            return None
+        return os.path.join(self.directory, name)
+
+    def url_for(self, name: str) -> str:
+        return f"{self.public_base_url}/media/snapshots/{name}"
+
+    def local_path(self, url: str) -> Optional[str]:
+        """
+        Path of a snapshot given its public URL, if it is stored here.
+        """
+        prefix = self.url_for("")
+        if not self.enabled or not url.startswith(prefix):
+            return None
+        path = self.path_for(url[len(prefix) :])  # noqa E203
+        return path if path and os.path.exists(path) else None
+
+    def _lookup(self, alias: str) -> Optional[str]:
+        try:
+            with open(alias, encoding="ascii") as f:
+                name = f.read().strip()
+        except FileNotFoundError:
+            return None
+        if self._touch(alias) and self._touch(os.path.join(self.directory, name)):
+            return name
+        return None
+
+    async def snapshot(self, url: str) -> str:
+        """
+        Stores the image at ``url`` unless it already is; returns the
+        snapshot's file name.
+        """
+        alias = os.path.join(self.directory, f"{_url_hash(url)}.url")
+        name = await asyncio.to_thread(self._lookup, alias)
+        if name is not None:
+            self.hits += 1
+            return name
+
+        async def create():
+            data = await self._fetch(url)
+            extension = _image_extension(data)
+            if extension is None:
+                raise ValueError(f"{url} did not return a PNG, JPEG or GIF image")
+            name = f"{hashlib.sha256(data).hexdigest()}.{extension}"
+            await asyncio.to_thread(self._store, name, data, alias)
+            return name
+
+        return await self._once(url, create)
+
+    def _store(self, name: str, data: bytes, alias: str):
+        path = os.path.join(self.directory, name)
+        if not self._touch(path):
+            self._write(path, data)
+        self._write(alias, name.encode("ascii"))
+
+    def prefetch(self, url: Optional[str]):
+        """
+        Starts snapshotting ``url`` in the background, so it is captured as
+        close to the alert as possible without delaying the response.
+        """
+        if not url or not self.enabled:
+            return
+        task = asyncio.get_running_loop().create_task(self.resolve(url))
+        self._prefetches.add(task)
+        task.add_done_callback(self._prefetches.discard)
+
+    async def stop(self):
+        """
+        Cancels snapshots still running in the background.
+        """
+        tasks = list(self._prefetches)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def resolve(self, url: Optional[str]) -> Optional[str]:
+        """
+        The stable URL of the snapshot of ``url``, or ``url`` itself when
+        snapshots are disabled or the image cannot be fetched.
+        """
+        if not url or not self.enabled or self.local_path(url):
+            return url
+        try:
+            return self.url_for(await self.snapshot(url))
+        except Exception as e:
+            self.failed += 1
+            logger.warning(
+                f"Snapshot of {url} failed, using the original: {e}",
+                extra={"project": "media"},
+            )
+            return url
+
+
+_cache: Optional[PreviewCache] = None
+
+
+def get_preview_cache() -> PreviewCache:
+    global _cache
+    if _cache is None:
+        config = _media_config()
+        _cache = PreviewCache(
+            config.get("PREVIEW_DIR", "spool/previews"),
+            max_bytes=config.get("PREVIEW_CACHE_BYTES", 256 * 1024 * 1024),
+            max_size=config.get("PREVIEW_MAX_SIZE", PREVIEW_MAX_SIZE),
+            quality=config.get("PREVIEW_QUALITY", 80),
+        )
+    return _cache
+
+
+_snapshots: Optional[SnapshotStore] = None
+
+
+def get_snapshot_store() -> SnapshotStore:
+    global _snapshots
+    if _snapshots is None:
+        config = _media_config()
+        _snapshots = SnapshotStore(
+            config.get("SNAPSHOT_DIR", "spool/snapshots"),
+            public_base_url=config.get("PUBLIC_BASE_URL") or "",
+            max_bytes=config.get("SNAPSHOT_CACHE_BYTES", 1024 * 1024 * 1024),
+        )
+    return _snapshots
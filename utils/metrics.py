@@ -0,0 +1,281 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple, float] = {}
+        self._functions: Dict[Tuple, Callable[[], float]] = {}
+
+    def set_function(self, func: Callable[[], float], **labels):
+        """
+        Reads the value from ``func`` at scrape time, so state that already
+        lives elsewhere (queue depths, cache stats) costs nothing until then.
+        """
+        self._functions[self._key(labels)] = func
+
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(labels[name] for name in self.labelnames)
+
+    def samples(self, extra: str = "") -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        for key, func in list(self._functions.items()):
+            try:
+                values[key] = func()
+            except Exception:
+                continue
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key, extra)} "
+            f"{_format_value(value)}"
+            for key, value in values.items()
+        ]
+
+    def render(self, extra: str = "") -> List[str]:
+        return [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} {self.kind}",
+            *self.samples(extra),
+        ]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label key -> [per-bucket counts..., +Inf count, sum]
+        self._series: Dict[Tuple, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self, extra: str = "") -> List[str]:
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        lines = []
+        for key, values in series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), values):
+                cumulative += count
+                le = f'le="{_format_value(float(bound))}"'
+                if extra:
+                    le = f"{extra},{le}"
+                lines.append(
+                    f"{self.name}_bucket"
+                    f"{_format_labels(self.labelnames, key, le)} {cumulative}"
+                )
+            labels = _format_labels(self.labelnames, key, extra)
+            lines.append(f"{self.name}_sum{labels} {_format_value(values[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """
+    The metrics of this process. ``labels`` are added to every sample, e.g.
+    the worker that rendered them.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self.labels: Dict[str, str] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        extra = ",".join(f'{n}="{_escape(v)}"' for n, v in self.labels.items())
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render(extra))
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_SECONDS = REGISTRY.register(
+    Histogram(
+        "http_request_duration_seconds",
+        "Time spent handling HTTP requests.",
+        ("method", "route", "status"),
+    )
+)
+OUTBOUND_SECONDS = REGISTRY.register(
+    Histogram(
+        "outbound_request_duration_seconds",
+        "Time spent in calls to LINE, ntfy and the image servers.",
+        ("target", "outcome"),
+    )
+)
+RATE_LIMIT_REJECTIONS = REGISTRY.register(
+    Counter(
+        "rate_limit_rejections_total",
+        "Requests rejected by the rate limiter.",
+        ("route",),
+    )
+)
+LINE_GOVERNOR_STATE = REGISTRY.register(
+    Gauge(
+        "line_governor",
+        "LINE outbound governor state: in_flight, throttled, retried, dropped, rate.",
+        ("governor", "field"),
+    )
+)
+WEBHOOK_DUPLICATES = REGISTRY.register(
+    Counter(
+        "webhook_duplicate_events_total",
+        "Redelivered webhook events acknowledged without being handled again.",
+        ("bot",),
+    )
+)
+QUEUE_DEPTH = REGISTRY.register(
+    Gauge("queue_depth", "Items waiting in an internal queue.", ("queue",))
+)
+LINE_EVENT_OLDEST_AGE = REGISTRY.register(
+    Gauge(
+        "line_event_oldest_age_seconds",
+        "Age of the oldest webhook event waiting to be handled.",
+        ("bot",),
+    )
+)
+CACHE_REQUESTS = REGISTRY.register(
+    Counter("cache_requests_total", "Cache lookups by result.", ("cache", "result"))
+)
+CACHE_HIT_RATIO = REGISTRY.register(
+    Gauge("cache_hit_ratio", "Share of cache lookups served from cache.", ("cache",))
+)
+
+
+def register_cache(name: str, stats: Callable[[], Dict[str, int]]):
+    """
+    Exposes a cache whose stats() returns "hits" and "misses".
+    """
+    CACHE_REQUESTS.set_function(lambda: stats()["hits"], cache=name, result="hit")
+    CACHE_REQUESTS.set_function(lambda: stats()["misses"], cache=name, result="miss")
+
+    def ratio():
+        current = stats()
+        total = current["hits"] + current["misses"]
+        return current["hits"] / total if total else 0.0
+
+    CACHE_HIT_RATIO.set_function(ratio, cache=name)
+
+
+@contextmanager
+def observe_outbound(target: str):
+    """
+    Times one outbound call; the outcome label is "error" when it raises.
+    """
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        OUTBOUND_SECONDS.observe(
+            time.perf_counter() - start, target=target, outcome=outcome
+        )
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware timing every HTTP request by route template, so
+    path parameters do not explode the label set.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=status,
+            )
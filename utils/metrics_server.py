@@ -0,0 +1,68 @@
+import asyncio
+from typing import Optional
+
+from utils.factory import load_config, setup_logger
+from utils.metrics import REGISTRY
+
+logger = setup_logger(__name__)
+
+_HEADERS = (
+    "HTTP/1.1 200 OK\r\n"
+    "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+    "Content-Length: {length}\r\n"
+    "Connection: close\r\n\r\n"
+)
+
+_server: Optional[asyncio.AbstractServer] = None
+
+
+async def _serve(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        await reader.readuntil(b"\r\n\r\n")
+        body = REGISTRY.render().encode()
+        writer.write(_HEADERS.format(length=len(body)).encode() + body)
+        await writer.drain()
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def startup():
+    """
+    /metrics on the app port is answered by whichever worker accepted the
+    connection, so with several workers it shows one process at a time.
+    When METRICS.WORKER_PORT is set, every worker also serves its own
+    metrics on the first free port from there and labels them
+    ``worker="<port offset>"``, so each worker can be scraped as a target.
+    """
+    global _server
+    config = load_config().get("METRICS", {})
+    base = config.get("WORKER_PORT")
+    if not base:
+        return
+    host = config.get("WORKER_HOST", "0.0.0.0")
+    for offset in range(config.get("WORKER_PORTS", 16)):
+        try:
+            _server = await asyncio.start_server(_serve, host, base + offset)
+        except OSError:
+            continue
+        REGISTRY.labels["worker"] = str(offset)
+        logger.info(
+            f"Serving worker metrics on port {base + offset}",
+            extra={"project": "metrics"},
+        )
+        return
+    logger.warning(
+        f"No free worker metrics port from {base}, only /metrics is served",
+        extra={"project": "metrics"},
+    )
+
+
+async def shutdown():
+    global _server
+    if _server is not None:
+        _server.close()
+        await _server.wait_closed()
+        _server = None
+    REGISTRY.labels.pop("worker", None)
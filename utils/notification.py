@@ -1,64 +1,160 @@
+import asyncio
 import base64
-import requests
-from linebot.v3.messaging import PushMessageRequest, TextMessage, ImageMessage
-from typing import Optional
+import httpx
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
 
-from utils.factory import setup_logger
+from utils.factory import setup_logger, load_config
+from utils.http_pool import get_pool
+from utils.line_governor import governor_for
+from utils.media import preview_url
+from utils.metrics import observe_outbound
 
 logger = setup_logger(__name__)
 
+NTFY_BASE_URL = (
+    load_config()
+    .get("NTFY", {})
+    .get("BASE_URL", "https://thstplsu7001.nttp3.ths.com.tw")
+)
+
+# LINE accepts at most 5 messages per push and 5000 characters per text
+LINE_MAX_MESSAGES = 5
+LINE_MAX_TEXT_LENGTH = 5000
+
+
+@dataclass
+class Alert:
+    text: str
+    image_url: Optional[str] = None
+
+
+def _digest_text(alerts: Sequence[Alert]) -> str:
+    if len(alerts) == 1:
+        return alerts[0].text
+    return "\n".join(f"{i}. {alert.text}" for i, alert in enumerate(alerts, 1))
+
 
 class Notifier:
-    def __init__(self, project_name: str, messaging_api=None):
+    def __init__(self, project_name: str, messaging_api=None, governor=None):
+        """
+        messaging_api is an AsyncMessagingApi; every send_* method is a coroutine.
+        LINE calls go through the governor of its channel access token.
+        """
         self.project_name = project_name
         self.messaging_api = messaging_api
-        self.logger = setup_logger(__name__)
+        if governor is None and messaging_api is not None:
+            governor = governor_for(messaging_api)
+        self.governor = governor
 
     def _log_success(self, method: str):
-        self.logger.info(
+        logger.info(
             f"{method} sent successfully.", extra={"project": self.project_name}
         )
 
     def _log_failure(self, method: str, error: Exception):
-        self.logger.error(
+        logger.error(
             f"Failed to send notification via {method}: {str(error)}",
             extra={"project": self.project_name},
         )
 
-    def send_line(
+    async def send_line(
         self, group_id: str, text_message: str, image_url: Optional[str] = None
-    ):
+    ) -> bool:
+        return await self.send_line_batch(group_id, [Alert(text_message, image_url)])
+
+    async def send_line_batch(
+        self, group_id: str, alerts: Sequence[Alert], retry_key: Optional[str] = None
+    ) -> bool:
+        """
+        Pushes several alerts in one request: a single text listing all of
+        them, followed by their images. Sends repeated with the same
+        ``retry_key`` are delivered by LINE at most once.
+        """
+        from linebot.v3.messaging import ImageMessage, PushMessageRequest, TextMessage
+
         try:
-            messages = [TextMessage(text=text_message)]
-            if image_url:
-                messages.append(
-                    ImageMessage(
-                        original_content_url=image_url,
-                        preview_image_url=image_url,
+            messages = [TextMessage(text=_digest_text(alerts)[:LINE_MAX_TEXT_LENGTH])]
+            for alert in alerts:
+                if alert.image_url and len(messages) < LINE_MAX_MESSAGES:
+                    messages.append(
+                        ImageMessage(
+                            original_content_url=alert.image_url,
+                            preview_image_url=preview_url(alert.image_url),
+                        )
                     )
-                )
             request = PushMessageRequest(to=group_id, messages=messages)
-            self.messaging_api.push_message(request)
+            await self.governor.apush(self.messaging_api, request, retry_key)
             self._log_success("send_line")
+            return True
         except Exception as e:
             self._log_failure("send_line", e)
+            return False
 
-    def send_ntfy(
+    async def send_ntfy(
         self, ntfy_topic: str, text_message: str, image_url: Optional[str] = None
-    ):
-        ntfy_url = f"https://thstplsu7001.nttp3.ths.com.tw/{ntfy_topic}"
+    ) -> bool:
+        return await self.send_ntfy_digest(ntfy_topic, [Alert(text_message, image_url)])
+
+    async def send_ntfy_digest(self, ntfy_topic: str, alerts: Sequence[Alert]) -> bool:
+        """
+        Publishes one ntfy message for the given alerts. A digest of several
+        alerts lists them in the body and attaches the first image.
+        """
+        ntfy_url = f"{NTFY_BASE_URL}/{ntfy_topic}"
+        title = alerts[0].text
+        if len(alerts) > 1:
+            title = f"{title} (+{len(alerts) - 1})"
         headers = {
-            "Title": f"=?utf-8?b?{base64.b64encode(text_message.encode()).decode()}?=",
+            "Title": f"=?utf-8?b?{base64.b64encode(title.encode()).decode()}?=",
             "Tags": "warning",
         }
+        image_url = next((a.image_url for a in alerts if a.image_url), None)
         if image_url:
             headers["Attach"] = image_url
+        body = _digest_text(alerts).encode() if len(alerts) > 1 else None
 
         try:
-            response = requests.post(
-                ntfy_url, headers=headers, verify=False, timeout=10
-            )
-            response.raise_for_status()
+            with observe_outbound("ntfy"):
+                response = (
+                    await get_pool()
+                    .async_client(ntfy_url)
+                    .post(ntfy_url, headers=headers, content=body)
+                )
+                response.raise_for_status()
             self._log_success("send_ntfy")
-        except requests.exceptions.RequestException as e:
+            return True
+        except httpx.HTTPError as e:
             self._log_failure("send_ntfy", e)
+            return False
+
+    async def send(
+        self,
+        group_id: str,
+        ntfy_topic: str,
+        text_message: str,
+        image_url: Optional[str] = None,
+        channels: Sequence[str] = ("line", "ntfy"),
+    ) -> List[str]:
+        """
+        Sends to every requested channel concurrently, so the call takes
+        roughly as long as the slowest one. Returns the channels that failed.
+        """
+        return await self.send_batch(
+            group_id, ntfy_topic, [Alert(text_message, image_url)], channels
+        )
+
+    async def send_batch(
+        self,
+        group_id: str,
+        ntfy_topic: str,
+        alerts: Sequence[Alert],
+        channels: Sequence[str] = ("line", "ntfy"),
+        retry_key: Optional[str] = None,
+    ) -> List[str]:
+        senders = {
+            "line": lambda: self.send_line_batch(group_id, alerts, retry_key),
+            "ntfy": lambda: self.send_ntfy_digest(ntfy_topic, alerts),
+        }
+        results = await asyncio.gather(*(senders[channel]() for channel in channels))
+        return [channel for channel, ok in zip(channels, results) if not ok]
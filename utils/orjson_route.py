@@ -0,0 +1,32 @@
+from typing import Any, Callable
+
+import orjson
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+
+
+class ORJSONRequest(Request):
+    """
+    Request whose ``json()`` decodes with orjson. Its JSONDecodeError
+    subclasses the stdlib one, so malformed bodies still produce a 422.
+    """
+
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            self._json = orjson.loads(await self.body())
+        return self._json
+
+
+class ORJSONRoute(APIRoute):
+    """
+    Route class decoding request bodies with orjson; pair it with
+    ``ORJSONResponse`` so JSON is parsed and rendered by orjson both ways.
+    """
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def route_handler(request: Request) -> Response:
+            return await handler(ORJSONRequest(request.scope, request.receive))
+
+        return route_handler
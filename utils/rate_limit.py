@@ -0,0 +1,308 @@
+import asyncio
+import functools
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Request
+
+from utils.factory import load_config
+from utils.metrics import RATE_LIMIT_REJECTIONS
+from utils.stores import create_store, open_sqlite, redis_from_uri
+
+_RATE = re.compile(r"^\s*(\d+)\s*/\s*(\d*)\s*(second|minute|hour|day)s?\s*$")
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+def parse_rate(rate: str) -> Tuple[int, float]:
+    """
+    Parses slowapi style rates such as "5/minute" or "10/3minute" into
+    (capacity, period in seconds).
+    """
+    match = _RATE.match(rate)
+    if match is None:
+        raise ValueError(f"Invalid rate limit: {rate!r}")
+    count, multiplier, unit = match.groups()
+    return int(count), int(multiplier or 1) * _PERIODS[unit]
+
+
+def get_remote_address(request: Request) -> str:
+    return request.client.host if request.client else "127.0.0.1"
+
+
+class RateLimitExceeded(HTTPException):
+    def __init__(self, retry_after: float):
+        seconds = max(1, int(retry_after + 0.999))
+        super().__init__(
+            status_code=429,
+            detail="Too many requests. Please try again later.",
+            headers={"Retry-After": str(seconds)},
+        )
+        self.retry_after = retry_after
+
+
+class MemoryBucketStorage:
+    """
+    Token buckets in process memory. Only consistent within one worker, so
+    it is meant for tests and single-process runs.
+    """
+
+    blocking = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+
+    def acquire(
+        self, key: str, capacity: int, rate: float, cost: float = 1
+    ) -> Tuple[bool, float]:
+        """
+        Takes ``cost`` tokens from the bucket refilled at ``rate`` tokens per
+        second. Returns (allowed, seconds until enough tokens are back).
+        """
+        now = time.time()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+        return allowed, 0.0 if allowed else (cost - tokens) / rate
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+
+    def close(self):
+        pass
+
+
+_BUCKET_SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL,
+    granted INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+# One statement, so the read-refill-take step is atomic across processes
+_TAKE_TOKENS = """
+INSERT INTO buckets (key, tokens, updated, granted)
+VALUES (:key, :capacity - :cost, :now, 1)
+ON CONFLICT (key) DO UPDATE SET
+    granted = min(:capacity, tokens + (:now - updated) * :rate) >= :cost,
+    tokens = min(:capacity, tokens + (:now - updated) * :rate) - CASE
+        WHEN min(:capacity, tokens + (:now - updated) * :rate) >= :cost
+        THEN :cost ELSE 0 END,
+    updated = :now
+RETURNING tokens, granted
+"""
+
+
+class SQLiteBucketStorage:
+    """
+    Token buckets in a SQLite file shared by every worker on the host.
+    """
+
+    blocking = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = open_sqlite(path, _BUCKET_SCHEMA)
+
+    def acquire(
+        self, key: str, capacity: int, rate: float, cost: float = 1
+    ) -> Tuple[bool, float]:
+        params = {
+            "key": key,
+            "capacity": capacity,
+            "rate": rate,
+            "cost": cost,
+            "now": time.time(),
+        }
+        with self._lock:
+            tokens, granted = self._conn.execute(_TAKE_TOKENS, params).fetchone()
+        return bool(granted), 0.0 if granted else (cost - tokens) / rate
+
+    def reset(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM buckets")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_REDIS_TAKE_TOKENS = """
+local capacity, rate, cost, now = tonumber(ARGV[1]), tonumber(ARGV[2]),
+    tonumber(ARGV[3]), tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + (now - updated) * rate)
+local granted = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    granted = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {granted, tostring(tokens)}
+"""
+
+
+class RedisBucketStorage:
+    """
+    Token buckets in a Redis compatible server, evaluated by a Lua script.
+    Requires the optional ``redis`` package.
+    """
+
+    blocking = True
+
+    def __init__(self, url: str):
+        self._redis = redis_from_uri(url, "RATE_LIMIT.STORAGE_URI")
+        self._take_tokens = self._redis.register_script(_REDIS_TAKE_TOKENS)
+
+    def acquire(
+        self, key: str, capacity: int, rate: float, cost: float = 1
+    ) -> Tuple[bool, float]:
+        granted, tokens = self._take_tokens(
+            keys=[f"ratelimit:{key}"], args=[capacity, rate, cost, time.time()]
+        )
+        tokens = float(tokens)
+        return bool(granted), 0.0 if granted else (cost - tokens) / rate
+
+    def reset(self):
+        for key in self._redis.scan_iter("ratelimit:*"):
+            self._redis.delete(key)
+
+    def close(self):
+        self._redis.close()
+
+
+def create_storage(uri: str):
+    return create_store(
+        uri,
+        "rate limit",
+        memory=MemoryBucketStorage,
+        sqlite=SQLiteBucketStorage,
+        redis=RedisBucketStorage,
+    )
+
+
+class Limiter:
+    """
+    Per-route token bucket limits with a drop-in ``limit`` decorator.
+
+    Each decorated route gets its own bucket per client key, holding
+    ``count`` tokens that refill evenly over the period, so "10/3minute"
+    allows a burst of 10 and then one request every 18 seconds. Without an
+    explicit storage the shared one from ``get_storage()`` is used, so limits
+    hold across worker processes.
+    """
+
+    def __init__(
+        self, key_func: Callable[[Request], str] = get_remote_address, storage=None
+    ):
+        self.key_func = key_func
+        self._storage = storage
+        self.enabled = load_config().get("RATE_LIMIT", {}).get("ENABLED", True)
+        self.rejected = 0
+
+    @property
+    def storage(self):
+        if self._storage is None:
+            self._storage = get_storage()
+        return self._storage
+
+    @staticmethod
+    def scope_of(func) -> str:
+        """
+        The bucket scope ``limit`` uses for ``func``.
+        """
+        return f"{func.__module__}.{func.__qualname__}"
+
+    async def consume(
+        self, request: Request, scopes: Sequence[Tuple[str, str, str]]
+    ) -> List[bool]:
+        """
+        Takes one token per (scope, rate, route) entry from the caller's
+        buckets, in one round trip to the storage, so a bulk request is
+        charged like the single requests it replaces; rejections are counted
+        under ``route``, the path of the single route. Returns whether each
+        entry was allowed.
+        """
+        if not self.enabled:
+            return [True] * len(scopes)
+        client = self.key_func(request)
+        requests = []
+        for scope, rate, _ in scopes:
+            capacity, period = parse_rate(rate)
+            requests.append((f"{scope}:{client}", capacity, capacity / period))
+
+        def acquire_all():
+            return [self.storage.acquire(*r)[0] for r in requests]
+
+        if self.storage.blocking:
+            allowed = await asyncio.to_thread(acquire_all)
+        else:
+            allowed = acquire_all()
+        for (_, _, route), ok in zip(scopes, allowed):
+            if not ok:
+                self.rejected += 1
+                RATE_LIMIT_REJECTIONS.inc(route=route)
+        return allowed
+
+    def limit(self, rate: str, on_reject: Optional[Callable[[], object]] = None):
+        capacity, period = parse_rate(rate)
+        refill = capacity / period
+
+        def decorator(func):
+            if not self.enabled:
+                return func
+            scope = self.scope_of(func)
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                request = kwargs.get("request")
+                if request is None:
+                    request = next(a for a in args if isinstance(a, Request))
+                key = f"{scope}:{self.key_func(request)}"
+                if self.storage.blocking:
+                    allowed, retry_after = await asyncio.to_thread(
+                        self.storage.acquire, key, capacity, refill
+                    )
+                else:
+                    allowed, retry_after = self.storage.acquire(key, capacity, refill)
+                if not allowed:
+                    self.rejected += 1
+                    route = getattr(request.scope.get("route"), "path", scope)
+                    RATE_LIMIT_REJECTIONS.inc(route=route)
+                    if on_reject is not None:
+                        on_reject()
+                    raise RateLimitExceeded(retry_after)
+                return await func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage():
+    """
+    Process-wide bucket storage selected by RATE_LIMIT.STORAGE_URI.
+    """
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            uri = load_config().get("RATE_LIMIT", {}).get("STORAGE_URI", "memory://")
+            _storage = create_storage(uri)
+        return _storage
@@ -0,0 +1,475 @@
+import asyncio
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+
+from utils.factory import setup_logger
+from utils.stores import open_sqlite
+
+logger = setup_logger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS notifications (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    project TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    channels TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    lease_until REAL NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    dead INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    batch_key TEXT,
+    priority INTEGER NOT NULL DEFAULT 0,
+    dead_at REAL,
+    retry_key TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_notifications_ready
+    ON notifications (dead, next_attempt_at);
+"""
+
+# Columns added after the first release of the spool
+_MIGRATIONS = {
+    "batch_key": "ALTER TABLE notifications ADD COLUMN batch_key TEXT",
+    "priority": (
+        "ALTER TABLE notifications ADD COLUMN priority INTEGER NOT NULL DEFAULT 0"
+    ),
+    "dead_at": "ALTER TABLE notifications ADD COLUMN dead_at REAL",
+    "retry_key": "ALTER TABLE notifications ADD COLUMN retry_key TEXT",
+}
+
+# Dead jobs past the retention, then all but the newest max_dead of them;
+# rows buried before dead_at existed fall back to their creation time
+_PURGE_DEAD = """
+DELETE FROM notifications WHERE dead = 1 AND (
+    COALESCE(dead_at, created_at) <= :cutoff OR id IN (
+        SELECT id FROM notifications WHERE dead = 1
+        ORDER BY COALESCE(dead_at, created_at) DESC, id DESC
+        LIMIT -1 OFFSET :max_dead
+    )
+)
+"""
+
+_COLUMNS = "id, project, payload, channels, attempts, created_at, retry_key"
+
+
+@dataclass
+class SpoolJob:
+    id: int
+    project: str
+    payload: dict
+    channels: List[str]
+    attempts: int
+    created_at: float
+    retry_key: Optional[str] = None
+
+
+def _job(row) -> SpoolJob:
+    return SpoolJob(
+        id=row[0],
+        project=row[1],
+        payload=json.loads(row[2]),
+        channels=json.loads(row[3]),
+        attempts=row[4],
+        created_at=row[5],
+        retry_key=row[6],
+    )
+
+
+class NotificationSpool:
+    """
+    Durable outbound queue backed by SQLite in WAL mode.
+
+    Jobs are claimed with a lease instead of being deleted, so a job whose
+    worker died (or whose container restarted) becomes claimable again once
+    the lease expires. Several processes may share the same file.
+
+    Jobs enqueued with a ``batch_key`` and a delay wait for the coalescing
+    window and are then claimed together with the other pending jobs of the
+    same key, at most ``max_batch`` at a time. Among due jobs, higher
+    ``priority`` is claimed first. The jobs of a batch share a ``retry_key``
+    set on their first claim, and a failed batch is retried as exactly the
+    same set under the same key, so the receiver can drop a repeat of a
+    push it already accepted.
+
+    Jobs that exhaust their attempts are kept as dead rows for inspection,
+    for at most ``dead_retention`` seconds and ``max_dead`` rows.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        lease_seconds: float = 60,
+        max_batch: int = 4,
+        dead_retention: float = 7 * 86400,
+        max_dead: int = 10_000,
+    ):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_batch = max_batch
+        self.dead_retention = dead_retention
+        self.max_dead = max_dead
+        self._lock = threading.Lock()
+        self._conn = open_sqlite(path, _SCHEMA)
+        columns = {
+            row[1] for row in self._conn.execute("PRAGMA table_info(notifications)")
+        }
+        for column, statement in _MIGRATIONS.items():
+            if column not in columns:
+                self._conn.execute(statement)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_notifications_retry_key "
+            "ON notifications (retry_key)"
+        )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def enqueue(
+        self,
+        project: str,
+        payload: dict,
+        channels: List[str],
+        delay: float = 0,
+        batch_key: Optional[str] = None,
+        priority: int = 0,
+    ) -> int:
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO notifications "
+                "(project, payload, channels, next_attempt_at, created_at, batch_key, "
+                "priority) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    project,
+                    json.dumps(payload, ensure_ascii=False),
+                    json.dumps(channels),
+                    now + delay,
+                    now,
+                    batch_key,
+                    priority,
+                ),
+            )
+            if delay and batch_key is not None:
+                self._release_full_batch(batch_key, now)
+            return cursor.lastrowid
+
+    def enqueue_many(self, entries: Sequence[dict]) -> List[int]:
+        """
+        Inserts several jobs in one transaction. Each entry holds the
+        arguments of ``enqueue``: project, payload, channels and optionally
+        delay, batch_key and priority.
+        """
+        now = time.time()
+        rows = [
+            (
+                e["project"],
+                json.dumps(e["payload"], ensure_ascii=False),
+                json.dumps(e["channels"]),
+                now + e.get("delay", 0),
+                now,
+                e.get("batch_key"),
+                e.get("priority", 0),
+            )
+            for e in entries
+        ]
+        batch_keys = {
+            e["batch_key"] for e in entries if e.get("delay") and e.get("batch_key")
+        }
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                ids = [
+                    self._conn.execute(
+                        "INSERT INTO notifications "
+                        "(project, payload, channels, next_attempt_at, created_at, "
+                        "batch_key, priority) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        row,
+                    ).lastrowid
+                    for row in rows
+                ]
+                for batch_key in batch_keys:
+                    self._release_full_batch(batch_key, now)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return ids
+
+    def _release_full_batch(self, batch_key: str, now: float):
+        # A full batch is sent at once instead of waiting out the window
+        waiting = (
+            "batch_key = ? AND dead = 0 AND attempts = 0 "
+            "AND lease_until <= ? AND next_attempt_at > ?"
+        )
+        count = self._conn.execute(
+            f"SELECT COUNT(*) FROM notifications WHERE {waiting}",
+            (batch_key, now, now),
+        ).fetchone()[0]
+        if count >= self.max_batch:
+            self._conn.execute(
+                f"UPDATE notifications SET next_attempt_at = ? WHERE {waiting}",
+                (now, batch_key, now, now),
+            )
+
+    def claim(self, exclude: Sequence[str] = ()) -> List[SpoolJob]:
+        """
+        Leases the next due job together with the rest of its batch, skipping
+        the projects in ``exclude``; returns an empty list when nothing is due.
+        """
+        now = time.time()
+        lease_until = now + self.lease_seconds
+        retry_key = str(uuid.uuid4())
+        skip = (
+            f"AND project NOT IN ({', '.join('?' * len(exclude))}) " if exclude else ""
+        )
+        with self._lock:
+            row = self._conn.execute(
+                "UPDATE notifications SET lease_until = ?, "
+                "retry_key = COALESCE(retry_key, ?) "
+                "WHERE id = ("
+                "  SELECT id FROM notifications "
+                f"  WHERE dead = 0 AND next_attempt_at <= ? AND lease_until <= ? {skip}"
+                "  ORDER BY priority DESC, next_attempt_at, id LIMIT 1"
+                f") RETURNING {_COLUMNS}, batch_key",
+                (lease_until, retry_key, now, now, *exclude),
+            ).fetchone()
+            if row is None:
+                return []
+            jobs = [_job(row)]
+            batch_key = row[7]
+            if row[6] != retry_key:
+                # A retry goes out with exactly the jobs of its first attempt
+                rows = self._conn.execute(
+                    "UPDATE notifications SET lease_until = ? "
+                    "WHERE retry_key = ? AND id != ? AND dead = 0 AND lease_until <= ? "
+                    f"RETURNING {_COLUMNS}",
+                    (lease_until, row[6], row[0], now),
+                ).fetchall()
+                jobs.extend(_job(r) for r in rows)
+            elif batch_key is not None and self.max_batch > 1:
+                rows = self._conn.execute(
+                    "UPDATE notifications SET lease_until = ?, retry_key = ? "
+                    "WHERE id IN ("
+                    "  SELECT id FROM notifications "
+                    "  WHERE batch_key = ? AND channels = ? AND dead = 0 "
+                    "  AND retry_key IS NULL AND lease_until <= ? "
+                    "  AND (attempts = 0 OR next_attempt_at <= ?) "
+                    "  ORDER BY id LIMIT ?"
+                    f") RETURNING {_COLUMNS}",
+                    (
+                        lease_until,
+                        retry_key,
+                        batch_key,
+                        row[3],
+                        now,
+                        now,
+                        self.max_batch - 1,
+                    ),
+                ).fetchall()
+                jobs.extend(_job(r) for r in rows)
+        return sorted(jobs, key=lambda job: job.id)
+
+    def complete(self, job_id: int):
+        with self._lock:
+            self._conn.execute("DELETE FROM notifications WHERE id = ?", (job_id,))
+
+    def retry(self, job_id: int, channels: List[str], delay: float, error: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE notifications SET channels = ?, attempts = attempts + 1, "
+                "next_attempt_at = ?, lease_until = 0, last_error = ? WHERE id = ?",
+                (json.dumps(channels), time.time() + delay, error, job_id),
+            )
+
+    def bury(self, job_id: int, channels: List[str], error: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE notifications SET channels = ?, attempts = attempts + 1, "
+                "dead = 1, dead_at = ?, lease_until = 0, last_error = ? WHERE id = ?",
+                (json.dumps(channels), now, error, job_id),
+            )
+            self._purge_dead(now)
+
+    def purge_dead(self):
+        with self._lock:
+            self._purge_dead(time.time())
+
+    def _purge_dead(self, now: float):
+        self._conn.execute(
+            _PURGE_DEAD,
+            {"cutoff": now - self.dead_retention, "max_dead": self.max_dead},
+        )
+
+    def depth(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM notifications WHERE dead = 0"
+            ).fetchone()[0]
+
+    def dead_depth(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM notifications WHERE dead = 1"
+            ).fetchone()[0]
+
+
+@dataclass(frozen=True)
+class DeliveryPolicy:
+    """
+    Per-project limits of a SpoolWorkerPool. ``max_concurrency`` caps the
+    batches of the project in flight in this process; ``timeout`` bounds one
+    delivery attempt and should stay below the spool lease.
+    """
+
+    max_concurrency: Optional[int] = None
+    timeout: Optional[float] = None
+
+
+class SpoolWorkerPool:
+    """
+    Drains a NotificationSpool with a fixed number of asyncio workers.
+
+    ``deliver`` receives the SpoolJobs of one batch and returns the channels
+    that still failed; those are retried with exponential backoff until
+    ``max_attempts``. Projects listed in ``policies`` get their own
+    concurrency cap and delivery timeout.
+    """
+
+    def __init__(
+        self,
+        spool: NotificationSpool,
+        deliver: Callable[[List[SpoolJob]], Awaitable[List[str]]],
+        workers: int = 4,
+        max_attempts: int = 8,
+        backoff_base: float = 2,
+        backoff_max: float = 300,
+        poll_interval: float = 1,
+        policies: Optional[Dict[str, DeliveryPolicy]] = None,
+    ):
+        self.spool = spool
+        self.deliver = deliver
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.poll_interval = poll_interval
+        self.policies = policies or {}
+        self._active: Counter = Counter()
+        self._claim_lock: Optional[asyncio.Lock] = None
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def backoff(self, attempts: int) -> float:
+        delay = min(self.backoff_max, self.backoff_base * (2**attempts))
+        return delay * random.uniform(0.5, 1)
+
+    def wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        self._claim_lock = asyncio.Lock()
+        self._tasks = [
+            asyncio.create_task(self._run(), name=f"spool-worker-{i}")
+            for i in range(self.workers)
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _saturated(self) -> List[str]:
+        saturated = []
+        for project, policy in self.policies.items():
+            limit = policy.max_concurrency
+            if limit and self._active[project] >= limit:
+                saturated.append(project)
+        return saturated
+
+    async def _claim(self) -> List[SpoolJob]:
+        # Claims are serialized so the in-flight counts they check hold
+        async with self._claim_lock:
+            jobs = await asyncio.to_thread(self.spool.claim, self._saturated())
+            if jobs:
+                self._active[jobs[0].project] += 1
+            return jobs
+
+    async def _run(self):
+        while True:
+            try:
+                jobs = await self._claim()
+            except Exception as e:
+                # e.g. "database is locked"; the worker must outlive it
+                logger.error(
+                    f"Failed to claim notifications: {str(e)}",
+                    exc_info=True,
+                    extra={"project": "spool"},
+                )
+                await asyncio.sleep(self.poll_interval)
+                continue
+            if not jobs:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            project = jobs[0].project
+            try:
+                await self._process(jobs)
+            finally:
+                self._active[project] -= 1
+                if project in self.policies:
+                    self.wake()
+
+    async def _process(self, jobs: List[SpoolJob]):
+        policy = self.policies.get(jobs[0].project, DeliveryPolicy())
+        try:
+            failed = await asyncio.wait_for(self.deliver(jobs), policy.timeout)
+            error = f"delivery failed via {', '.join(failed)}" if failed else ""
+        except asyncio.TimeoutError:
+            failed = jobs[0].channels
+            error = f"delivery timed out after {policy.timeout}s"
+        except Exception as e:
+            failed, error = jobs[0].channels, str(e)
+
+        for job in jobs:
+            try:
+                await self._settle(job, failed, error)
+            except Exception as e:
+                # The job stays leased and is claimed again once that expires
+                logger.error(
+                    f"Failed to settle notification {job.id}: {str(e)}",
+                    exc_info=True,
+                    extra={"project": job.project},
+                )
+
+    async def _settle(self, job: SpoolJob, failed: List[str], error: str):
+        if not failed:
+            await asyncio.to_thread(self.spool.complete, job.id)
+        elif job.attempts + 1 >= self.max_attempts:
+            logger.error(
+                f"Giving up on notification {job.id} after {job.attempts + 1} "
+                f"attempts: {error}",
+                extra={"project": job.project},
+            )
+            await asyncio.to_thread(self.spool.bury, job.id, failed, error)
+        else:
+            delay = self.backoff(job.attempts)
+            logger.warning(
+                f"Notification {job.id} will be retried in {delay:.1f}s: {error}",
+                extra={"project": job.project},
+            )
+            await asyncio.to_thread(self.spool.retry, job.id, failed, delay, error)
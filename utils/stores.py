@@ -0,0 +1,59 @@
+import os
+import sqlite3
+from typing import Callable
+
+SQLITE_PREFIX = "sqlite:///"
+REDIS_SCHEMES = ("redis://", "rediss://", "unix://")
+
+
+def open_sqlite(path: str, schema: str) -> sqlite3.Connection:
+    """
+    Opens (creating its directory) a SQLite file in WAL mode, in autocommit
+    and usable from any thread, and applies ``schema``. Callers serialize
+    access with their own lock.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(
+        path, timeout=30, isolation_level=None, check_same_thread=False
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(schema)
+    return conn
+
+
+def redis_from_uri(uri: str, setting: str):
+    """
+    Client for ``uri``; ``setting`` names the config key in the error raised
+    when the optional ``redis`` package is missing.
+    """
+    try:
+        import redis
+    except ImportError as e:
+        raise RuntimeError(
+            f"{setting} points to Redis but the redis package is not installed"
+        ) from e
+    return redis.Redis.from_url(uri)
+
+
+def create_store(
+    uri: str,
+    kind: str,
+    memory: Callable[[], object],
+    sqlite: Callable[[str], object],
+    redis: Callable[[str], object],
+):
+    """
+    Builds the backend ``uri`` selects: ``memory://``,
+    ``sqlite:///relative/path.db`` (four slashes for an absolute path) or
+    ``redis://host:port/db``. ``sqlite`` gets the file path, ``redis`` the URI.
+    """
+    if uri.startswith("memory://"):
+        return memory()
+    if uri.startswith(SQLITE_PREFIX):
+        return sqlite(uri.removeprefix(SQLITE_PREFIX))
+    if uri.startswith(REDIS_SCHEMES):
+        return redis(uri)
+    raise ValueError(f"Unsupported {kind} storage: {uri!r}")